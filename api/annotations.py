@@ -1,11 +1,66 @@
+import math
 from flask import Blueprint, request, jsonify
 from models.project import Project
 from models.image import Image
+from models.session import register_unit_of_work
+from models.history import annotation_history
+from models.sqlite_store import get_store
 from services.file_manager import FileManager
+from services.spatial_index import spatial_indexes
+from services.search_index import AnnotationSearchIndex, SEARCH_FIELDS, search_store
+from services.pagination import encode_cursor, decode_cursor, parse_limit
 
 annotations_bp = Blueprint('annotations', __name__)
+register_unit_of_work(annotations_bp)
 file_manager = FileManager()
 
+@annotations_bp.route('/<project_id>/search', methods=['GET'])
+def search_annotations(project_id):
+    """Search annotations across a project.
+
+    Filters: ``label``, ``level``, ``type`` and ``reason`` (repeat a
+    parameter to match any of several values), ``min_confidence`` /
+    ``max_confidence`` and ``status`` (image statuses). Returns
+    (image_id, annotation_id, bbox) hits, ``limit`` per page, with a
+    ``next_cursor`` for the following page.
+    """
+    try:
+        project = Project.load(project_id)
+        if not project:
+            return jsonify({'error': 'Project not found'}), 404
+        
+        try:
+            filters = {field: request.args.getlist(field) for field in SEARCH_FIELDS}
+            min_confidence = request.args.get('min_confidence', type=float)
+            max_confidence = request.args.get('max_confidence', type=float)
+            limit = parse_limit(request.args, default=100)
+            cursor = request.args.get('cursor')
+            after = decode_cursor(cursor, (str, str, int)) if cursor else None
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        
+        statuses = request.args.getlist('status') or None
+        store = get_store()
+        if store is not None:
+            # الواجهة SQL تستخدم فهارس الأعمدة مباشرة بدل الفهرس المقلوب
+            result = search_store(store, project_id, filters, min_confidence, max_confidence, statuses, limit, after)
+        else:
+            rows = Image.list_summaries(project_id)
+            index = AnnotationSearchIndex.for_folder(project.project_folder)
+            index.refresh(project_id, rows)
+            if statuses:
+                rows = [row for row in rows if row.get('status') in statuses]
+            result = index.search(rows, filters, min_confidence, max_confidence, limit, after)
+        return jsonify({
+            'hits': result['hits'],
+            'count': len(result['hits']),
+            'total_count': result['total_count'],
+            'limit': limit,
+            'next_cursor': encode_cursor(result['next_key']) if result['next_key'] else None
+        })
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
 @annotations_bp.route('/<project_id>/<image_id>', methods=['GET'])
 def get_image_annotations(project_id, image_id):
     """Get annotations for specific image"""
@@ -21,6 +76,76 @@ def get_image_annotations(project_id, image_id):
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+def _parse_numbers(value: str, count: int):
+    numbers = [float(part) for part in value.split(',')]
+    if len(numbers) != count:
+        raise ValueError(f"Expected {count} comma separated numbers, got '{value}'")
+    if not all(math.isfinite(number) for number in numbers):
+        raise ValueError(f"Coordinates must be finite numbers, got '{value}'")
+    return numbers
+
+def _parse_base_version(data):
+    """Read the optional ``base_version`` of a save request"""
+    base_version = data.get('base_version')
+    if base_version is None:
+        return None
+    try:
+        return int(base_version)
+    except (TypeError, ValueError):
+        raise ValueError('base_version must be an integer')
+
+@annotations_bp.route('/<project_id>/<image_id>/query', methods=['GET'])
+def query_annotations(project_id, image_id):
+    """Spatial query over image annotations.
+
+    ``bbox=x,y,width,height`` returns annotations intersecting the rectangle
+    (e.g. the canvas viewport), ``point=x,y`` those containing the point and
+    ``overlaps=<annotation_id>`` (optionally with ``min_iou``) those
+    overlapping another annotation.
+    """
+    try:
+        image = Image.load(project_id, image_id)
+        if not image:
+            return jsonify({'error': 'Image not found'}), 404
+        
+        try:
+            if request.args.get('bbox'):
+                x, y, width, height = _parse_numbers(request.args['bbox'], 4)
+                ids = spatial_indexes.run(image, lambda index: index.query((x, y, x + width, y + height)))
+                ious = {}
+            elif request.args.get('point'):
+                x, y = _parse_numbers(request.args['point'], 2)
+                ids = spatial_indexes.run(image, lambda index: index.hit_test(x, y))
+                ious = {}
+            elif request.args.get('overlaps'):
+                min_iou = float(request.args.get('min_iou', 0))
+                matches = spatial_indexes.run(image, lambda index: index.overlaps(request.args['overlaps'], min_iou))
+                ids = [annotation_id for annotation_id, _ in matches]
+                ious = dict(matches)
+            else:
+                return jsonify({'error': 'One of bbox, point or overlaps is required'}), 400
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        
+        by_id = {annotation.get('id'): annotation for annotation in image.annotations}
+        annotations = []
+        for annotation_id in ids:
+            annotation = by_id.get(annotation_id)
+            if annotation is None:
+                continue
+            if annotation_id in ious:
+                annotation = {**annotation, 'iou': round(ious[annotation_id], 4)}
+            annotations.append(annotation)
+        
+        return jsonify({
+            'annotations': annotations,
+            'count': len(annotations),
+            'total_count': len(image.annotations),
+            'annotations_version': image.annotations_version
+        })
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
 @annotations_bp.route('/<project_id>/<image_id>', methods=['POST'])
 def add_annotation(project_id, image_id):
     """Add new annotation to image"""
@@ -35,11 +160,6 @@ def add_annotation(project_id, image_id):
         # Add annotation
         image.add_annotation(annotation_data)
         
-        # Update project statistics
-        project = Project.load(project_id)
-        if project:
-            project.update_statistics()
-        
         return jsonify({
             'message': 'Annotation added successfully',
             'annotation_id': image.annotations[-1]['id'],
@@ -83,11 +203,6 @@ def delete_annotation(project_id, image_id, annotation_id):
         # Delete annotation
         image.delete_annotation(annotation_id)
         
-        # Update project statistics
-        project = Project.load(project_id)
-        if project:
-            project.update_statistics()
-        
         return jsonify({
             'message': 'Annotation deleted successfully',
             'image': image.to_dict()
@@ -95,37 +210,173 @@ def delete_annotation(project_id, image_id, annotation_id):
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@annotations_bp.route('/<project_id>/<image_id>/batch', methods=['POST'])
+def batch_annotations(project_id, image_id):
+    """Apply ordered add/update/delete operations in one load/save cycle"""
+    try:
+        data = request.get_json() or {}
+        operations = data.get('operations', [])
+        if not isinstance(operations, list):
+            return jsonify({'error': 'operations must be a list'}), 400
+        try:
+            base_version = _parse_base_version(data)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        
+        with Image.annotations_lock(project_id, image_id):
+            image = Image.load(project_id, image_id)
+            if not image:
+                return jsonify({'error': 'Image not found'}), 404
+            
+            if base_version is not None and base_version != image.annotations_version:
+                return jsonify({
+                    'error': 'Annotations were modified by another user',
+                    'conflict': True,
+                    'current_version': image.annotations_version
+                }), 409
+            
+            try:
+                id_map = image.apply_annotation_batch(operations)
+            except ValueError as e:
+                return jsonify({'error': str(e)}), 400
+            
+            if operations:
+                image.write_now()
+        
+        return jsonify({
+            'message': f'{len(operations)} operations applied successfully',
+            'applied_count': len(operations),
+            'annotations_version': image.annotations_version,
+            'id_map': id_map,
+            'image': image.to_dict()
+        })
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
 @annotations_bp.route('/<project_id>/<image_id>/save', methods=['POST'])
 def save_annotations(project_id, image_id):
-    """Save all annotations for image"""
+    """Save annotations for image.
+
+    Accepts either the full list (``annotations``) or a delta
+    (``changes``: added/updated/removed) against ``base_version``.
+    Returns 409 if the annotations changed since ``base_version``.
+    """
+    try:
+        data = request.get_json() or {}
+        try:
+            base_version = _parse_base_version(data)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        
+        with Image.annotations_lock(project_id, image_id):
+            image = Image.load(project_id, image_id)
+            if not image:
+                return jsonify({'error': 'Image not found'}), 404
+            
+            if base_version is not None and base_version != image.annotations_version:
+                return jsonify({
+                    'error': 'Annotations were modified by another user',
+                    'conflict': True,
+                    'current_version': image.annotations_version,
+                    'annotations': image.annotations
+                }), 409
+            
+            id_map = {}
+            if 'changes' in data:
+                changes = data.get('changes') or {}
+                try:
+                    id_map = image.apply_annotation_delta(
+                        changes.get('added', []),
+                        changes.get('updated', []),
+                        changes.get('removed', [])
+                    )
+                except ValueError as e:
+                    return jsonify({'error': str(e)}), 400
+                changed = any(changes.get(key) for key in ('added', 'updated', 'removed'))
+            else:
+                # Replace all annotations (skipped when the content is identical)
+                changed = image.replace_annotations(data.get('annotations', []))
+            
+            if changed:
+                # الكتابة داخل القفل حتى يرى الطلب التالي النسخة الجديدة
+                image.write_now()
+        
+        return jsonify({
+            'message': 'Annotations saved successfully' if changed else 'Annotations unchanged',
+            'changed': changed,
+            'annotations_version': image.annotations_version,
+            'id_map': id_map,
+            'image': image.to_dict()
+        })
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@annotations_bp.route('/<project_id>/<image_id>/history', methods=['GET'])
+def list_annotation_history(project_id, image_id):
+    """List recorded annotation versions of an image (oldest first)"""
     try:
         image = Image.load(project_id, image_id)
         if not image:
             return jsonify({'error': 'Image not found'}), 404
         
-        data = request.get_json()
-        annotations = data.get('annotations', [])
-        
-        # Replace all annotations
-        image.annotations = annotations
-        
-        # Update status based on annotations
-        if annotations:
-            if image.status == 'processed':
-                image.status = 'annotated'
-        else:
-            if image.status == 'annotated':
-                image.status = 'processed'
+        versions = annotation_history.list_versions(image.project_folder, image_id)
+        return jsonify({
+            'versions': versions,
+            'count': len(versions),
+            'current_version': image.annotations_version
+        })
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@annotations_bp.route('/<project_id>/<image_id>/history/diff', methods=['GET'])
+def diff_annotation_history(project_id, image_id):
+    """Diff two recorded versions (``from`` and ``to``, default: latest)"""
+    try:
+        image = Image.load(project_id, image_id)
+        if not image:
+            return jsonify({'error': 'Image not found'}), 404
         
-        image.save()
+        from_version = request.args.get('from', type=int)
+        to_version = request.args.get('to', type=int)
+        if from_version is None:
+            return jsonify({'error': 'from version is required'}), 400
+        if to_version is None:
+            versions = annotation_history.list_versions(image.project_folder, image_id)
+            if not versions:
+                return jsonify({'error': 'No history recorded for this image'}), 404
+            to_version = versions[-1]['version']
         
-        # Update project statistics
-        project = Project.load(project_id)
-        if project:
-            project.update_statistics()
+        try:
+            diff = annotation_history.diff(image.project_folder, image_id, from_version, to_version)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 404
+        return jsonify(diff)
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@annotations_bp.route('/<project_id>/<image_id>/history/<int:version>/restore', methods=['POST'])
+def restore_annotation_version(project_id, image_id, version):
+    """Restore the annotations of a recorded version (saved as a new version)"""
+    try:
+        with Image.annotations_lock(project_id, image_id):
+            image = Image.load(project_id, image_id)
+            if not image:
+                return jsonify({'error': 'Image not found'}), 404
+            
+            try:
+                annotations = annotation_history.get_annotations(image.project_folder, image_id, version)
+            except ValueError as e:
+                return jsonify({'error': str(e)}), 404
+            
+            changed = image.replace_annotations(annotations)
+            if changed:
+                image.write_now()
         
         return jsonify({
-            'message': 'Annotations saved successfully',
+            'message': f'Restored version {version}' if changed else 'Annotations already match this version',
+            'changed': changed,
+            'restored_version': version,
+            'annotations_version': image.annotations_version,
             'image': image.to_dict()
         })
     except Exception as e:
@@ -189,8 +440,6 @@ def auto_flow_annotation(project_id):
         else:  # manual mode
             response['next_action'] = 'manual'
         
-        # Update project statistics
-        project.update_statistics()
         response['statistics'] = project.statistics
         
         return jsonify(response)
@@ -205,24 +454,17 @@ def get_annotation_export_preview(project_id):
         if not project:
             return jsonify({'error': 'Project not found'}), 404
         
-        images = Image.load_all_for_project(project_id)
-        annotated_images = [img for img in images if img.annotations]
+        total_images = len(Image.get_manifest(project_id))
         
         # Calculate statistics
-        total_annotations = sum(len(img.annotations) for img in annotated_images)
-        label_counts = {}
-        
-        for image in annotated_images:
-            for annotation in image.annotations:
-                label = annotation.get('label', 'unlabeled')
-                label_counts[label] = label_counts.get(label, 0) + 1
+        annotation_stats = project.get_annotation_statistics()
         
         return jsonify({
-            'total_images': len(images),
-            'annotated_images': len(annotated_images),
-            'total_annotations': total_annotations,
-            'label_counts': label_counts,
-            'export_ready': len(annotated_images) > 0
+            'total_images': total_images,
+            'annotated_images': annotation_stats['annotated_images'],
+            'total_annotations': annotation_stats['total_annotations'],
+            'label_counts': annotation_stats['labels'],
+            'export_ready': annotation_stats['annotated_images'] > 0
         })
     except Exception as e:
         return jsonify({'error': str(e)}), 500
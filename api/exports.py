@@ -105,33 +105,21 @@ def get_export_preview(project_id):
             return jsonify({'error': 'Project not found'}), 404
         
         from models.image import Image
-        images = Image.load_all_for_project(project_id)
+        total_images = len(Image.get_manifest(project_id))
         
-        # Filter annotated images
-        annotated_images = [img for img in images if img.annotations and img.status in ['annotated', 'completed']]
-        
-        # Calculate statistics
-        total_annotations = sum(len(img.annotations) for img in annotated_images)
-        label_counts = {}
-        level_counts = {}
-        
-        for image in annotated_images:
-            for annotation in image.annotations:
-                label = annotation.get('label', 'unlabeled')
-                level = annotation.get('level', 'unknown')
-                
-                label_counts[label] = label_counts.get(label, 0) + 1
-                level_counts[level] = level_counts.get(level, 0) + 1
+        # Only annotated/completed images are exported
+        annotation_stats = project.get_annotation_statistics(['annotated', 'completed'])
+        annotated_images = annotation_stats['annotated_images']
         
         return jsonify({
             'project_name': project.name,
-            'total_images': len(images),
-            'annotated_images': len(annotated_images),
-            'unannotated_images': len(images) - len(annotated_images),
-            'total_annotations': total_annotations,
-            'label_counts': label_counts,
-            'level_counts': level_counts,
-            'export_ready': len(annotated_images) > 0,
+            'total_images': total_images,
+            'annotated_images': annotated_images,
+            'unannotated_images': total_images - annotated_images,
+            'total_annotations': annotation_stats['total_annotations'],
+            'label_counts': annotation_stats['labels'],
+            'level_counts': annotation_stats['levels'],
+            'export_ready': annotated_images > 0,
             'statistics': project.statistics
         })
     except Exception as e:
@@ -2,13 +2,25 @@ from datetime import datetime
 from flask import Blueprint, request, jsonify, send_file
 from models.project import Project
 from models.image import Image
+from models.annotation_record import AnnotationRecord
+from models.session import register_unit_of_work
 from services.file_manager import FileManager
+from services.pagination import paginate_images
+from services.preview_cache import preview_cache
 import os
 import mimetypes
 
 images_bp = Blueprint('images', __name__)
+register_unit_of_work(images_bp)
 file_manager = FileManager()
 
+# Image statuses shown in each workflow view
+WORKFLOW_STATUSES = {
+    'processing': ['unprocessed'],
+    'annotation': ['processed'],
+    'review': ['annotated', 'completed']
+}
+
 def get_image_mimetype(file_path):
     """Get MIME type for image file"""
     if not os.path.exists(file_path):
@@ -35,7 +47,7 @@ def get_image_mimetype(file_path):
 
 @images_bp.route('/<project_id>', methods=['GET'])
 def get_project_images(project_id):
-    """Get all images for a project with optional filtering"""
+    """Get images for a project with optional filtering, sorting, paging and field projection"""
     try:
         project = Project.load(project_id)
         if not project:
@@ -45,26 +57,24 @@ def get_project_images(project_id):
         status_filter = request.args.get('status')
         workflow = request.args.get('workflow')  # processing, annotation, review
         
-        images = Image.load_all_for_project(project_id)
-        
-        # Apply filters
+        # Apply filters (served from the manifest's per-status queues)
+        statuses = None
         if workflow:
             # Filter by workflow type
-            if workflow == 'processing':
-                images = [img for img in images if img.status == 'unprocessed']
-            elif workflow == 'annotation':
-                images = [img for img in images if img.status == 'processed']
-            elif workflow == 'review':
-                images = [img for img in images if img.status in ['annotated', 'completed']]
+            statuses = WORKFLOW_STATUSES.get(workflow)
         elif status_filter:
             # Filter by specific status
-            images = [img for img in images if img.status == status_filter]
+            statuses = [status_filter]
         
-        return jsonify({
-            'images': [image.to_dict() for image in images],
-            'total_count': len(Image.load_all_for_project(project_id)),
-            'filtered_count': len(images)
-        })
+        manifest = Image.get_manifest(project_id)
+        
+        try:
+            result = paginate_images(manifest, request.args, statuses)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        
+        result['total_count'] = len(manifest) if manifest is not None else 0
+        return jsonify(result)
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -245,9 +255,6 @@ def upload_images(project_id):
                 except Exception as e:
                     errors.append(f"Error processing {file.filename}: {str(e)}")
         
-        # Update project statistics
-        project.update_statistics()
-        
         result = {
             'message': f'{len(uploaded_images)} images uploaded successfully',
             'uploaded_count': len(uploaded_images),
@@ -275,6 +282,8 @@ def duplicate_image(project_id, image_id):
         
         # Copy image files
         import shutil
+        original_ext = os.path.splitext(original_image.original_image_path)[1]
+        duplicate.set_original_file(f"{duplicate.id}{original_ext}")
         if os.path.exists(original_image.original_image_path):
             shutil.copy2(original_image.original_image_path, duplicate.original_image_path)
         if os.path.exists(original_image.processed_image_path):
@@ -285,10 +294,12 @@ def duplicate_image(project_id, image_id):
         # Copy metadata
         duplicate.width = original_image.width
         duplicate.height = original_image.height
+        duplicate.original_width = original_image.original_width
+        duplicate.original_height = original_image.original_height
         duplicate.file_size = original_image.file_size
         duplicate.status = original_image.status
         duplicate.processing_settings = original_image.processing_settings.copy()
-        duplicate.annotations = [ann.copy() for ann in original_image.annotations]
+        duplicate.annotations = [AnnotationRecord.from_dict(ann.to_dict()) for ann in original_image.annotations]
         
         # Generate new IDs for annotations
         import uuid
@@ -298,11 +309,6 @@ def duplicate_image(project_id, image_id):
         
         duplicate.save()
         
-        # Update project statistics
-        project = Project.load(project_id)
-        if project:
-            project.update_statistics()
-        
         return jsonify({
             'message': 'Image duplicated successfully',
             'original_image': original_image.to_dict(),
@@ -320,24 +326,7 @@ def delete_image(project_id, image_id):
             return jsonify({'error': 'Image not found'}), 404
         
         # Delete image files
-        files_to_delete = [
-            image.original_image_path,
-            image.processed_image_path,
-            image.thumbnail_path,
-            image.annotations_file
-        ]
-        
-        for file_path in files_to_delete:
-            if file_path and os.path.exists(file_path):
-                try:
-                    os.remove(file_path)
-                except Exception as e:
-                    print(f"Warning: Failed to delete {file_path}: {e}")
-        
-        # Update project statistics
-        project = Project.load(project_id)
-        if project:
-            project.update_statistics()
+        image.delete()
         
         return jsonify({'message': 'Image deleted successfully'})
     except Exception as e:
@@ -372,9 +361,6 @@ def batch_update_status(project_id):
             except Exception as e:
                 errors.append(f"Error updating {image_id}: {str(e)}")
         
-        # Update project statistics
-        project.update_statistics()
-        
         result = {
             'message': f'{updated_count} images updated successfully',
             'updated_count': updated_count,
@@ -396,20 +382,22 @@ def get_images_statistics(project_id):
         if not project:
             return jsonify({'error': 'Project not found'}), 404
         
-        images = Image.load_all_for_project(project_id)
+        manifest = Image.get_manifest(project_id)
+        images = manifest.ordered_rows() if manifest is not None else []
+        counts = manifest.status_counts() if manifest is not None else {}
         
         # Calculate various statistics
-        total_size = sum(img.file_size for img in images)
+        total_size = sum(img['file_size'] for img in images)
         avg_size = total_size / len(images) if images else 0
         
         # Resolution statistics
-        resolutions = [(img.width, img.height) for img in images if img.width > 0 and img.height > 0]
+        resolutions = [(img['width'], img['height']) for img in images if img['width'] > 0 and img['height'] > 0]
         unique_resolutions = list(set(resolutions))
         
         # File format statistics
         formats = {}
         for image in images:
-            ext = os.path.splitext(image.filename)[1].lower()
+            ext = os.path.splitext(image['filename'])[1].lower()
             formats[ext] = formats.get(ext, 0) + 1
         
         return jsonify({
@@ -420,10 +408,10 @@ def get_images_statistics(project_id):
             'most_common_resolution': max(set(resolutions), key=resolutions.count) if resolutions else None,
             'file_formats': formats,
             'status_distribution': {
-                'unprocessed': len([img for img in images if img.status == 'unprocessed']),
-                'processed': len([img for img in images if img.status == 'processed']),
-                'annotated': len([img for img in images if img.status == 'annotated']),
-                'completed': len([img for img in images if img.status == 'completed'])
+                'unprocessed': counts.get('unprocessed', 0),
+                'processed': counts.get('processed', 0),
+                'annotated': counts.get('annotated', 0),
+                'completed': counts.get('completed', 0)
             }
         })
     except Exception as e:
@@ -449,7 +437,8 @@ def serve_generated_preview(project_id, preview_filename):
         
         print(f"Looking for preview at: {preview_path}")
         
-        if not os.path.exists(preview_path):
+        # تحديث ترتيب LRU حتى لا تُحذف المعاينات المعروضة حالياً
+        if not preview_cache.get(preview_path) and not os.path.exists(preview_path):
             error_msg = f"Preview not found: {preview_path}"
             print(error_msg)
             return jsonify({'error': error_msg}), 404
@@ -0,0 +1,13 @@
+from flask.json.provider import DefaultJSONProvider
+
+from models.annotation_record import SlotRecord
+
+
+class RecordJSONProvider(DefaultJSONProvider):
+    """JSON provider that serialises annotation records as dicts"""
+
+    @staticmethod
+    def default(o):
+        if isinstance(o, SlotRecord):
+            return o.to_dict()
+        return DefaultJSONProvider.default(o)
@@ -1,11 +1,13 @@
 from flask import Blueprint, request, jsonify
 from models.project import Project
 from models.image import Image
+from models.session import register_unit_of_work
 from services.image_processor import ImageProcessor
 from services.file_manager import FileManager
 from datetime import datetime
 import os
 processing_bp = Blueprint('processing', __name__)
+register_unit_of_work(processing_bp)
 image_processor = ImageProcessor()
 file_manager = FileManager()
 @processing_bp.route('/<project_id>/<image_id>', methods=['POST'])
@@ -29,10 +31,7 @@ def process_image(project_id, image_id):
         
         print(f"Successfully processed image {image.id}, new status: {image.status}")
         
-        # Update project statistics
         project = Project.load(project_id)
-        if project:
-            project.update_statistics()
         
         # Auto-flow: decide next action based on project settings
         next_payload = {}
@@ -164,9 +163,6 @@ def batch_process(project_id):
         
         results = image_processor.batch_process_images(images, processing_settings, progress_callback)
         
-        # Update project statistics
-        project.update_statistics()
-        
         return jsonify({
             'message': f'Batch processing completed. {results["processed"]} succeeded, {results["failed"]} failed',
             'processed_count': results['processed'],
@@ -227,8 +223,6 @@ def auto_flow_processing(project_id):
         else:  # manual mode
             response['next_action'] = 'manual'
         
-        # Update project statistics
-        project.update_statistics()
         response['statistics'] = project.statistics
         
         return jsonify(response)
@@ -452,9 +446,6 @@ def reset_processed_images(project_id):
             except Exception as e:
                 print(f"Error resetting image {image.id}: {e}")
         
-        # Update project statistics
-        project.update_statistics()
-        
         return jsonify({
             'message': f'{reset_count} images reset successfully',
             'reset_count': reset_count,
@@ -652,9 +643,6 @@ def apply_processing_to_all(project_id):
                 else:
                     failed_count += 1
         
-        # Update project statistics
-        project.update_statistics()
-        
         return jsonify({
             'message': f'Processing completed: {processed_count} successful, {failed_count} failed',
             'processed_count': processed_count,
@@ -3,6 +3,7 @@ from flask import Blueprint, request, jsonify
 from models.project import Project
 from models.image import Image
 from services.file_manager import FileManager
+from services.pagination import paginate_images
 
 projects_bp = Blueprint('projects', __name__)
 file_manager = FileManager()
@@ -34,11 +35,14 @@ def get_project(project_id):
         # Update statistics
         project.update_statistics()
         
-        # Get project images
-        images = Image.load_all_for_project(project_id)
+        # Get project images (supports sort/order/limit/cursor/fields)
+        try:
+            page = paginate_images(Image.get_manifest(project_id), request.args)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
         
         result = project.to_dict()
-        result['images'] = [image.to_dict() for image in images]
+        result.update(page)
         
         return jsonify(result)
     except Exception as e:
@@ -131,9 +135,6 @@ def load_images_from_path(project_id):
         # Load images
         images = file_manager.copy_images_from_path(project, images_path)
         
-        # Update project statistics
-        project.update_statistics()
-        
         return jsonify({
             'message': f'{len(images)} images loaded successfully',
             'loaded_count': len(images),
@@ -153,27 +154,17 @@ def get_project_statistics(project_id):
         
         project.update_statistics()
         
-        # Add additional statistics
-        images = Image.load_all_for_project(project_id)
-        
         # Calculate storage usage
         storage_info = file_manager.calculate_project_storage_size(project)
         
         # Calculate annotation statistics
+        stats = project.get_annotation_statistics()
         annotation_stats = {
-            'total_annotations': sum(len(img.annotations) for img in images),
-            'levels': {},
-            'labels': {}
+            'total_annotations': stats['total_annotations'],
+            'levels': stats['levels'],
+            'labels': stats['labels']
         }
         
-        for image in images:
-            for annotation in image.annotations:
-                level = annotation.get('level', 'unknown')
-                label = annotation.get('label', 'unlabeled')
-                
-                annotation_stats['levels'][level] = annotation_stats['levels'].get(level, 0) + 1
-                annotation_stats['labels'][label] = annotation_stats['labels'].get(label, 0) + 1
-        
         return jsonify({
             **project.statistics,
             'storage': storage_info,
@@ -184,6 +175,23 @@ def get_project_statistics(project_id):
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@projects_bp.route('/<project_id>/statistics/recount', methods=['POST'])
+def recount_project_statistics(project_id):
+    """Rebuild image manifest and statistics from the image records (repair)"""
+    try:
+        project = Project.load(project_id)
+        if not project:
+            return jsonify({'error': 'Project not found'}), 404
+        
+        project.recount_statistics()
+        
+        return jsonify({
+            'message': 'Project statistics recounted',
+            'statistics': project.statistics
+        })
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
 @projects_bp.route('/<project_id>/validate-path', methods=['POST'])
 def validate_images_path(project_id):
     """Validate images path without loading"""
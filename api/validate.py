@@ -1,7 +1,14 @@
 from flask import Blueprint, request, jsonify
 
+from models.journal import annotation_journal
+from models.persistence import json_store
 from models.project import Project
-from services.validate import DatasetValidator
+from models.image import Image
+from models.sqlite_store import get_store
+from services.validate import (
+    DatasetValidator, find_overlaps, duplicates_to_remove, check_thresholds, parse_max_workers,
+    DUPLICATE_IOU, NEAR_DUPLICATE_IOU, LABEL_CONFLICT_IOU
+)
 
 validate_bp = Blueprint('validate', __name__)
 validator = DatasetValidator()
@@ -13,7 +20,72 @@ def validate_dataset(project_id):
         project = Project.load(project_id)
         if not project:
             return jsonify({'error': 'Project not found'}), 404
-        report = validator.validate_project(project.project_folder)
+        if get_store() is not None:
+            # على SQLite السجلات في قاعدة البيانات لا في ملفات التوسيم
+            records = [image.to_record() for image in Image.load_all_for_project(project_id)]
+            report = validator.validate_project(project.project_folder, records)
+        else:
+            # The validator reads annotation files directly
+            annotation_journal.compact_folder(project.annotations_folder)
+            json_store.flush()
+            report = validator.validate_project(project.project_folder)
         return jsonify({'report': report})
     except Exception as e:
         return jsonify({'error': str(e)}), 500
+
+
+@validate_bp.route('/<project_id>/overlaps', methods=['POST'])
+def validate_overlaps(project_id):
+    """Find duplicate, near-duplicate and label-conflicting boxes.
+
+    Optional JSON body: ``duplicate_iou``, ``near_duplicate_iou`` and
+    ``label_conflict_iou`` thresholds, ``max_workers`` and ``merge`` (delete
+    all but the most confident annotation of each duplicate group).
+    """
+    try:
+        project = Project.load(project_id)
+        if not project:
+            return jsonify({'error': 'Project not found'}), 404
+        data = request.get_json(silent=True) or {}
+        try:
+            thresholds = {
+                key: float(data[key])
+                for key in ('duplicate_iou', 'near_duplicate_iou', 'label_conflict_iou') if key in data
+            }
+        except (TypeError, ValueError):
+            return jsonify({'error': 'IoU thresholds must be numbers'}), 400
+        try:
+            thresholds = check_thresholds({
+                'duplicate_iou': DUPLICATE_IOU,
+                'near_duplicate_iou': NEAR_DUPLICATE_IOU,
+                'label_conflict_iou': LABEL_CONFLICT_IOU,
+                **thresholds
+            })
+            max_workers = parse_max_workers(data.get('max_workers'))
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+
+        images = Image.load_all_for_project(project_id)
+        report = validator.find_overlapping_boxes(images, thresholds, max_workers)
+
+        merged = {}
+        if data.get('merge'):
+            image_ids = {f['image_id'] for f in report['findings'] if f['kind'] == 'duplicate'}
+            for image_id in image_ids:
+                with Image.annotations_lock(project_id, image_id):
+                    # إعادة الفحص على أحدث نسخة لأن الصورة قد تكون تغيرت منذ الفحص
+                    image = Image.load(project_id, image_id)
+                    if not image:
+                        continue
+                    findings = find_overlaps(image.id, image.annotations, report['thresholds'])
+                    remove = duplicates_to_remove(image.annotations, findings)
+                    if remove:
+                        image.apply_annotation_batch([{'op': 'delete', 'id': annotation_id} for annotation_id in remove])
+                        merged[image_id] = remove
+            report['merged'] = merged
+            report['merged_count'] = sum(len(ids) for ids in merged.values())
+
+        return jsonify({'report': report})
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
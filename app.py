@@ -42,6 +42,34 @@ def create_app(config_name=None):
     # Enable CORS with configuration
     CORS(app, origins=app.config['CORS_ORIGINS'])
     
+    # Annotation records are converted to dicts only when responses are encoded
+    from api.json_provider import RecordJSONProvider
+    app.json = RecordJSONProvider(app)
+    
+    # Select storage backend for the models layer
+    from models.sqlite_store import configure_store
+    configure_store(app.config['STORAGE_BACKEND'], app.config['SQLITE_PATH'])
+    
+    # Cross-request cache of project/image documents
+    from models.cache import object_cache
+    object_cache.configure(
+        enabled=app.config['ENABLE_CACHE'],
+        timeout=app.config['CACHE_TIMEOUT'],
+        max_entries=app.config['CACHE_MAX_ENTRIES']
+    )
+    
+    # Decoded originals shared by preview, processing, statistics and segmentation
+    from services.image_cache import decoded_images
+    decoded_images.configure(app.config['DECODED_IMAGE_CACHE_MB'] * 1024 * 1024 if app.config['ENABLE_CACHE'] else 0)
+    
+    # Preview JPEGs kept on disk (least recently used are deleted)
+    from services.preview_cache import preview_cache
+    preview_cache.configure(app.config['PREVIEW_CACHE_MAX_FILES'], app.config['PREVIEW_CACHE_MB'] * 1024 * 1024)
+    
+    # Intermediate buffers reused by interactive previews
+    from services.stage_cache import stage_cache
+    stage_cache.configure(app.config['PREVIEW_STAGE_CACHE_MB'] * 1024 * 1024 if app.config['ENABLE_CACHE'] else 0)
+    
     return app
 
 # Create app instance
@@ -51,6 +79,20 @@ app = create_app()
 os.makedirs('data', exist_ok=True)
 os.makedirs('exports', exist_ok=True)
 
+# Load project index (rebuilt from data/ if missing)
+from models.project_index import project_index
+project_index.load()
+
+# Upgrade existing projects to the current storage layout
+from models.migrations import migrate_all_projects
+migrate_all_projects()
+
+# Index preview files left by earlier runs so they are garbage-collected
+from models.project import Project
+from services.preview_cache import preview_cache
+for project in Project.load_all():
+    preview_cache.scan(project.previews_folder)
+
 # Register API blueprints
 from api.projects import projects_bp
 from api.images import images_bp
@@ -113,6 +155,22 @@ def musnad_characters():
     
     return jsonify({'characters': characters})
 
+@app.route('/api/cache/stats')
+def cache_stats():
+    """Get project/image cache, image caches and JSON writer counters"""
+    from models.cache import object_cache
+    from models.persistence import json_store
+    from services.image_cache import decoded_images
+    from services.preview_cache import preview_cache
+    from services.stage_cache import stage_cache
+    return jsonify({
+        **object_cache.stats(),
+        'decoded_images': decoded_images.stats(),
+        'previews': preview_cache.stats(),
+        'preview_stages': stage_cache.stats(),
+        'writer': json_store.stats()
+    })
+
 @app.errorhandler(404)
 def not_found(error):
     return jsonify({'error': 'Resource not found'}), 404
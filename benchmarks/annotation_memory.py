@@ -0,0 +1,93 @@
+"""Memory footprint of annotation dicts vs slotted AnnotationRecords.
+
+Builds a synthetic character-level project (canvas-shaped annotations,
+round-tripped through JSON like a loaded project) and measures the memory
+held by the annotation lists with tracemalloc.
+
+    python benchmarks/annotation_memory.py [--images 5000] [--per-image 60]
+"""
+import os
+import sys
+import gc
+import json
+import random
+import argparse
+import tracemalloc
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from models.annotation_record import AnnotationRecord
+
+MUSNAD_LETTERS = [chr(codepoint) for codepoint in range(0x10A60, 0x10A7D)]
+
+
+def make_annotation(rng: random.Random) -> dict:
+    annotation = {
+        'id': f"{rng.getrandbits(128):032x}",
+        'type': 'bbox',
+        'annotation_type': 'text',
+        'level': 'character',
+        'label': rng.choice(MUSNAD_LETTERS),
+        'bbox': {
+            'x': round(rng.uniform(0, 2000), 2),
+            'y': round(rng.uniform(0, 1500), 2),
+            'width': round(rng.uniform(10, 60), 2),
+            'height': round(rng.uniform(10, 80), 2)
+        },
+        'direction': 'rtl',
+        'confidence': rng.randint(50, 100),
+        'created_at': datetime.now().isoformat(),
+        'missing_region': False
+    }
+    if rng.random() < 0.05:
+        annotation.update({
+            'type': 'bbox',
+            'annotation_type': 'missing_region',
+            'missing_region': True,
+            'max_chars': rng.randint(1, 8),
+            'reason': 'damaged',
+            'notes': ''
+        })
+    return annotation
+
+
+def measure(build) -> int:
+    gc.collect()
+    tracemalloc.start()
+    data = build()
+    gc.collect()
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del data
+    return size
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--images', type=int, default=5000)
+    parser.add_argument('--per-image', type=int, default=60)
+    args = parser.parse_args()
+
+    rng = random.Random(42)
+    # JSON text per image, as stored in annotations/<id>.json
+    payloads = [
+        json.dumps([make_annotation(rng) for _ in range(args.per_image)], ensure_ascii=False)
+        for _ in range(args.images)
+    ]
+    total = args.images * args.per_image
+
+    dict_bytes = measure(lambda: [json.loads(payload) for payload in payloads])
+    record_bytes = measure(lambda: [
+        [AnnotationRecord.from_dict(annotation) for annotation in json.loads(payload)]
+        for payload in payloads
+    ])
+
+    print(f"{args.images} images x {args.per_image} annotations = {total} annotations")
+    print(f"dicts:   {dict_bytes / 2**20:8.1f} MiB  ({dict_bytes / total:6.0f} B/annotation)")
+    print(f"records: {record_bytes / 2**20:8.1f} MiB  ({record_bytes / total:6.0f} B/annotation)")
+    print(f"saving:  {(1 - record_bytes / dict_bytes) * 100:7.1f} %")
+
+
+if __name__ == '__main__':
+    main()
@@ -29,9 +29,18 @@ class Config:
     THUMBNAIL_SIZE = (300, 300)
     JPEG_QUALITY = 95
     
+    # Storage backend: 'json' (one file per project/image) or 'sqlite'
+    STORAGE_BACKEND = os.environ.get('STORAGE_BACKEND', 'json')
+    SQLITE_PATH = os.environ.get('SQLITE_PATH', os.path.join('data', 'musnad.db'))
+    
     # Cache settings
     ENABLE_CACHE = True
     CACHE_TIMEOUT = 3600  # 1 hour
+    CACHE_MAX_ENTRIES = int(os.environ.get('CACHE_MAX_ENTRIES', 2048))  # project/image documents kept in memory
+    DECODED_IMAGE_CACHE_MB = int(os.environ.get('DECODED_IMAGE_CACHE_MB', 256))  # decoded original images
+    PREVIEW_CACHE_MAX_FILES = int(os.environ.get('PREVIEW_CACHE_MAX_FILES', 500))  # preview JPEGs kept on disk
+    PREVIEW_CACHE_MB = int(os.environ.get('PREVIEW_CACHE_MB', 200))
+    PREVIEW_STAGE_CACHE_MB = int(os.environ.get('PREVIEW_STAGE_CACHE_MB', 256))  # intermediate preview buffers
     
     @staticmethod
     def init_app(app):
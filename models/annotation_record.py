@@ -0,0 +1,154 @@
+import sys
+from collections.abc import Mapping, MutableMapping
+from typing import Any, Dict, Iterator, Optional
+
+# Keys written by the annotation canvas; anything else goes to the overflow dict
+ANNOTATION_FIELDS = (
+    'id', 'type', 'annotation_type', 'level', 'label', 'bbox', 'points', 'direction',
+    'confidence', 'created_at', 'updated_at', 'missing_region', 'max_chars', 'reason', 'notes'
+)
+BOX_FIELDS = ('x', 'y', 'width', 'height')
+# Short repeated strings are interned so equal values share one object
+INTERNED_FIELDS = frozenset(('type', 'annotation_type', 'level', 'label', 'direction', 'reason'))
+
+
+class SlotRecord(MutableMapping):
+    """Dict-compatible record storing known keys in ``__slots__``.
+
+    A plain dict per annotation carries a hash table sized for its keys; a
+    slotted record stores one pointer per known field and only allocates an
+    overflow dict for unexpected keys. It supports the mapping protocol, so
+    code written against annotation dicts keeps working, and ``to_dict``
+    converts it back at the JSON boundary.
+    """
+
+    __slots__ = ('_extra',)
+    FIELDS: tuple = ()
+    FIELD_SET: frozenset = frozenset()
+
+    def __init__(self, data: Optional[Mapping] = None):
+        self._extra = None
+        if data:
+            for key, value in data.items():
+                self[key] = value
+
+    @classmethod
+    def from_dict(cls, data: Mapping) -> 'SlotRecord':
+        """Build record from a dict (records are returned as they are)"""
+        if isinstance(data, cls):
+            return data
+        return cls(data)
+
+    def _convert(self, key: str, value: Any) -> Any:
+        return value
+
+    def __getitem__(self, key: str) -> Any:
+        if key in self.FIELD_SET:
+            try:
+                return getattr(self, key)
+            except AttributeError:
+                raise KeyError(key) from None
+        if self._extra is not None and key in self._extra:
+            return self._extra[key]
+        raise KeyError(key)
+
+    def __setitem__(self, key: str, value: Any):
+        value = self._convert(key, value)
+        if key in self.FIELD_SET:
+            setattr(self, key, value)
+        else:
+            if self._extra is None:
+                self._extra = {}
+            self._extra[key] = value
+
+    def __delitem__(self, key: str):
+        if key in self.FIELD_SET:
+            try:
+                delattr(self, key)
+            except AttributeError:
+                raise KeyError(key) from None
+        elif self._extra is not None and key in self._extra:
+            del self._extra[key]
+        else:
+            raise KeyError(key)
+
+    def __contains__(self, key) -> bool:
+        if key in self.FIELD_SET:
+            return hasattr(self, key)
+        return self._extra is not None and key in self._extra
+
+    def __iter__(self) -> Iterator[str]:
+        for key in self.FIELDS:
+            if hasattr(self, key):
+                yield key
+        if self._extra:
+            yield from self._extra
+
+    def __len__(self) -> int:
+        return sum(1 for _ in self)
+
+    def get(self, key: str, default: Any = None) -> Any:
+        # أسرع من التنفيذ العام في MutableMapping لأنه لا يمر عبر استثناء KeyError
+        if key in self.FIELD_SET:
+            return getattr(self, key, default)
+        if self._extra is not None:
+            return self._extra.get(key, default)
+        return default
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Convert to a plain dict (nested records included)"""
+        return {
+            key: value.to_dict() if isinstance(value, SlotRecord) else value
+            for key, value in self.items()
+        }
+
+    def copy(self) -> Dict[str, Any]:
+        return self.to_dict()
+
+    def __repr__(self):
+        return f"{type(self).__name__}({self.to_dict()!r})"
+
+    def __getstate__(self):
+        return self.to_dict()
+
+    def __setstate__(self, state):
+        self._extra = None
+        for key, value in state.items():
+            self[key] = value
+
+
+class BoxRecord(SlotRecord):
+    """Slotted ``{x, y, width, height}`` bounding box"""
+
+    __slots__ = BOX_FIELDS
+    FIELDS = BOX_FIELDS
+    FIELD_SET = frozenset(BOX_FIELDS)
+
+
+class AnnotationRecord(SlotRecord):
+    """Slotted annotation with the canvas annotation keys as fields"""
+
+    __slots__ = ANNOTATION_FIELDS
+    FIELDS = ANNOTATION_FIELDS
+    FIELD_SET = frozenset(ANNOTATION_FIELDS)
+
+    def _convert(self, key: str, value: Any) -> Any:
+        if key == 'bbox' and isinstance(value, Mapping):
+            return BoxRecord.from_dict(value)
+        if key in INTERNED_FIELDS and type(value) is str:
+            return sys.intern(value)
+        return value
+
+
+def plain_dict(value: Mapping) -> Dict[str, Any]:
+    """Convert a record or any annotation mapping to a plain dict"""
+    if isinstance(value, SlotRecord):
+        return value.to_dict()
+    return dict(value)
+
+
+def to_plain(value: Any) -> Any:
+    """JSON ``default`` hook: turn records into dicts"""
+    if isinstance(value, SlotRecord):
+        return value.to_dict()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
@@ -0,0 +1,115 @@
+import os
+import time
+import pickle
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+DEFAULT_MAX_ENTRIES = 2048
+
+
+class ObjectCache:
+    """Bounded LRU cache of parsed JSON documents, keyed by file path.
+
+    Entries are validated against the file's mtime and size on every lookup,
+    so files changed outside the application are re-read. Documents are
+    stored pickled and unpickled on each hit: callers always get an
+    independent copy they can mutate freely.
+    """
+
+    def __init__(self, max_entries: int = DEFAULT_MAX_ENTRIES, enabled: bool = True, timeout: Optional[float] = None):
+        self.max_entries = max_entries
+        self.enabled = enabled
+        self.timeout = timeout
+        self._entries: 'OrderedDict[str, tuple]' = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def configure(self, enabled: bool = True, timeout: Optional[float] = None, max_entries: Optional[int] = None):
+        """Apply application settings (ENABLE_CACHE, CACHE_TIMEOUT)"""
+        with self._lock:
+            self.enabled = enabled
+            self.timeout = timeout
+            if max_entries is not None:
+                self.max_entries = max_entries
+            if not enabled:
+                self._entries.clear()
+            self._evict()
+
+    @staticmethod
+    def _signature(path: str):
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+    def get(self, path: str) -> Optional[Dict[str, Any]]:
+        """Get cached document for path, or None if missing or stale"""
+        if not self.enabled:
+            return None
+        signature = self._signature(path)
+        with self._lock:
+            entry = self._entries.get(path)
+            if entry is not None:
+                cached_signature, cached_at, payload = entry
+                expired = self.timeout is not None and time.monotonic() - cached_at > self.timeout
+                if cached_signature == signature and not expired:
+                    self._entries.move_to_end(path)
+                    self.hits += 1
+                    return pickle.loads(payload)
+                del self._entries[path]
+                self.invalidations += 1
+            self.misses += 1
+        return None
+
+    def put(self, path: str, data: Dict[str, Any]):
+        """Cache document just read from (or written to) path"""
+        if not self.enabled:
+            return
+        signature = self._signature(path)
+        if signature is None:
+            return
+        payload = pickle.dumps(data, pickle.HIGHEST_PROTOCOL)
+        with self._lock:
+            self._entries[path] = (signature, time.monotonic(), payload)
+            self._entries.move_to_end(path)
+            self._evict()
+
+    def invalidate(self, path: str):
+        """Drop entry for path"""
+        with self._lock:
+            if self._entries.pop(path, None) is not None:
+                self.invalidations += 1
+
+    def clear(self):
+        """Drop all entries"""
+        with self._lock:
+            self._entries.clear()
+
+    def _evict(self):
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def stats(self) -> Dict[str, Any]:
+        """Get cache counters"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'enabled': self.enabled,
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'timeout': self.timeout,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'invalidations': self.invalidations,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else 0
+            }
+
+
+object_cache = ObjectCache()
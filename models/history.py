@@ -0,0 +1,257 @@
+import os
+import hashlib
+import threading
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from models.persistence import dumps, loads, write_file_atomic
+
+HISTORY_FOLDER = 'history'
+OBJECTS_FOLDER = 'objects'
+# A full hash list is written after this many delta entries, bounding replay
+FULL_ENTRY_EVERY = 50
+
+
+def object_hash(annotation: Dict[str, Any]) -> str:
+    """Content hash of one annotation object"""
+    return hashlib.sha1(dumps(annotation, sort_keys=True)).hexdigest()
+
+
+class AnnotationHistory:
+    """Content-addressed history of image annotation sets.
+
+    Every annotation object is stored once under
+    ``history/objects/<hash[:2]>/<hash>.json``, keyed by the hash of its
+    canonical JSON. A version of an image is a line in
+    ``history/<image_id>.jsonl``. Snapshot saves write a full entry listing
+    the hashes (and ids) of all annotations; journaled annotation operations
+    write a delta entry with only the annotations they touched (``set`` as
+    ``[id, hash]`` pairs and ``removed`` ids), so a single edit costs O(1)
+    regardless of the number of annotations. Versions are rebuilt by
+    replaying deltas on top of the preceding full entry.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # versions file -> {'version': last version, 'deltas': delta entries since the last full one}
+        self._states: Dict[str, Dict[str, int]] = {}
+        self._known_objects: Dict[str, set] = {}
+
+    @staticmethod
+    def history_folder(project_folder: str) -> str:
+        return os.path.join(project_folder, HISTORY_FOLDER)
+
+    def _versions_file(self, project_folder: str, image_id: str) -> str:
+        return os.path.join(self.history_folder(project_folder), f"{image_id}.jsonl")
+
+    def _object_file(self, project_folder: str, digest: str) -> str:
+        return os.path.join(self.history_folder(project_folder), OBJECTS_FOLDER, digest[:2], f"{digest}.json")
+
+    def _state(self, versions_file: str) -> Dict[str, Any]:
+        state = self._states.get(versions_file)
+        if state is None:
+            entries = self._read_versions(versions_file)
+            deltas = 0
+            while deltas < len(entries) and entries[-1 - deltas].get('delta'):
+                deltas += 1
+            state = self._states[versions_file] = {
+                'version': entries[-1]['version'] if entries else None,
+                'deltas': deltas
+            }
+        return state
+
+    def _store_object(self, project_folder: str, digest: str, annotation: Dict[str, Any]):
+        known = self._known_objects.setdefault(project_folder, set())
+        if digest in known:
+            return
+        path = self._object_file(project_folder, digest)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # الكائن يُحدد بمحتواه، لذا لا حاجة لإعادة كتابته إن وُجد
+            write_file_atomic(path, dumps(annotation, sort_keys=True), fsync=False)
+        known.add(digest)
+
+    def record(self, image, ops: Optional[List[Dict[str, Any]]] = None) -> bool:
+        """Add the image's current annotations as a new version if they changed.
+
+        ``ops`` are the journal operations that led from the previous version
+        to this one; when given (and contiguous with it) only the annotations
+        they touched are hashed and a delta entry is written.
+        """
+        project_folder = image.project_folder
+        if not project_folder:
+            return False
+        versions_file = self._versions_file(project_folder, image.id)
+        with self._lock:
+            state = self._state(versions_file)
+            last = state['version']
+            if last is None and not image.annotations:
+                return False
+            if last is not None and image.annotations_version <= last:
+                return False
+
+            entry = {
+                'version': image.annotations_version,
+                'created_at': datetime.now().isoformat(),
+                'status': image.status
+            }
+            if ops and last is not None and ops[0].get('version') == last + 1 \
+                    and state['deltas'] < FULL_ENTRY_EVERY:
+                entry.update(self._delta(project_folder, image, ops))
+                state['deltas'] += 1
+            else:
+                hashes, ids = [], []
+                for annotation in image.annotations:
+                    digest = object_hash(annotation)
+                    self._store_object(project_folder, digest, annotation)
+                    hashes.append(digest)
+                    ids.append(annotation.get('id'))
+                entry['annotations'] = hashes
+                entry['ids'] = ids
+                state['deltas'] = 0
+
+            os.makedirs(os.path.dirname(versions_file), exist_ok=True)
+            with open(versions_file, 'ab') as f:
+                f.write(dumps(entry) + b'\n')
+            state['version'] = image.annotations_version
+            return True
+
+    def _delta(self, project_folder: str, image, ops: List[Dict[str, Any]]) -> Dict[str, Any]:
+        touched = {}
+        for op in ops:
+            annotation_id = op['annotation'].get('id') if op['op'] == 'add' else op.get('id')
+            touched[annotation_id] = None
+        current = {}
+        for annotation in image.annotations:
+            annotation_id = annotation.get('id')
+            if annotation_id in touched:
+                current[annotation_id] = annotation
+
+        changed, removed = [], []
+        for annotation_id in touched:
+            annotation = current.get(annotation_id)
+            if annotation is None:
+                removed.append(annotation_id)
+                continue
+            digest = object_hash(annotation)
+            self._store_object(project_folder, digest, annotation)
+            changed.append([annotation_id, digest])
+        return {'delta': True, 'set': changed, 'removed': removed}
+
+    @staticmethod
+    def _read_versions(versions_file: str) -> List[Dict[str, Any]]:
+        entries = []
+        try:
+            with open(versions_file, 'rb') as f:
+                for line in f:
+                    try:
+                        entries.append(loads(line))
+                    except ValueError:
+                        # سطر أخير غير مكتمل
+                        break
+        except FileNotFoundError:
+            pass
+        return entries
+
+    def _replay(self, project_folder: str, entries: List[Dict[str, Any]]):
+        """Yield (entry, hashes) for every entry, applying deltas in order"""
+        current: Dict[Any, str] = {}
+        for entry in entries:
+            if entry.get('delta'):
+                for annotation_id, digest in entry['set']:
+                    current[annotation_id] = digest
+                for annotation_id in entry['removed']:
+                    current.pop(annotation_id, None)
+            else:
+                hashes = entry['annotations']
+                ids = entry.get('ids')
+                if ids is None:
+                    # مدخلات قديمة بلا معرفات: تُقرأ المعرفات من الكائنات نفسها
+                    ids = [self._load_object(project_folder, digest).get('id') for digest in hashes]
+                current = {}
+                for position, (annotation_id, digest) in enumerate(zip(ids, hashes)):
+                    current[annotation_id if annotation_id is not None else ('#', position)] = digest
+            yield entry, list(current.values())
+
+    def list_versions(self, project_folder: str, image_id: str) -> List[Dict[str, Any]]:
+        """Get recorded versions of an image (oldest first), without annotations"""
+        entries = self._read_versions(self._versions_file(project_folder, image_id))
+        return [
+            {
+                'version': entry['version'],
+                'created_at': entry.get('created_at'),
+                'status': entry.get('status'),
+                'annotations_count': len(hashes)
+            }
+            for entry, hashes in self._replay(project_folder, entries)
+        ]
+
+    def _hashes(self, project_folder: str, image_id: str, version: int) -> List[str]:
+        entries = self._read_versions(self._versions_file(project_folder, image_id))
+        # الإعادة تبدأ من آخر مدخل كامل قبل النسخة المطلوبة
+        start = 0
+        for position, entry in enumerate(entries):
+            if entry['version'] > version:
+                break
+            if not entry.get('delta'):
+                start = position
+        for entry, hashes in self._replay(project_folder, entries[start:]):
+            if entry['version'] == version:
+                return hashes
+        raise ValueError(f"Version {version} not found")
+
+    def _load_object(self, project_folder: str, digest: str) -> Dict[str, Any]:
+        try:
+            with open(self._object_file(project_folder, digest), 'rb') as f:
+                return loads(f.read())
+        except FileNotFoundError:
+            raise ValueError(f"Annotation object {digest} is missing from history")
+
+    def get_annotations(self, project_folder: str, image_id: str, version: int) -> List[Dict[str, Any]]:
+        """Get the annotation list of a recorded version"""
+        return [self._load_object(project_folder, digest) for digest in self._hashes(project_folder, image_id, version)]
+
+    def diff(self, project_folder: str, image_id: str, from_version: int, to_version: int) -> Dict[str, Any]:
+        """Compare two versions by annotation id.
+
+        Only objects whose hash differs between the versions are loaded.
+        """
+        old_hashes = self._hashes(project_folder, image_id, from_version)
+        new_hashes = self._hashes(project_folder, image_id, to_version)
+        common = set(old_hashes) & set(new_hashes)
+
+        old = [self._load_object(project_folder, digest) for digest in old_hashes if digest not in common]
+        new = [self._load_object(project_folder, digest) for digest in new_hashes if digest not in common]
+        old_by_id = {annotation.get('id'): annotation for annotation in old}
+        new_by_id = {annotation.get('id'): annotation for annotation in new}
+
+        return {
+            'from_version': from_version,
+            'to_version': to_version,
+            'added': [annotation for annotation in new if annotation.get('id') not in old_by_id],
+            'removed': [annotation for annotation in old if annotation.get('id') not in new_by_id],
+            'changed': [
+                {'id': annotation_id, 'before': old_by_id[annotation_id], 'after': annotation}
+                for annotation_id, annotation in new_by_id.items() if annotation_id in old_by_id
+            ],
+            'unchanged_count': len(common)
+        }
+
+    def discard(self, project_folder: str, image_id: str):
+        """Remove version list of a deleted image (shared objects are kept)"""
+        versions_file = self._versions_file(project_folder, image_id)
+        with self._lock:
+            self._states.pop(versions_file, None)
+            if os.path.exists(versions_file):
+                os.remove(versions_file)
+
+    def forget(self, project_folder: str):
+        """Drop in-memory state for a project"""
+        with self._lock:
+            self._known_objects.pop(project_folder, None)
+            prefix = self.history_folder(project_folder) + os.sep
+            for versions_file in [path for path in self._states if path.startswith(prefix)]:
+                del self._states[versions_file]
+
+
+annotation_history = AnnotationHistory()
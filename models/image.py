@@ -1,10 +1,35 @@
 import os
-import json
 import uuid
 import shutil
+import hashlib
+import threading
 from datetime import datetime
 from typing import List, Optional, Dict, Any
 from PIL import Image as PILImage
+from models.persistence import json_store, dumps
+from models.annotation_record import AnnotationRecord, plain_dict
+from models.journal import annotation_journal
+from models.history import annotation_history
+from models.session import current_unit_of_work
+from models.manifest import ProjectManifest, statistics_key
+from models.sqlite_store import get_store
+from services.spatial_index import spatial_indexes
+from services.annotation_columns import AnnotationColumns, LabelDictionary
+
+_annotation_locks: Dict[tuple, threading.Lock] = {}
+_annotation_locks_guard = threading.Lock()
+
+
+def _merged_counts(counts: Dict[str, int], delta: Dict[str, int]) -> Dict[str, int]:
+    merged = dict(counts)
+    for key, change in delta.items():
+        total = merged.get(key, 0) + change
+        if total:
+            merged[key] = total
+        else:
+            merged.pop(key, None)
+    return merged
+
 
 class Image:
     def __init__(self, project_id: str, filename: str, original_path: str = ""):
@@ -15,18 +40,33 @@ class Image:
         self.status = 'unprocessed'  # unprocessed, processed, annotated, completed
         self.width = 0
         self.height = 0
+        self.original_width = 0  # dimensions of the stored original (width/height become 640 once processed)
+        self.original_height = 0
         self.file_size = 0
         self.created_at = datetime.now().isoformat()
         self.updated_at = datetime.now().isoformat()
+        self.original_file = ''  # relative to project folder, e.g. original_images/<id>.jpg
+        self.original_ext = ''
         self.processing_settings = {}
         self.annotations = []
+        self.annotations_version = 0  # bumped on every annotation change
+        self._project_folder = None
+        self._journal_seq = 0  # last journal operation contained in this state
+        self._pending_ops = []  # annotation operations not yet appended to the journal
+        self._needs_snapshot = False
+        self._summary_delta = None  # changes to the manifest row since the last save
+        self._log_manifest_row = False
     
     @property
     def project_folder(self):
         """Get project folder from project_id"""
-        from models.project import Project
-        project = Project.load(self.project_id)
-        return project.project_folder if project else None
+        # مجلد المشروع ثابت طوال عمر المشروع، لذا يُحفظ بعد أول تحميل
+        if self._project_folder is None:
+            from models.project import Project
+            project = Project.load(self.project_id)
+            if project:
+                self._project_folder = project.project_folder
+        return self._project_folder
     
     @property
     def original_image_path(self):
@@ -35,11 +75,15 @@ class Image:
         if not project_folder:
             return None
         
-        # ابحث عن أي ملف صورة يحمل نفس ID
+        # المسار المحفوظ في سجل الصورة لا يتطلب قراءة المجلد
+        if self.original_file:
+            return os.path.join(project_folder, self.original_file)
+        
+        # سجلات قديمة لم تُرحّل بعد: ابحث عن أي ملف صورة يحمل نفس ID
         original_images_dir = os.path.join(project_folder, 'original_images')
         if os.path.exists(original_images_dir):
             for file in os.listdir(original_images_dir):
-                if file.startswith(self.id) and file.lower().endswith(('.jpg', '.jpeg', '.png', '.tiff', '.tif', '.webp', '.bmp')):
+                if os.path.splitext(file)[0] == self.id and file.lower().endswith(('.jpg', '.jpeg', '.png', '.tiff', '.tif', '.webp', '.bmp')):
                     return os.path.join(original_images_dir, file)
         
         # إذا لم يتم العثور على ملف، أنشئ مساراً افتراضياً
@@ -75,11 +119,106 @@ class Image:
         if not self.annotations_file:
             return False
         
+        self._needs_snapshot = True
+        return self._save_changes()
+    
+    def _save_changes(self):
+        manifest = self.manifest
+        summary = self._incremental_summary(manifest.get(self.id))
+        self._summary_delta = None
+        # الصف المحدّث تدريجياً يُلحق بسجل الملخص عند كتابة الصورة بدل إعادة كتابة الملخص كاملاً
+        self._log_manifest_row = summary is not None
+        if summary is None:
+            summary = self.to_summary()
+        previous = manifest.put(summary)
+        if not self._log_manifest_row:
+            manifest.save()
+        if statistics_key(previous) != statistics_key(summary):
+            self._update_project_statistics(manifest)
+        
+        uow = current_unit_of_work()
+        if uow is not None:
+            uow.register_dirty(('image', self.project_id, self.id), self)
+            return True
+        
+        return self._write()
+    
+    def _incremental_summary(self, previous: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+        """Derive the manifest row from the previous one and the staged annotation changes.
+
+        Returns None when a full ``to_summary()`` is needed (snapshot save,
+        unknown or out-of-date previous row).
+        """
+        delta = self._summary_delta
+        if self._needs_snapshot or delta is None or previous is None \
+                or previous.get('annotations_version', 0) + delta['ops'] != self.annotations_version:
+            return None
+        row = dict(previous)
+        row['status'] = self.status
+        row['annotations_count'] = previous.get('annotations_count', 0) + delta['count']
+        row['annotation_levels'] = _merged_counts(previous.get('annotation_levels', {}), delta['levels'])
+        row['annotation_labels'] = _merged_counts(previous.get('annotation_labels', {}), delta['labels'])
+        row['annotations_version'] = self.annotations_version
+        row['updated_at'] = self.updated_at
+        return row
+    
+    def _count_annotation(self, annotation: Dict[str, Any], sign: int):
+        """Track an annotation entering (+1) or leaving (-1) the summary histograms"""
+        delta = self._summary_delta
+        if delta is None:
+            delta = self._summary_delta = {'ops': 0, 'count': 0, 'levels': {}, 'labels': {}}
+        delta['count'] += sign
+        level = str(annotation.get('level', 'unknown'))
+        label = str(annotation.get('label', 'unlabeled'))
+        delta['levels'][level] = delta['levels'].get(level, 0) + sign
+        delta['labels'][label] = delta['labels'].get(label, 0) + sign
+    
+    def _write(self):
+        """Write image metadata and annotations to disk, then record the annotation history"""
+        # عمليات السجل تكفي لتسجيل نسخة جزئية ما لم يُطلب حفظ كامل
+        ops = None if self._needs_snapshot else list(self._pending_ops)
+        self._write_record()
+        if self._log_manifest_row:
+            self._log_manifest_row = False
+            self.manifest.log_row(self.id)
+        try:
+            annotation_history.record(self, ops)
+        except Exception as e:
+            print(f"Error recording annotation history for {self.id}: {e}")
+        return True
+    
+    def _rollback(self):
+        """Drop the cached spatial index, which may hold the discarded edits"""
+        spatial_indexes.invalidate(self.project_id, self.id)
+    
+    def _write_record(self):
+        store = get_store()
+        if store is None and self._pending_ops and not self._needs_snapshot \
+                and json_store.exists(self.annotations_file):
+            # تعديل التوسيمات يُلحق سطراً بالسجل بدل إعادة كتابة الملف كاملاً
+            self._journal_seq = annotation_journal.append(self.annotations_file, self._pending_ops)
+            self._pending_ops = []
+            return True
+        
+        self._pending_ops = []
+        self._needs_snapshot = False
+        data = self.to_record()
+        
+        if store is not None:
+            store.save_image(data, self.to_summary())
+            return True
+        
         # Ensure annotations directory exists
         os.makedirs(os.path.dirname(self.annotations_file), exist_ok=True)
         
-        # Save image metadata and annotations
-        data = {
+        json_store.write(self.annotations_file, data)
+        annotation_journal.snapshot_written(self.annotations_file)
+        
+        return True
+    
+    def to_record(self) -> Dict[str, Any]:
+        """Get persisted image metadata and annotations"""
+        return {
             'id': self.id,
             'project_id': self.project_id,
             'filename': self.filename,
@@ -87,80 +226,165 @@ class Image:
             'status': self.status,
             'width': self.width,
             'height': self.height,
+            'original_width': self.original_width,
+            'original_height': self.original_height,
             'file_size': self.file_size,
+            'original_file': self.original_file,
+            'original_ext': self.original_ext,
             'created_at': self.created_at,
             'updated_at': self.updated_at,
             'processing_settings': self.processing_settings,
-            'annotations': self.annotations
+            'annotations': [plain_dict(annotation) for annotation in self.annotations],
+            'annotations_version': self.annotations_version,
+            'journal_seq': self._journal_seq
         }
+    
+    @classmethod
+    def load_from_file(cls, annotations_file: str, project_folder: str = None) -> Optional['Image']:
+        """Load image from its annotations file"""
+        try:
+            data = json_store.read(annotations_file)
+            if not data:
+                return None
+            return cls.from_record(annotation_journal.replay(annotations_file, data), project_folder)
+        except Exception as e:
+            print(f"Error loading image from {annotations_file}: {e}")
+            return None
+    
+    @classmethod
+    def from_record(cls, data: Dict[str, Any], project_folder: str = None) -> 'Image':
+        """Create image from persisted record"""
+        image = cls(
+            project_id=data['project_id'],
+            filename=data['filename'],
+            original_path=data.get('original_path', '')
+        )
         
-        with open(self.annotations_file, 'w', encoding='utf-8') as f:
-            json.dump(data, f, indent=2, ensure_ascii=False)
+        image.id = data['id']
+        image.status = data.get('status', 'unprocessed')
+        image.width = data.get('width', 0)
+        image.height = data.get('height', 0)
+        image.original_width = data.get('original_width', 0)
+        image.original_height = data.get('original_height', 0)
+        image.file_size = data.get('file_size', 0)
+        image.original_file = data.get('original_file', '')
+        image.original_ext = data.get('original_ext', '')
+        image.created_at = data['created_at']
+        image.updated_at = data['updated_at']
+        image.processing_settings = data.get('processing_settings', {})
+        image.annotations = [AnnotationRecord.from_dict(annotation) for annotation in data.get('annotations', [])]
+        image.annotations_version = data.get('annotations_version', 0)
+        image._journal_seq = data.get('journal_seq', 0)
+        image._project_folder = project_folder
         
-        return True
+        return image
     
     @classmethod
     def load(cls, project_id: str, image_id: str) -> Optional['Image']:
         """Load specific image"""
+        uow = current_unit_of_work()
+        if uow is not None:
+            image = uow.get(('image', project_id, image_id))
+            if image is not None:
+                return image
+        
         from models.project import Project
         project = Project.load(project_id)
         if not project:
             return None
         
-        annotations_file = os.path.join(project.annotations_folder, f"{image_id}.json")
+        store = get_store()
+        if store is not None:
+            try:
+                data = store.load_image(project_id, image_id)
+                image = cls.from_record(data, project.project_folder) if data else None
+            except Exception as e:
+                print(f"Error loading image {image_id} from database: {e}")
+                image = None
+        else:
+            annotations_file = os.path.join(project.annotations_folder, f"{image_id}.json")
+            if not json_store.exists(annotations_file):
+                return None
+            image = cls.load_from_file(annotations_file, project.project_folder)
         
-        if not os.path.exists(annotations_file):
-            return None
+        if image and uow is not None:
+            uow.add(('image', project_id, image_id), image)
         
-        try:
-            with open(annotations_file, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-            
-            image = cls(
-                project_id=data['project_id'],
-                filename=data['filename'],
-                original_path=data.get('original_path', '')
-            )
-            
-            image.id = data['id']
-            image.status = data.get('status', 'unprocessed')
-            image.width = data.get('width', 0)
-            image.height = data.get('height', 0)
-            image.file_size = data.get('file_size', 0)
-            image.created_at = data['created_at']
-            image.updated_at = data['updated_at']
-            image.processing_settings = data.get('processing_settings', {})
-            image.annotations = data.get('annotations', [])
-            
-            return image
-        except Exception as e:
-            print(f"Error loading image {image_id}: {e}")
-            return None
+        return image
     
     @classmethod
     def load_all_for_project(cls, project_id: str) -> List['Image']:
-        """Load all images for a project"""
+        """Load all images for a project (full records, including annotations)"""
+        images = []
+        for row in cls.list_summaries(project_id):
+            image = cls.load(project_id, row['id'])
+            if image:
+                images.append(image)
+        return images
+    
+    @classmethod
+    def get_manifest(cls, project_id: str) -> Optional[ProjectManifest]:
+        """Get image manifest for a project"""
         from models.project import Project
         project = Project.load(project_id)
         if not project:
+            return None
+        store = get_store()
+        if store is not None:
+            return store.manifest(project_id)
+        return ProjectManifest.for_folder(project.project_folder)
+    
+    @classmethod
+    def list_summaries(cls, project_id: str, statuses: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+        """Get image summary rows (sorted by created_at) without loading annotations"""
+        manifest = cls.get_manifest(project_id)
+        if manifest is None:
             return []
+        return manifest.ordered_rows(statuses)
+    
+    @property
+    def manifest(self) -> ProjectManifest:
+        """Get manifest of the image's project"""
+        store = get_store()
+        if store is not None:
+            return store.manifest(self.project_id)
+        return ProjectManifest.for_folder(self.project_folder)
+    
+    def delete(self):
+        """Delete image files and remove it from the project manifest"""
+        files_to_delete = [
+            self.original_image_path,
+            self.processed_image_path,
+            self.thumbnail_path,
+            self.annotations_file
+        ]
         
-        images = []
-        annotations_folder = project.annotations_folder
-        
-        if not os.path.exists(annotations_folder):
-            return images
+        json_store.discard(self.annotations_file)
+        annotation_journal.discard(self.annotations_file)
+        if self.project_folder:
+            annotation_history.discard(self.project_folder, self.id)
+        for file_path in files_to_delete:
+            if file_path and os.path.exists(file_path):
+                try:
+                    os.remove(file_path)
+                except Exception as e:
+                    print(f"Warning: Failed to delete {file_path}: {e}")
         
-        for filename in os.listdir(annotations_folder):
-            if filename.endswith('.json'):
-                image_id = filename[:-5]  # Remove .json extension
-                image = cls.load(project_id, image_id)
-                if image:
-                    images.append(image)
+        manifest = self.manifest
+        if manifest.remove(self.id) is not None:
+            self._update_project_statistics(manifest)
+        manifest.save()
         
-        # Sort by created_at
-        images.sort(key=lambda x: x.created_at)
-        return images
+        uow = current_unit_of_work()
+        if uow is not None:
+            uow.discard(('image', self.project_id, self.id))
+    
+    def _update_project_statistics(self, manifest):
+        """Refresh project statistics after this image entered, left or changed status"""
+        from models.project import Project
+        project = Project.load(self.project_id)
+        if project:
+            project.update_statistics(manifest)
     
     def update_status(self, new_status: str):
         """Update image status and save"""
@@ -170,63 +394,209 @@ class Image:
         
         self.status = new_status
         self.save()
-        
-        # Update project statistics
-        from models.project import Project
-        project = Project.load(self.project_id)
-        if project:
-            project.update_statistics()
     
     def add_annotation(self, annotation: Dict[str, Any]):
         """Add annotation to image"""
+        self._add_annotation(annotation)
+        self._save_changes()
+    
+    def update_annotation(self, annotation_id: str, annotation_data: Dict[str, Any]):
+        """Update specific annotation"""
+        if not self._update_annotation(annotation_id, annotation_data):
+            return False
+        self._save_changes()
+        return True
+    
+    def delete_annotation(self, annotation_id: str):
+        """Delete specific annotation"""
+        if not self._delete_annotation(annotation_id):
+            return False
+        self._save_changes()
+        return True
+    
+    def apply_annotation_batch(self, operations: List[Dict[str, Any]]) -> Dict[str, str]:
+        """Apply ordered add/update/delete operations with a single save.
+
+        Added annotations may carry a ``client_id``; later operations in the
+        same batch can refer to them by it. Returns client_id -> new ID.
+        Raises ValueError (before changing anything) if an operation is
+        invalid or refers to an unknown annotation.
+        """
+        known_ids = {annotation.get('id') for annotation in self.annotations}
+        client_ids = set()
+        for index, operation in enumerate(operations):
+            kind = operation.get('op')
+            if kind == 'add':
+                if not isinstance(operation.get('annotation'), dict):
+                    raise ValueError(f"Operation {index}: add requires an annotation object")
+                if operation.get('client_id'):
+                    client_ids.add(operation['client_id'])
+            elif kind in ('update', 'delete'):
+                target = operation.get('id')
+                if target not in known_ids and target not in client_ids:
+                    raise ValueError(f"Operation {index}: annotation {target} not found")
+                if kind == 'update' and not isinstance(operation.get('annotation'), dict):
+                    raise ValueError(f"Operation {index}: update requires an annotation object")
+                if kind == 'delete':
+                    known_ids.discard(target)
+                    client_ids.discard(target)
+            else:
+                raise ValueError(f"Operation {index}: unknown op {kind}")
+        
+        id_map = {}
+        for operation in operations:
+            kind = operation['op']
+            if kind == 'add':
+                annotation = dict(operation['annotation'])
+                annotation.pop('client_id', None)
+                self._add_annotation(annotation)
+                if operation.get('client_id'):
+                    id_map[operation['client_id']] = annotation['id']
+            else:
+                target = id_map.get(operation['id'], operation['id'])
+                if kind == 'update':
+                    self._update_annotation(target, operation['annotation'])
+                else:
+                    self._delete_annotation(target)
+        
+        if operations:
+            self._save_changes()
+        return id_map
+    
+    def _stage_annotation_op(self, op: Dict[str, Any], annotation: Optional[Dict[str, Any]] = None):
+        """Queue one annotation change as a journal operation"""
+        self.updated_at = datetime.now().isoformat()
+        self.annotations_version += 1
+        op['version'] = self.annotations_version
+        op['status'] = self.status
+        op['updated_at'] = self.updated_at
+        self._pending_ops.append(op)
+        if self._summary_delta is None:
+            self._summary_delta = {'ops': 0, 'count': 0, 'levels': {}, 'labels': {}}
+        self._summary_delta['ops'] += 1
+        spatial_indexes.apply_op(self.project_id, self.id, op, annotation)
+    
+    @staticmethod
+    def annotations_lock(project_id: str, image_id: str) -> threading.Lock:
+        """Lock serialising versioned annotation saves of one image"""
+        with _annotation_locks_guard:
+            lock = _annotation_locks.get((project_id, image_id))
+            if lock is None:
+                lock = _annotation_locks[(project_id, image_id)] = threading.Lock()
+            return lock
+    
+    @staticmethod
+    def hash_annotations(annotations: List[Dict[str, Any]]) -> str:
+        """Content hash of an annotation list"""
+        return hashlib.sha1(dumps(list(annotations), sort_keys=True)).hexdigest()
+    
+    def replace_annotations(self, annotations: List[Dict[str, Any]]) -> bool:
+        """Replace all annotations; returns False (and writes nothing) if unchanged"""
+        if self.hash_annotations(annotations) == self.hash_annotations(self.annotations):
+            return False
+        
+        self.annotations = [AnnotationRecord.from_dict(annotation) for annotation in annotations]
+        self.annotations_version += 1
+        # لا توجد عملية تُطبق على الفهرس المكاني؛ يُعاد بناؤه عند أول استعلام
+        spatial_indexes.invalidate(self.project_id, self.id)
+        
+        # Update status based on annotations
+        if annotations:
+            if self.status == 'processed':
+                self.status = 'annotated'
+        else:
+            if self.status == 'annotated':
+                self.status = 'processed'
+        
+        self.save()
+        return True
+    
+    def apply_annotation_delta(self, added: List[Dict[str, Any]], updated: List[Dict[str, Any]],
+                               removed: List[str]) -> Dict[str, str]:
+        """Apply a delta (added/updated annotations, removed IDs); returns client ID -> new ID"""
+        operations = [{'op': 'delete', 'id': annotation_id} for annotation_id in removed]
+        operations += [
+            {'op': 'update', 'id': annotation.get('id'), 'annotation': annotation}
+            for annotation in updated
+        ]
+        operations += [
+            {'op': 'add', 'client_id': annotation.get('id'), 'annotation': annotation}
+            for annotation in added
+        ]
+        return self.apply_annotation_batch(operations)
+    
+    def write_now(self):
+        """Write pending changes immediately instead of at the end of the unit of work"""
+        self._write()
+        uow = current_unit_of_work()
+        if uow is not None:
+            uow.mark_clean(('image', self.project_id, self.id))
+    
+    def _add_annotation(self, annotation: Dict[str, Any]) -> AnnotationRecord:
         annotation['id'] = str(uuid.uuid4())
         annotation['created_at'] = datetime.now().isoformat()
+        annotation = AnnotationRecord.from_dict(annotation)
         self.annotations.append(annotation)
+        self._count_annotation(annotation, 1)
         
         # Update status to annotated if not already completed
         if self.status == 'processed':
             self.status = 'annotated'
         
-        self.save()
+        self._stage_annotation_op({'op': 'add', 'annotation': annotation}, annotation)
+        return annotation
     
-    def update_annotation(self, annotation_id: str, annotation_data: Dict[str, Any]):
-        """Update specific annotation"""
+    def _update_annotation(self, annotation_id: str, annotation_data: Dict[str, Any]) -> bool:
         for i, annotation in enumerate(self.annotations):
             if annotation.get('id') == annotation_id:
+                self._count_annotation(annotation, -1)
                 annotation.update(annotation_data)
+                self._count_annotation(annotation, 1)
                 annotation['updated_at'] = datetime.now().isoformat()
                 self.annotations[i] = annotation
-                self.save()
+                self._stage_annotation_op({
+                    'op': 'update',
+                    'id': annotation_id,
+                    'data': {**annotation_data, 'updated_at': annotation['updated_at']}
+                }, annotation)
                 return True
         return False
     
-    def delete_annotation(self, annotation_id: str):
-        """Delete specific annotation"""
-        original_count = len(self.annotations)
-        self.annotations = [ann for ann in self.annotations if ann.get('id') != annotation_id]
+    def _delete_annotation(self, annotation_id: str) -> bool:
+        kept = []
+        for ann in self.annotations:
+            if ann.get('id') == annotation_id:
+                self._count_annotation(ann, -1)
+            else:
+                kept.append(ann)
+        if len(kept) == len(self.annotations):
+            return False
+        self.annotations = kept
         
         # Update status if no annotations left
-        if len(self.annotations) == 0 and original_count > 0:
+        if len(self.annotations) == 0:
             if self.status in ['annotated', 'completed']:
                 self.status = 'processed'
         
-        self.save()
-        return len(self.annotations) != original_count
+        self._stage_annotation_op({'op': 'delete', 'id': annotation_id})
+        return True
     
-    def get_display_image_path(self):
+    def get_display_image_path(self, processed_exists: Optional[bool] = None):
         """Get the image path for display (processed if available, otherwise original)"""
+        if processed_exists is None:
+            processed_exists = os.path.exists(self.processed_image_path)
         # عرض الصورة المعالجة متى ما كانت موجودة لتجنب العودة للأصلية بسبب تأخير تحديث الحالة
-        if os.path.exists(self.processed_image_path):
+        if processed_exists:
             return f"/api/images/{self.project_id}/{self.id}/processed"
         elif os.path.exists(self.original_image_path):
             return f"/api/images/{self.project_id}/{self.id}/original"
         return None
     
-    def get_thumbnail_path(self):
+    def get_thumbnail_path(self, display_path: Optional[str] = None):
         """Get thumbnail path for display"""
         if os.path.exists(self.thumbnail_path):
             return f"/api/images/{self.project_id}/{self.id}/thumbnail"
-        return self.get_display_image_path()
+        return display_path if display_path is not None else self.get_display_image_path()
     
     def copy_from_external_path(self, external_path: str):
         """Copy image from external path to project folder and convert to JPEG"""
@@ -234,6 +604,9 @@ class Image:
             return False
         
         try:
+            # Originals are always stored as JPEG; record the path so it never has to be searched for
+            self.set_original_file(f"{self.id}.jpg")
+            
             # Ensure destination directory exists
             dest_path = self.original_image_path
             os.makedirs(os.path.dirname(dest_path), exist_ok=True)
@@ -252,8 +625,8 @@ class Image:
                     pil_img = pil_img.convert('RGB')
                 
                 # Store image dimensions
-                self.width = pil_img.width
-                self.height = pil_img.height
+                self.width = self.original_width = pil_img.width
+                self.height = self.original_height = pil_img.height
                 
                 # Save as JPEG with high quality
                 pil_img.save(dest_path, 'JPEG', quality=95, optimize=True)
@@ -272,6 +645,11 @@ class Image:
             print(f"Error copying and converting image from {external_path}: {e}")
             return False
     
+    def set_original_file(self, filename: str):
+        """Record original image file name (inside original_images/)"""
+        self.original_file = f"original_images/{filename}"
+        self.original_ext = os.path.splitext(filename)[1].lower()
+    
     def _generate_thumbnail(self, max_size: tuple = (300, 300)):
         """Generate thumbnail for image"""
         try:
@@ -295,27 +673,103 @@ class Image:
         """Get count of annotations by level"""
         counts = {}
         for annotation in self.annotations:
-            level = annotation.get('level', 'unknown')
+            level = str(annotation.get('level', 'unknown'))
             counts[level] = counts.get(level, 0) + 1
         return counts
     
+    def get_annotation_count_by_label(self):
+        """Get count of annotations by label"""
+        counts = {}
+        for annotation in self.annotations:
+            label = str(annotation.get('label', 'unlabeled'))
+            counts[label] = counts.get(label, 0) + 1
+        return counts
+    
+    def get_annotation_columns(self, labels: Optional[LabelDictionary] = None) -> AnnotationColumns:
+        """Get columnar (NumPy) view of the annotations, with label IDs from labels"""
+        return AnnotationColumns(self.annotations, labels)
+    
     def get_file_size_mb(self):
         """Get file size in MB"""
         if self.file_size > 0:
             return round(self.file_size / (1024 * 1024), 2)
         return 0
     
-    def is_ready_for_annotation(self):
+    def is_ready_for_annotation(self, processed_exists: Optional[bool] = None):
         """Check if image is ready for annotation (processed but not completed)"""
+        if self.status not in ['processed', 'annotated']:
+            return False
         # جاهز للترسيم إذا كان الملف المعالج موجود والحالة مناسبة
-        return os.path.exists(self.processed_image_path) and self.status in ['processed', 'annotated']
+        if processed_exists is None:
+            processed_exists = os.path.exists(self.processed_image_path)
+        return processed_exists
     
     def is_annotation_complete(self):
         """Check if image annotation is complete"""
         return self.status in ['annotated', 'completed'] and len(self.annotations) > 0
     
+    def to_summary(self) -> Dict[str, Any]:
+        """Build manifest summary row for this image"""
+        return {
+            'id': self.id,
+            'project_id': self.project_id,
+            'filename': self.filename,
+            'original_path': self.original_path,
+            'status': self.status,
+            'width': self.width,
+            'height': self.height,
+            'file_size': self.file_size,
+            'original_file': self.original_file,
+            'annotations_count': len(self.annotations),
+            'annotation_levels': self.get_annotation_count_by_level(),
+            'annotation_labels': self.get_annotation_count_by_label(),
+            'annotations_version': self.annotations_version,
+            'has_original': os.path.exists(self.original_image_path),
+            'has_processed': os.path.exists(self.processed_image_path),
+            'has_thumbnail': os.path.exists(self.thumbnail_path),
+            'created_at': self.created_at,
+            'updated_at': self.updated_at
+        }
+    
+    @staticmethod
+    def summary_to_dict(row: Dict[str, Any]) -> Dict[str, Any]:
+        """Convert manifest row to the list representation used by the API"""
+        base_url = f"/api/images/{row['project_id']}/{row['id']}"
+        if row.get('has_processed'):
+            display_path = f"{base_url}/processed"
+        elif row.get('has_original'):
+            display_path = f"{base_url}/original"
+        else:
+            display_path = None
+        
+        file_size = row.get('file_size', 0)
+        status = row.get('status')
+        return {
+            'id': row['id'],
+            'project_id': row['project_id'],
+            'filename': row['filename'],
+            'original_path': row.get('original_path', ''),
+            'status': status,
+            'width': row.get('width', 0),
+            'height': row.get('height', 0),
+            'file_size': file_size,
+            'file_size_mb': round(file_size / (1024 * 1024), 2) if file_size > 0 else 0,
+            'created_at': row.get('created_at'),
+            'updated_at': row.get('updated_at'),
+            'annotations_count': row.get('annotations_count', 0),
+            'annotation_levels': row.get('annotation_levels', {}),
+            'annotations_version': row.get('annotations_version', 0),
+            'display_path': display_path,
+            'thumbnail_path': f"{base_url}/thumbnail" if row.get('has_thumbnail') else display_path,
+            'ready_for_annotation': bool(row.get('has_processed')) and status in ['processed', 'annotated'],
+            'annotation_complete': status in ['annotated', 'completed'] and row.get('annotations_count', 0) > 0
+        }
+    
     def to_dict(self, include_annotations: bool = False):
         """Convert image to dictionary"""
+        processed_exists = os.path.exists(self.processed_image_path)
+        display_path = self.get_display_image_path(processed_exists)
+        
         data = {
             'id': self.id,
             'project_id': self.project_id,
@@ -324,6 +778,8 @@ class Image:
             'status': self.status,
             'width': self.width,
             'height': self.height,
+            'original_width': self.original_width,
+            'original_height': self.original_height,
             'file_size': self.file_size,
             'file_size_mb': self.get_file_size_mb(),
             'created_at': self.created_at,
@@ -331,13 +787,14 @@ class Image:
             'processing_settings': self.processing_settings,
             'annotations_count': len(self.annotations),
             'annotation_levels': self.get_annotation_count_by_level(),
-            'display_path': self.get_display_image_path(),
-            'thumbnail_path': self.get_thumbnail_path(),
-            'ready_for_annotation': self.is_ready_for_annotation(),
-            'annotation_complete': self.is_annotation_complete()
+            'display_path': display_path,
+            'thumbnail_path': self.get_thumbnail_path(display_path),
+            'ready_for_annotation': self.is_ready_for_annotation(processed_exists),
+            'annotation_complete': self.is_annotation_complete(),
+            'annotations_version': self.annotations_version
         }
         
         if include_annotations:
-            data['annotations'] = self.annotations
+            data['annotations'] = [plain_dict(annotation) for annotation in self.annotations]
         
         return data
@@ -0,0 +1,225 @@
+import os
+import threading
+from typing import Any, Dict, List, Optional
+
+from models.persistence import json_store, dumps, loads
+
+JOURNAL_SUFFIX = '.log'
+# Fold a journal into its snapshot once it holds this many operations
+COMPACT_THRESHOLD = 200
+
+
+def journal_path(annotations_file: str) -> str:
+    """Get journal path for an image annotations file"""
+    return os.path.splitext(annotations_file)[0] + JOURNAL_SUFFIX
+
+
+def apply_ops(data: Dict[str, Any], ops: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Apply journal operations to an image record in place.
+
+    Operations are idempotent (add replaces an annotation with the same id,
+    update/delete of a missing id is a no-op), so replaying an operation
+    that is already part of the snapshot is harmless.
+    """
+    annotations = data.setdefault('annotations', [])
+    for op in ops:
+        kind = op.get('op')
+        if kind == 'add':
+            annotation = op['annotation']
+            for i, existing in enumerate(annotations):
+                if existing.get('id') == annotation.get('id'):
+                    annotations[i] = annotation
+                    break
+            else:
+                annotations.append(annotation)
+        elif kind == 'update':
+            for annotation in annotations:
+                if annotation.get('id') == op['id']:
+                    annotation.update(op['data'])
+                    break
+        elif kind == 'delete':
+            annotations[:] = [ann for ann in annotations if ann.get('id') != op['id']]
+
+        if 'version' in op:
+            data['annotations_version'] = op['version']
+        if 'status' in op:
+            data['status'] = op['status']
+        if 'updated_at' in op:
+            data['updated_at'] = op['updated_at']
+        data['journal_seq'] = max(data.get('journal_seq', 0), op.get('seq', 0))
+    return data
+
+
+def _snapshot_seq_on_disk(annotations_file: str) -> int:
+    """Read journal_seq from the snapshot file itself, bypassing queued writes"""
+    try:
+        with open(annotations_file, 'rb') as f:
+            return loads(f.read()).get('journal_seq', 0)
+    except (OSError, ValueError):
+        return -1
+
+
+class AnnotationJournal:
+    """Append-only per-image log of annotation operations.
+
+    Adding, updating or deleting one annotation appends a single line to
+    ``annotations/<image_id>.log`` instead of rewriting the image record.
+    Each operation carries a sequence number; the snapshot stores the last
+    sequence number it contains (``journal_seq``), and readers replay only
+    newer operations. A background thread folds long journals back into
+    the snapshot.
+    """
+
+    def __init__(self, compact_threshold: int = COMPACT_THRESHOLD):
+        self.compact_threshold = compact_threshold
+        self._lock = threading.Lock()
+        self._path_locks: Dict[str, threading.RLock] = {}
+        self._last_seq: Dict[str, int] = {}
+        self._op_counts: Dict[str, int] = {}
+        self._queue: List[str] = []
+        self._cond = threading.Condition(self._lock)
+        self._thread: Optional[threading.Thread] = None
+
+    def _path_lock(self, annotations_file: str) -> threading.RLock:
+        with self._lock:
+            lock = self._path_locks.get(annotations_file)
+            if lock is None:
+                lock = self._path_locks[annotations_file] = threading.RLock()
+            return lock
+
+    def read_ops(self, annotations_file: str, after_seq: int = 0) -> List[Dict[str, Any]]:
+        """Read journal operations newer than after_seq"""
+        ops = []
+        try:
+            with open(journal_path(annotations_file), 'rb') as f:
+                for line in f:
+                    try:
+                        op = loads(line)
+                    except ValueError:
+                        # سطر أخير غير مكتمل بسبب توقف مفاجئ أثناء الكتابة
+                        break
+                    if op.get('seq', 0) > after_seq:
+                        ops.append(op)
+        except FileNotFoundError:
+            pass
+        return ops
+
+    def replay(self, annotations_file: str, data: Dict[str, Any]) -> Dict[str, Any]:
+        """Apply pending journal operations to a snapshot record"""
+        ops = self.read_ops(annotations_file, data.get('journal_seq', 0))
+        if ops:
+            apply_ops(data, ops)
+        return data
+
+    def _current_seq(self, annotations_file: str) -> int:
+        seq = self._last_seq.get(annotations_file)
+        if seq is None:
+            snapshot = json_store.read(annotations_file) or {}
+            seq = snapshot.get('journal_seq', 0)
+            ops = self.read_ops(annotations_file, seq)
+            if ops:
+                seq = ops[-1]['seq']
+            self._op_counts[annotations_file] = len(ops)
+        return seq
+
+    def last_seq(self, annotations_file: str) -> int:
+        """Get sequence number of the newest operation for an image"""
+        with self._path_lock(annotations_file):
+            return self._current_seq(annotations_file)
+
+    def append(self, annotations_file: str, ops: List[Dict[str, Any]]) -> int:
+        """Append operations to the image journal; returns the last sequence number"""
+        with self._path_lock(annotations_file):
+            seq = self._current_seq(annotations_file)
+            lines = []
+            for op in ops:
+                seq += 1
+                lines.append(dumps({**op, 'seq': seq}) + b'\n')
+            with open(journal_path(annotations_file), 'ab') as f:
+                f.write(b''.join(lines))
+            self._last_seq[annotations_file] = seq
+            count = self._op_counts.get(annotations_file, 0) + len(ops)
+            self._op_counts[annotations_file] = count
+
+        if count >= self.compact_threshold:
+            self.schedule_compaction(annotations_file)
+        return seq
+
+    def snapshot_written(self, annotations_file: str):
+        """Note that a full snapshot containing every operation was queued"""
+        with self._path_lock(annotations_file):
+            has_journal = os.path.exists(journal_path(annotations_file))
+        if has_journal:
+            self.schedule_compaction(annotations_file)
+
+    def schedule_compaction(self, annotations_file: str):
+        """Queue journal for background compaction"""
+        with self._cond:
+            if annotations_file not in self._queue:
+                self._queue.append(annotations_file)
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='annotation-compactor', daemon=True)
+                self._thread.start()
+            self._cond.notify()
+
+    def compact(self, annotations_file: str):
+        """Fold the journal into the snapshot and remove it"""
+        with self._path_lock(annotations_file):
+            log_file = journal_path(annotations_file)
+            if not os.path.exists(log_file):
+                return
+            data = json_store.read(annotations_file)
+            if data is None:
+                # Image was deleted
+                os.remove(log_file)
+                self.forget(annotations_file)
+                return
+
+            self.replay(annotations_file, data)
+            data['journal_seq'] = max(data.get('journal_seq', 0), self._current_seq(annotations_file))
+            json_store.write(annotations_file, data)
+            # اللقطة يجب أن تكون على القرص قبل حذف السجل (flush يرفع خطأ الكتابة)
+            json_store.flush(annotations_file)
+            if _snapshot_seq_on_disk(annotations_file) < data['journal_seq']:
+                raise IOError(f"Snapshot {annotations_file} is behind its journal, keeping the log")
+            os.remove(log_file)
+            self._last_seq[annotations_file] = data['journal_seq']
+            self._op_counts[annotations_file] = 0
+
+    def compact_folder(self, annotations_folder: str):
+        """Compact every journal in an annotations folder"""
+        if not os.path.exists(annotations_folder):
+            return
+        for filename in os.listdir(annotations_folder):
+            if filename.endswith(JOURNAL_SUFFIX):
+                name = os.path.splitext(filename)[0]
+                self.compact(os.path.join(annotations_folder, f"{name}.json"))
+
+    def discard(self, annotations_file: str):
+        """Remove journal of a deleted image"""
+        with self._path_lock(annotations_file):
+            log_file = journal_path(annotations_file)
+            if os.path.exists(log_file):
+                os.remove(log_file)
+            self.forget(annotations_file)
+
+    def forget(self, annotations_file: str):
+        """Drop in-memory state for an image"""
+        with self._lock:
+            self._last_seq.pop(annotations_file, None)
+            self._op_counts.pop(annotations_file, None)
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._queue:
+                    self._cond.wait()
+                annotations_file = self._queue.pop(0)
+            try:
+                if os.path.exists(os.path.dirname(annotations_file)):
+                    self.compact(annotations_file)
+            except Exception as e:
+                print(f"Error compacting journal for {annotations_file}: {e}")
+
+
+annotation_journal = AnnotationJournal()
@@ -0,0 +1,412 @@
+import os
+import bisect
+import heapq
+import threading
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from models.persistence import json_store, dumps, loads
+from models.session import current_unit_of_work
+
+MANIFEST_FILENAME = 'manifest.json'
+# Rows changed by annotation edits are appended here instead of rewriting the manifest
+MANIFEST_LOG_FILENAME = 'manifest.log'
+# Rewrite the manifest once the log holds this many rows
+MANIFEST_LOG_THRESHOLD = 500
+MANIFEST_VERSION = 3
+# The manifest is rewritten whole on every change, so bursts are batched longer
+MANIFEST_COMMIT_DELAY = 0.25
+
+# حالات الصور التي يُحتسب ملفها المعالج ضمن processed_files_count
+PROCESSED_STATUSES = ('processed', 'annotated', 'completed')
+
+
+def _merge_counts(target: Dict[str, int], counts: Dict[str, int], sign: int):
+    for key, count in counts.items():
+        total = target.get(key, 0) + sign * count
+        if total:
+            target[key] = total
+        else:
+            target.pop(key, None)
+
+
+def statistics_key(row: Optional[Dict[str, Any]]):
+    """Part of a summary row that project statistics depend on"""
+    if row is None:
+        return None
+    return row.get('status'), row.get('status') in PROCESSED_STATUSES and bool(row.get('has_processed'))
+
+
+class ProjectManifest:
+    """Compact per-project table of image summary rows.
+
+    Stored as ``manifest.json`` in the project folder and updated
+    incrementally by ``Image.save``, so listing, filtering and next-image
+    queries never have to open the per-image annotation files.
+
+    Besides the rows it keeps one queue per status, ordered by
+    ``(created_at, id)``. The queues are persisted with the rows and kept
+    sorted on every status transition, so the next image with a status is
+    the head of its queue.
+
+    Label and level histograms per status are maintained from the rows'
+    per-image histograms and persisted alongside them, so annotation
+    statistics cost O(#labels) rather than O(#annotations).
+
+    Rows changed by single annotation edits are appended to
+    ``manifest.log`` (``log_row``) instead of rewriting the whole file.
+    Every line carries a sequence number; the manifest stores the last
+    one it contains (``log_seq``) and readers replay newer lines.
+
+    Sorted page orders (``sort_keys``) are cached until the next change,
+    so paging through a project does not re-sort it for every page.
+    """
+
+    _instances: Dict[str, 'ProjectManifest'] = {}
+    _instances_lock = threading.Lock()
+
+    def __init__(self, project_folder: str):
+        self.project_folder = project_folder
+        self.rows: Dict[str, Dict[str, Any]] = {}
+        self._sorted = True
+        self._counts: Dict[str, int] = {}
+        self._queues: Dict[str, List[Tuple[str, str]]] = {}
+        self._aggregates: Dict[str, Dict[str, Any]] = {}
+        self._processed_files = 0
+        self._file_mtime = None
+        self._lock = threading.RLock()
+        self._log_lock = threading.Lock()
+        self._log_seq = 0
+        self._log_count = 0
+        self._version = 0
+        self._orders: Dict[tuple, List[tuple]] = {}
+        self._orders_version = 0
+
+    @property
+    def manifest_file(self):
+        """Get manifest file path"""
+        return os.path.join(self.project_folder, MANIFEST_FILENAME)
+
+    @property
+    def log_file(self):
+        """Get row log path"""
+        return os.path.join(self.project_folder, MANIFEST_LOG_FILENAME)
+
+    @classmethod
+    def for_folder(cls, project_folder: str) -> 'ProjectManifest':
+        """Get the shared manifest for a project folder, loading it if needed"""
+        with cls._instances_lock:
+            manifest = cls._instances.get(project_folder)
+            if manifest is None:
+                manifest = cls(project_folder)
+                cls._instances[project_folder] = manifest
+        manifest._ensure_loaded()
+        return manifest
+
+    @classmethod
+    def forget(cls, project_folder: str):
+        """Drop cached manifest (e.g. after the project was deleted)"""
+        with cls._instances_lock:
+            cls._instances.pop(project_folder, None)
+
+    def _ensure_loaded(self):
+        with self._lock:
+            if json_store.is_pending(self.manifest_file):
+                # الذاكرة أحدث من الملف حتى تكتمل الكتابة المؤجلة
+                return
+            try:
+                mtime = os.path.getmtime(self.manifest_file)
+            except OSError:
+                mtime = None
+
+            if mtime is None:
+                if self._file_mtime is None:
+                    self.rebuild()
+                return
+            if mtime != self._file_mtime:
+                self._read(mtime)
+
+    def _read(self, mtime):
+        try:
+            data = json_store.read(self.manifest_file, cache=False)
+            if not data or data.get('version') != MANIFEST_VERSION:
+                self.rebuild()
+                return
+            self.rows = {row['id']: row for row in data.get('images', [])}
+            self._sorted = False
+            self._recount(data.get('queues'), data.get('aggregates'))
+            self._replay_log(data.get('log_seq', 0))
+            self._file_mtime = mtime
+        except Exception as e:
+            print(f"Error reading manifest {self.manifest_file}, rebuilding: {e}")
+            self.rebuild()
+
+    def rebuild(self):
+        """Rebuild manifest from the per-image annotation files"""
+        from models.image import Image
+
+        with self._lock:
+            # Queued image writes must be on disk before the folder is scanned
+            json_store.flush()
+            rows = {}
+            annotations_folder = os.path.join(self.project_folder, 'annotations')
+            if os.path.exists(annotations_folder):
+                for filename in os.listdir(annotations_folder):
+                    if not filename.endswith('.json'):
+                        continue
+                    image = Image.load_from_file(os.path.join(annotations_folder, filename), self.project_folder)
+                    if image:
+                        rows[image.id] = image.to_summary()
+            self.rows = rows
+            self._sorted = False
+            self._recount()
+            self._write()
+
+    def _write(self):
+        with self._lock:
+            if not os.path.exists(self.project_folder):
+                return
+            with self._log_lock:
+                log_seq = self._log_seq
+            data = {
+                'version': MANIFEST_VERSION,
+                'images': self.ordered_rows(),
+                'queues': {status: [image_id for _, image_id in queue] for status, queue in self._queues.items()},
+                'aggregates': self._aggregates,
+                'log_seq': log_seq
+            }
+            json_store.write(self.manifest_file, data, delay=MANIFEST_COMMIT_DELAY,
+                             on_flushed=lambda mtime: self._flushed(mtime, log_seq))
+
+    def _flushed(self, mtime, log_seq: int = 0):
+        # Runs on the writer thread; no manifest lock, rebuild() may be waiting on a flush
+        self._file_mtime = mtime
+        with self._log_lock:
+            if log_seq == self._log_seq and self._log_count:
+                # كل أسطر السجل صارت ضمن الملف المكتوب
+                try:
+                    os.remove(self.log_file)
+                except FileNotFoundError:
+                    pass
+                self._log_count = 0
+
+    def log_row(self, image_id: str):
+        """Persist the current row of one image by appending it to the row log"""
+        with self._lock:
+            row = self.rows.get(image_id)
+        if row is None or not os.path.exists(self.project_folder):
+            return
+        with self._log_lock:
+            self._log_seq += 1
+            with open(self.log_file, 'ab') as f:
+                f.write(dumps({'seq': self._log_seq, 'row': row}) + b'\n')
+            self._log_count += 1
+            compact = self._log_count >= MANIFEST_LOG_THRESHOLD
+        if compact:
+            self._write()
+
+    def _replay_log(self, after_seq: int):
+        """Apply logged rows newer than the loaded manifest"""
+        seq, count = after_seq, 0
+        try:
+            with open(self.log_file, 'rb') as f:
+                for line in f:
+                    try:
+                        entry = loads(line)
+                    except ValueError:
+                        # سطر أخير غير مكتمل
+                        break
+                    count += 1
+                    if entry['seq'] > after_seq:
+                        self.put(entry['row'])
+                        seq = max(seq, entry['seq'])
+        except FileNotFoundError:
+            pass
+        with self._log_lock:
+            self._log_seq = max(self._log_seq, seq)
+            self._log_count = count
+
+    def _rollback(self):
+        """Discard unsaved in-memory changes"""
+        with self._lock:
+            data = json_store.read(self.manifest_file, cache=False)
+            if not data or data.get('version') != MANIFEST_VERSION:
+                self.rebuild()
+                return
+            # آخر نسخة محفوظة (قد تكون ما تزال في طابور الكتابة)
+            self.rows = {row['id']: row for row in data.get('images', [])}
+            self._sorted = False
+            self._recount(data.get('queues'), data.get('aggregates'))
+            self._replay_log(data.get('log_seq', 0))
+
+    def save(self):
+        """Persist manifest (deferred to the active unit of work, if any)"""
+        uow = current_unit_of_work()
+        if uow is not None:
+            uow.register_dirty(('manifest', self.project_folder), self)
+            return
+        self._write()
+
+    def get(self, image_id: str) -> Optional[Dict[str, Any]]:
+        """Get summary row for an image"""
+        return self.rows.get(image_id)
+
+    def put(self, row: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """Insert or replace a summary row; returns the previous row"""
+        with self._lock:
+            previous = self.rows.get(row['id'])
+            if previous is None and self.rows and self._sorted:
+                last = next(reversed(self.rows.values()))
+                if row.get('created_at', '') < last.get('created_at', ''):
+                    self._sorted = False
+            self.rows[row['id']] = row
+            self._count(previous, -1)
+            self._count(row, 1)
+            return previous
+
+    def remove(self, image_id: str) -> Optional[Dict[str, Any]]:
+        """Remove a summary row; returns the removed row"""
+        with self._lock:
+            previous = self.rows.pop(image_id, None)
+            self._count(previous, -1)
+            return previous
+
+    def _count(self, row: Optional[Dict[str, Any]], sign: int):
+        key = statistics_key(row)
+        if key is None:
+            return
+        self._version += 1
+        status, processed_file = key
+        self._counts[status] = self._counts.get(status, 0) + sign
+        if not self._counts[status]:
+            del self._counts[status]
+        if processed_file:
+            self._processed_files += sign
+        self._aggregate(row, sign)
+
+        queue = self._queues.setdefault(status, [])
+        entry = (row.get('created_at', ''), row['id'])
+        if sign > 0:
+            bisect.insort(queue, entry)
+        else:
+            index = bisect.bisect_left(queue, entry)
+            if index < len(queue) and queue[index] == entry:
+                del queue[index]
+            if not queue:
+                del self._queues[status]
+
+    def _aggregate(self, row: Dict[str, Any], sign: int):
+        if not row.get('annotations_count'):
+            return
+        aggregate = self._aggregates.setdefault(row['status'], {
+            'annotated_images': 0, 'total_annotations': 0, 'labels': {}, 'levels': {}
+        })
+        aggregate['annotated_images'] += sign
+        aggregate['total_annotations'] += sign * row['annotations_count']
+        _merge_counts(aggregate['labels'], row.get('annotation_labels', {}), sign)
+        _merge_counts(aggregate['levels'], row.get('annotation_levels', {}), sign)
+        if not aggregate['annotated_images']:
+            del self._aggregates[row['status']]
+
+    def _recount(self, queues: Optional[Dict[str, List[str]]] = None,
+                 aggregates: Optional[Dict[str, Dict[str, Any]]] = None):
+        self._version += 1
+        self._counts = {}
+        self._processed_files = 0
+        self._queues = {}
+        self._aggregates = {}
+        if queues is not None and sum(len(ids) for ids in queues.values()) == len(self.rows):
+            # الطوابير المحفوظة مرتبة مسبقاً، فلا حاجة لإعادة الفرز
+            try:
+                for status, ids in queues.items():
+                    self._queues[status] = [(self.rows[image_id].get('created_at', ''), image_id) for image_id in ids]
+                for row in self.rows.values():
+                    status, processed_file = statistics_key(row)
+                    self._counts[status] = self._counts.get(status, 0) + 1
+                    if processed_file:
+                        self._processed_files += 1
+                    if aggregates is None:
+                        self._aggregate(row, 1)
+                if aggregates is not None:
+                    self._aggregates = aggregates
+                return
+            except KeyError:
+                self._counts = {}
+                self._processed_files = 0
+                self._queues = {}
+                self._aggregates = {}
+        for row in self.rows.values():
+            self._count(row, 1)
+
+    def ordered_rows(self, statuses: Optional[Iterable[str]] = None) -> List[Dict[str, Any]]:
+        """Get rows sorted by created_at, optionally filtered by status"""
+        if statuses is not None:
+            return self.rows_with_status(statuses)
+        with self._lock:
+            if not self._sorted:
+                self.rows = dict(sorted(self.rows.items(), key=lambda item: item[1].get('created_at', '')))
+                self._sorted = True
+            return list(self.rows.values())
+
+    def rows_with_status(self, statuses: Iterable[str]) -> List[Dict[str, Any]]:
+        """Get rows with the given statuses in queue order, without a full scan"""
+        with self._lock:
+            queues = [list(self._queues.get(status, [])) for status in set(statuses)]
+            return [self.rows[image_id] for _, image_id in heapq.merge(*queues)]
+
+    def sort_keys(self, sort: str = 'created_at', statuses: Optional[Iterable[str]] = None,
+                  default: Any = '') -> List[Tuple[Any, str]]:
+        """Ascending ``(value, image_id)`` keys of rows with the given statuses.
+
+        Sorting by created_at merges the status queues, which are already
+        in order; other fields are sorted once (missing values become
+        ``default``). The list is cached until the manifest changes and
+        must not be modified.
+        """
+        statuses = None if statuses is None else tuple(sorted(set(statuses)))
+        with self._lock:
+            if self._orders_version != self._version:
+                self._orders = {}
+                self._orders_version = self._version
+            cache_key = (sort, statuses, default)
+            keys = self._orders.get(cache_key)
+            if keys is None:
+                queues = list(self._queues.values()) if statuses is None else \
+                    [self._queues[status] for status in statuses if status in self._queues]
+                if sort == 'created_at':
+                    keys = list(heapq.merge(*queues))
+                else:
+                    keys = sorted((self.rows[image_id].get(sort) or default, image_id)
+                                  for queue in queues for _, image_id in queue)
+                self._orders[cache_key] = keys
+            return keys
+
+    def first_with_status(self, status: str) -> Optional[Dict[str, Any]]:
+        """Get the oldest row with the given status"""
+        with self._lock:
+            queue = self._queues.get(status)
+            return self.rows[queue[0][1]] if queue else None
+
+    def status_counts(self) -> Dict[str, int]:
+        """Count images per status"""
+        with self._lock:
+            return dict(self._counts)
+
+    def annotation_statistics(self, statuses: Optional[Iterable[str]] = None) -> Dict[str, Any]:
+        """Label/level histograms over images with the given statuses"""
+        stats = {'total_annotations': 0, 'annotated_images': 0, 'labels': {}, 'levels': {}}
+        with self._lock:
+            for status, aggregate in self._aggregates.items():
+                if statuses is not None and status not in statuses:
+                    continue
+                stats['total_annotations'] += aggregate['total_annotations']
+                stats['annotated_images'] += aggregate['annotated_images']
+                _merge_counts(stats['labels'], aggregate['labels'], 1)
+                _merge_counts(stats['levels'], aggregate['levels'], 1)
+        return stats
+
+    def processed_files_count(self) -> int:
+        """Count processed images whose processed file exists"""
+        return self._processed_files
+
+    def __len__(self):
+        return len(self.rows)
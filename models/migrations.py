@@ -0,0 +1,53 @@
+import os
+from typing import Callable, List, Tuple
+
+from models.project import Project, STORAGE_VERSION
+from models.image import Image
+
+
+def _migrate_original_image_paths(project: Project):
+    """Record each image's original file in its metadata (storage version 2)"""
+    originals = {}
+    if os.path.exists(project.original_images_folder):
+        for file in os.listdir(project.original_images_folder):
+            name, ext = os.path.splitext(file)
+            if ext.lower() in ('.jpg', '.jpeg', '.png', '.tiff', '.tif', '.webp', '.bmp') and not name.endswith('_thumb'):
+                originals[name] = file
+
+    for image in Image.load_all_for_project(project.id):
+        if image.original_file or image.id not in originals:
+            continue
+        image.set_original_file(originals[image.id])
+        image._write()
+
+
+# (target storage version, migration) in ascending order
+MIGRATIONS: List[Tuple[int, Callable[[Project], None]]] = [
+    (2, _migrate_original_image_paths),
+]
+
+
+def migrate_project(project: Project) -> bool:
+    """Bring project data up to the current storage version"""
+    if project.storage_version >= STORAGE_VERSION:
+        return False
+
+    for version, migration in MIGRATIONS:
+        if project.storage_version < version:
+            print(f"Migrating project {project.id} to storage version {version}")
+            migration(project)
+            project.storage_version = version
+            project._write()
+    return True
+
+
+def migrate_all_projects() -> int:
+    """Migrate every project; returns number of migrated projects"""
+    migrated = 0
+    for project in Project.load_all():
+        try:
+            if migrate_project(project):
+                migrated += 1
+        except Exception as e:
+            print(f"Error migrating project {project.id}: {e}")
+    return migrated
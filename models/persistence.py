@@ -0,0 +1,274 @@
+import os
+import json
+import time
+import atexit
+import tempfile
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, Iterator, Optional
+
+from models.cache import object_cache
+from models.annotation_record import to_plain
+
+try:
+    import orjson
+except ImportError:  # optional fast codec
+    orjson = None
+
+# Saves of the same file within this window are collapsed into one write
+GROUP_COMMIT_DELAY = 0.005
+# A failed background write is retried after this many seconds
+WRITE_RETRY_DELAY = 1.0
+
+
+def dumps(data: Any, sort_keys: bool = False) -> bytes:
+    """Encode compact UTF-8 JSON"""
+    if orjson is not None:
+        return orjson.dumps(data, default=to_plain, option=orjson.OPT_SORT_KEYS if sort_keys else None)
+    return json.dumps(data, ensure_ascii=False, separators=(',', ':'), sort_keys=sort_keys,
+                      default=to_plain).encode('utf-8')
+
+
+def loads(payload: bytes) -> Any:
+    """Decode JSON bytes"""
+    if orjson is not None:
+        return orjson.loads(payload)
+    return json.loads(payload)
+
+
+def write_file_atomic(path: str, payload: bytes, fsync: bool = True) -> float:
+    """Write bytes to a temp file next to path and rename it into place.
+
+    Readers see either the old or the new content, never a truncated file.
+    Returns the mtime of the written file.
+    """
+    directory = os.path.dirname(path) or '.'
+    fd, temp_path = tempfile.mkstemp(dir=directory, prefix=f".{os.path.basename(path)}.", suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(payload)
+            f.flush()
+            if fsync:
+                os.fsync(f.fileno())
+        os.replace(temp_path, path)
+    except BaseException:
+        try:
+            os.remove(temp_path)
+        except OSError:
+            pass
+        raise
+    return os.path.getmtime(path)
+
+
+def write_json_atomic(path: str, data: Any) -> float:
+    """Synchronously write compact JSON atomically"""
+    return write_file_atomic(path, dumps(data))
+
+
+class JsonStore:
+    """Group-committed JSON file writer.
+
+    ``write`` encodes the document immediately and queues it; a background
+    thread writes it atomically once the group commit delay has passed.
+    Further saves of the same path in the meantime replace the queued
+    payload, so a burst of saves becomes one write. ``read`` and ``exists``
+    see queued payloads, so callers never observe the delay.
+
+    A write that fails stays queued and is retried; the background thread
+    only logs the error, while ``flush`` raises it, so callers that need
+    the data on disk find out.
+    """
+
+    def __init__(self, delay: float = GROUP_COMMIT_DELAY):
+        self.delay = delay
+        self._pending: Dict[str, tuple] = {}
+        self._inflight: Dict[str, bytes] = {}
+        self._failed: Dict[str, Exception] = {}
+        self._tracked: ContextVar[Optional[Dict[str, None]]] = ContextVar('json_store_tracked', default=None)
+        self._cond = threading.Condition()
+        self._thread: Optional[threading.Thread] = None
+        self.writes = 0
+        self.coalesced = 0
+
+    def write(self, path: str, data: Any, delay: Optional[float] = None,
+              on_flushed: Optional[Callable[[float], None]] = None):
+        """Queue document for writing; on_flushed(mtime) runs after the write"""
+        payload = dumps(data)
+        tracked = self._tracked.get()
+        if tracked is not None:
+            tracked[path] = None
+        with self._cond:
+            existing = self._pending.get(path)
+            if existing is not None:
+                # الاحتفاظ بالموعد الأقدم حتى لا تؤجل الكتابات المتتالية الحفظ بلا نهاية
+                due = existing[1]
+                self.coalesced += 1
+            else:
+                due = time.monotonic() + (self.delay if delay is None else delay)
+            self._pending[path] = (payload, due, on_flushed)
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='json-group-commit', daemon=True)
+                self._thread.start()
+            self._cond.notify_all()
+
+    @contextmanager
+    def track(self) -> Iterator[Dict[str, None]]:
+        """Collect (in order) the paths written in this context"""
+        paths: Dict[str, None] = {}
+        token = self._tracked.set(paths)
+        try:
+            yield paths
+        finally:
+            self._tracked.reset(token)
+
+    def read(self, path: str, cache: bool = True) -> Optional[Any]:
+        """Read document, preferring a queued payload; None if it does not exist"""
+        with self._cond:
+            entry = self._pending.get(path)
+            payload = entry[0] if entry is not None else self._inflight.get(path)
+        if payload is not None:
+            return loads(payload)
+
+        if cache:
+            data = object_cache.get(path)
+            if data is not None:
+                return data
+        try:
+            with open(path, 'rb') as f:
+                data = loads(f.read())
+        except FileNotFoundError:
+            return None
+        if cache:
+            object_cache.put(path, data)
+        return data
+
+    def is_pending(self, path: str) -> bool:
+        """Check whether path has a write that is not on disk yet"""
+        with self._cond:
+            return path in self._pending or path in self._inflight
+
+    def exists(self, path: str) -> bool:
+        """Check whether document exists (queued or on disk)"""
+        return self.is_pending(path) or os.path.exists(path)
+
+    def discard(self, path: str):
+        """Drop queued writes for path or for anything under folder path"""
+        prefix = path.rstrip(os.sep) + os.sep
+        with self._cond:
+            for pending_path in list(self._pending):
+                if pending_path == path or pending_path.startswith(prefix):
+                    del self._pending[pending_path]
+                    self._failed.pop(pending_path, None)
+            # انتظار الكتابات الجارية حتى لا تعيد إنشاء ملفات محذوفة
+            while any(p == path or p.startswith(prefix) for p in self._inflight):
+                self._cond.wait(0.05)
+        object_cache.invalidate(path)
+
+    def flush(self, path: Optional[str] = None):
+        """Write queued documents now (all of them, or only path).
+
+        Raises the error of a write that failed; its document stays queued.
+        """
+        while True:
+            with self._cond:
+                if path is None:
+                    busy = bool(self._pending) or bool(self._inflight)
+                else:
+                    busy = path in self._pending or path in self._inflight
+                if not busy:
+                    return
+                entries = self._take(paths=None if path is None else {path})
+                if not entries:
+                    # Another thread is writing these paths
+                    self._cond.wait(0.05)
+                    continue
+            errors = self._write_entries(entries)
+            if errors:
+                raise next(iter(errors.values()))
+
+    def _take(self, due_before: Optional[float] = None, paths=None):
+        entries = []
+        for path, (payload, due, on_flushed) in list(self._pending.items()):
+            if path in self._inflight:
+                continue
+            if due_before is not None and due > due_before:
+                continue
+            if paths is not None and path not in paths:
+                continue
+            del self._pending[path]
+            self._inflight[path] = payload
+            entries.append((path, payload, on_flushed))
+        return entries
+
+    def _write_entries(self, entries) -> Dict[str, Exception]:
+        """Write taken entries; failed ones are queued again and returned"""
+        errors: Dict[str, Exception] = {}
+        try:
+            for path, payload, on_flushed in entries:
+                try:
+                    mtime = write_file_atomic(path, payload)
+                except Exception as e:
+                    errors[path] = e
+                    continue
+                object_cache.put(path, loads(payload))
+                self.writes += 1
+                if on_flushed is not None:
+                    try:
+                        on_flushed(mtime)
+                    except Exception as e:
+                        print(f"Error after writing {path}: {e}")
+        finally:
+            with self._cond:
+                for path, payload, on_flushed in entries:
+                    self._inflight.pop(path, None)
+                    if path not in errors:
+                        self._failed.pop(path, None)
+                        continue
+                    self._failed[path] = errors[path]
+                    if path not in self._pending:
+                        # الاحتفاظ بالمحتوى لإعادة المحاولة بدل فقدانه
+                        self._pending[path] = (payload, time.monotonic() + WRITE_RETRY_DELAY, on_flushed)
+                self._cond.notify_all()
+        return errors
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._pending:
+                    self._cond.wait()
+                now = time.monotonic()
+                next_due = min(due for _, due, _ in self._pending.values())
+                if next_due > now:
+                    self._cond.wait(next_due - now)
+                    continue
+                entries = self._take(due_before=now)
+                if not entries:
+                    self._cond.wait(self.delay)
+                    continue
+            for path, e in self._write_entries(entries).items():
+                print(f"Error writing {path}, will retry: {e}")
+
+    def stats(self) -> Dict[str, Any]:
+        """Get writer counters"""
+        with self._cond:
+            return {
+                'codec': 'orjson' if orjson is not None else 'json',
+                'pending': len(self._pending) + len(self._inflight),
+                'writes': self.writes,
+                'coalesced': self.coalesced,
+                'failed': len(self._failed)
+            }
+
+
+json_store = JsonStore()
+
+
+def _flush_at_exit():
+    try:
+        json_store.flush()
+    except Exception as e:
+        print(f"Error writing queued documents at exit: {e}")
+
+
+atexit.register(_flush_at_exit)
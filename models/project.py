@@ -1,9 +1,16 @@
 import os
-import json
 import uuid
 import shutil
 from datetime import datetime
 from typing import Dict, List, Optional
+from models.persistence import json_store
+from models.history import annotation_history
+from models.project_index import project_index, DATA_DIR
+from models.session import current_unit_of_work
+from models.sqlite_store import get_store
+
+# Version of the on-disk project layout; see models/migrations.py
+STORAGE_VERSION = 2
 
 class Project:
     def __init__(self, name: str, description: str = "", images_path: str = "", 
@@ -16,6 +23,7 @@ class Project:
         self.output_type = output_type
         self.created_at = datetime.now().isoformat()
         self.updated_at = datetime.now().isoformat()
+        self.storage_version = STORAGE_VERSION
         self.settings = {
             'auto_flow_enabled': True,
             'auto_flow_mode': 'process_then_annotate',  # manual, process_then_next, process_then_annotate
@@ -60,7 +68,18 @@ class Project:
     @property
     def project_folder(self):
         """Get project folder path"""
-        return os.path.join('data', f'project_{self.name}_{self.id}')
+        # المجلد المسجل يبقى ثابتاً حتى عند إعادة تسمية المشروع
+        store = get_store()
+        if store is not None:
+            # على SQLite جدول projects هو المرجع، لا فهرس JSON
+            folder_name = store.project_folder(self.id)
+            if folder_name:
+                return os.path.join(DATA_DIR, folder_name)
+        else:
+            indexed_folder = project_index.get_folder(self.id)
+            if indexed_folder:
+                return indexed_folder
+        return os.path.join(DATA_DIR, f'project_{self.name}_{self.id}')
     
     @property
     def original_images_folder(self):
@@ -109,11 +128,30 @@ class Project:
         if self.settings.get('auto_flow_mode') not in valid_modes:
             self.settings['auto_flow_mode'] = 'manual'
         
+        uow = current_unit_of_work()
+        if uow is not None:
+            uow.register_dirty(('project', self.id), self)
+            return
+        
+        self._write()
+    
+    def _write(self):
+        """Write project metadata to disk"""
         # Create folders if they don't exist
         self.create_folders()
         
-        # Save metadata
-        metadata = {
+        metadata = self.to_metadata()
+        store = get_store()
+        if store is not None:
+            store.save_project(metadata, os.path.basename(self.project_folder))
+        else:
+            json_store.write(self.metadata_file, metadata)
+        
+        self.register()
+    
+    def to_metadata(self) -> Dict:
+        """Get persisted project metadata"""
+        return {
             'id': self.id,
             'name': self.name,
             'description': self.description,
@@ -122,83 +160,95 @@ class Project:
             'output_type': self.output_type,
             'created_at': self.created_at,
             'updated_at': self.updated_at,
+            'storage_version': self.storage_version,
             'settings': self.settings,
             'statistics': self.statistics
         }
+    
+    def register(self):
+        """Register project folder in the project index (the projects table on SQLite)"""
+        if get_store() is None:
+            project_index.register(self.id, os.path.basename(self.project_folder))
+    
+    @classmethod
+    def from_metadata(cls, data: Dict) -> 'Project':
+        """Create project from persisted metadata"""
+        project = cls(
+            name=data['name'],
+            description=data.get('description', ''),
+            images_path=data.get('images_path', ''),
+            save_path=data.get('save_path', ''),
+            output_type=data.get('output_type', 'json')
+        )
+        
+        project.id = data['id']
+        project.created_at = data['created_at']
+        project.updated_at = data['updated_at']
+        project.storage_version = data.get('storage_version', 1)
+        project.settings = data.get('settings', project.settings)
+        project.statistics = data.get('statistics', project.statistics)
         
-        with open(self.metadata_file, 'w', encoding='utf-8') as f:
-            json.dump(metadata, f, indent=2, ensure_ascii=False)
+        return project
+    
+    @classmethod
+    def _load_from_folder(cls, folder: str) -> Optional['Project']:
+        """Load project from its folder metadata"""
+        metadata_file = os.path.join(folder, 'metadata.json')
+        
+        try:
+            data = json_store.read(metadata_file)
+            return cls.from_metadata(data) if data else None
+        except Exception as e:
+            print(f"Error loading project from {os.path.basename(folder)}: {e}")
+            return None
+    
+    @classmethod
+    def _load_from_store(cls, project_id: str) -> Optional['Project']:
+        """Load project from the SQLite store"""
+        try:
+            data = get_store().load_project(project_id)
+            return cls.from_metadata(data) if data else None
+        except Exception as e:
+            print(f"Error loading project {project_id} from database: {e}")
+            return None
     
     @classmethod
     def load(cls, project_id: str) -> Optional['Project']:
         """Load project from metadata"""
-        # Find project folder
-        data_dir = 'data'
-        if not os.path.exists(data_dir):
-            return None
+        uow = current_unit_of_work()
+        if uow is not None:
+            project = uow.get(('project', project_id))
+            if project is not None:
+                return project
         
-        for folder_name in os.listdir(data_dir):
-            if folder_name.startswith('project_') and folder_name.endswith(f'_{project_id}'):
-                metadata_file = os.path.join(data_dir, folder_name, 'metadata.json')
-                if os.path.exists(metadata_file):
-                    try:
-                        with open(metadata_file, 'r', encoding='utf-8') as f:
-                            data = json.load(f)
-                        
-                        project = cls(
-                            name=data['name'],
-                            description=data.get('description', ''),
-                            images_path=data.get('images_path', ''),
-                            save_path=data.get('save_path', ''),
-                            output_type=data.get('output_type', 'json')
-                        )
-                        
-                        project.id = data['id']
-                        project.created_at = data['created_at']
-                        project.updated_at = data['updated_at']
-                        project.settings = data.get('settings', project.settings)
-                        project.statistics = data.get('statistics', project.statistics)
-                        
-                        return project
-                    except Exception as e:
-                        print(f"Error loading project from {folder_name}: {e}")
+        if get_store() is not None:
+            project = cls._load_from_store(project_id)
+        else:
+            folder = project_index.get_folder(project_id)
+            if not folder:
+                return None
+            project = cls._load_from_folder(folder)
         
-        return None
+        if project and uow is not None:
+            uow.add(('project', project_id), project)
+        return project
     
     @classmethod
     def load_all(cls) -> List['Project']:
         """Load all projects"""
-        projects = []
-        data_dir = 'data'
+        store = get_store()
+        if store is not None:
+            return [cls.from_metadata(data) for data in store.load_projects()]
         
-        if not os.path.exists(data_dir):
-            return projects
+        projects = []
         
-        for folder_name in os.listdir(data_dir):
-            if folder_name.startswith('project_'):
-                metadata_file = os.path.join(data_dir, folder_name, 'metadata.json')
-                if os.path.exists(metadata_file):
-                    try:
-                        with open(metadata_file, 'r', encoding='utf-8') as f:
-                            data = json.load(f)
-                        
-                        project = cls(
-                            name=data['name'],
-                            description=data.get('description', ''),
-                            images_path=data.get('images_path', ''),
-                            save_path=data.get('save_path', ''),
-                            output_type=data.get('output_type', 'json')
-                        )
-                        
-                        project.id = data['id']
-                        project.created_at = data['created_at']
-                        project.updated_at = data['updated_at']
-                        project.settings = data.get('settings', project.settings)
-                        project.statistics = data.get('statistics', project.statistics)
-                        
-                        projects.append(project)
-                    except Exception as e:
-                        print(f"Error loading project from {folder_name}: {e}")
+        for project_id in project_index.project_ids():
+            folder = project_index.get_folder(project_id)
+            if not folder:
+                continue
+            project = cls._load_from_folder(folder)
+            if project:
+                projects.append(project)
         
         # Sort by creation date (newest first)
         projects.sort(key=lambda x: x.created_at, reverse=True)
@@ -206,30 +256,69 @@ class Project:
     
     def delete(self):
         """Delete project and all associated files"""
-        if os.path.exists(self.project_folder):
-            shutil.rmtree(self.project_folder)
-    
-    def update_statistics(self):
-        """Update project statistics based on current images"""
-        from models.image import Image
-        images = Image.load_all_for_project(self.id)
+        project_folder = self.project_folder
+        json_store.discard(project_folder)
+        if os.path.exists(project_folder):
+            shutil.rmtree(project_folder)
+        project_index.remove(self.id)
         
-        # إحصائيات محسنة تتحقق من وجود الملفات الفعلية
-        processed_with_files = 0
-        for img in images:
-            if img.status in ['processed', 'annotated', 'completed'] and os.path.exists(img.processed_image_path):
-                processed_with_files += 1
+        store = get_store()
+        if store is not None:
+            store.delete_project(self.id)
         
-        self.statistics = {
-            'total_images': len(images),
-            'unprocessed_images': len([img for img in images if img.status == 'unprocessed']),
-            'processed_images': len([img for img in images if img.status == 'processed']),
-            'annotated_images': len([img for img in images if img.status == 'annotated']),
-            'completed_images': len([img for img in images if img.status == 'completed']),
-            'processed_files_count': processed_with_files  # عدد الملفات المعالجة الموجودة فعلياً
+        from models.manifest import ProjectManifest
+        from services.search_index import AnnotationSearchIndex
+        from services.preview_cache import preview_cache
+        ProjectManifest.forget(project_folder)
+        AnnotationSearchIndex.forget(project_folder)
+        preview_cache.forget_folder(project_folder)
+        annotation_history.forget(project_folder)
+        
+        uow = current_unit_of_work()
+        if uow is not None:
+            uow.discard(('project', self.id))
+    
+    def update_statistics(self, manifest=None):
+        """Sync project statistics with the image manifest counters.
+
+        The manifest keeps per-status counts up to date as images are saved
+        and deleted, so this does not touch any image files.
+        """
+        if manifest is None:
+            from models.image import Image
+            manifest = Image.get_manifest(self.id)
+        counts = manifest.status_counts() if manifest is not None else {}
+        
+        statistics = {
+            'total_images': sum(counts.values()),
+            'unprocessed_images': counts.get('unprocessed', 0),
+            'processed_images': counts.get('processed', 0),
+            'annotated_images': counts.get('annotated', 0),
+            'completed_images': counts.get('completed', 0),
+            # عدد الملفات المعالجة الموجودة فعلياً
+            'processed_files_count': manifest.processed_files_count() if manifest is not None else 0
         }
         
-        self.save()
+        if statistics != self.statistics:
+            self.statistics = statistics
+            self.save()
+    
+    def recount_statistics(self):
+        """Repair statistics by rebuilding the manifest from the image records"""
+        from models.image import Image
+        manifest = Image.get_manifest(self.id)
+        if manifest is None:
+            return
+        manifest.rebuild()
+        self.update_statistics(manifest)
+    
+    def get_annotation_statistics(self, statuses: Optional[List[str]] = None) -> Dict:
+        """Count annotations per label and level over images with the given statuses"""
+        from models.image import Image
+        manifest = Image.get_manifest(self.id)
+        if manifest is None:
+            return {'total_annotations': 0, 'annotated_images': 0, 'labels': {}, 'levels': {}}
+        return manifest.annotation_statistics(statuses)
     
     def get_progress_percentage(self):
         """Calculate overall progress percentage"""
@@ -257,9 +346,6 @@ class Project:
         file_manager = FileManager()
         images = file_manager.copy_images_from_path(self, images_path)
         
-        # Update statistics
-        self.update_statistics()
-        
         return len(images)
     
     def to_dict(self):
@@ -0,0 +1,129 @@
+import os
+import json
+import threading
+from typing import Dict, List, Optional
+
+from models.persistence import write_json_atomic
+from models.sqlite_store import get_store
+
+DATA_DIR = 'data'
+INDEX_FILENAME = 'projects_index.json'
+
+
+class ProjectIndex:
+    """Persistent project ID -> folder name index.
+
+    The index lives in ``data/projects_index.json`` and is mirrored in memory,
+    so resolving a project folder is a dict lookup instead of a scan of
+    ``data/``. It is rebuilt from the project folders when the file is missing.
+    """
+
+    def __init__(self, data_dir: str = DATA_DIR):
+        self.data_dir = data_dir
+        self._folders: Optional[Dict[str, str]] = None
+        self._file_mtime = None
+        self._lock = threading.RLock()
+
+    @property
+    def index_file(self):
+        """Get index file path"""
+        return os.path.join(self.data_dir, INDEX_FILENAME)
+
+    def load(self) -> Dict[str, str]:
+        """Load index from disk, rebuilding it if the file is missing"""
+        with self._lock:
+            if self._folders is None:
+                if os.path.exists(self.index_file):
+                    self._read()
+                else:
+                    self.rebuild()
+            return self._folders
+
+    def _read(self):
+        try:
+            with open(self.index_file, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            self._folders = dict(data.get('projects', {}))
+            self._file_mtime = os.path.getmtime(self.index_file)
+        except Exception as e:
+            print(f"Error reading project index, rebuilding: {e}")
+            self.rebuild()
+
+    def _write(self):
+        os.makedirs(self.data_dir, exist_ok=True)
+        self._file_mtime = write_json_atomic(self.index_file, {'projects': self._folders})
+
+    def _refresh_if_changed(self) -> bool:
+        """Re-read the index file if another process has rewritten it"""
+        try:
+            mtime = os.path.getmtime(self.index_file)
+        except OSError:
+            return False
+        if mtime != self._file_mtime:
+            self._read()
+            return True
+        return False
+
+    def rebuild(self) -> Dict[str, str]:
+        """Rebuild index by scanning project folders under data/"""
+        with self._lock:
+            folders = {}
+            store = get_store()
+            if store is not None:
+                folders = store.project_folders()
+            elif os.path.exists(self.data_dir):
+                for folder_name in os.listdir(self.data_dir):
+                    if not folder_name.startswith('project_'):
+                        continue
+                    metadata_file = os.path.join(self.data_dir, folder_name, 'metadata.json')
+                    if not os.path.exists(metadata_file):
+                        continue
+                    try:
+                        with open(metadata_file, 'r', encoding='utf-8') as f:
+                            project_id = json.load(f)['id']
+                        folders[project_id] = folder_name
+                    except Exception as e:
+                        print(f"Error indexing project folder {folder_name}: {e}")
+            self._folders = folders
+            self._write()
+            return self._folders
+
+    def get_folder(self, project_id: str) -> Optional[str]:
+        """Get project folder path for project ID, or None if unknown"""
+        with self._lock:
+            folders = self.load()
+            folder_name = folders.get(project_id)
+            if folder_name is None and self._refresh_if_changed():
+                folder_name = self._folders.get(project_id)
+            if folder_name is None:
+                return None
+
+            folder = os.path.join(self.data_dir, folder_name)
+            if not os.path.isdir(folder):
+                # Folder was removed outside the application
+                self.remove(project_id)
+                return None
+            return folder
+
+    def register(self, project_id: str, folder_name: str):
+        """Add or update project folder entry"""
+        with self._lock:
+            folders = self.load()
+            if folders.get(project_id) != folder_name:
+                folders[project_id] = folder_name
+                self._write()
+
+    def remove(self, project_id: str):
+        """Remove project entry"""
+        with self._lock:
+            folders = self.load()
+            if folders.pop(project_id, None) is not None:
+                self._write()
+
+    def project_ids(self) -> List[str]:
+        """Get all indexed project IDs"""
+        with self._lock:
+            return list(self.load().keys())
+
+
+project_index = ProjectIndex()
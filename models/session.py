@@ -0,0 +1,148 @@
+from contextvars import ContextVar
+from typing import Any, Dict, Hashable, Optional
+
+from models.persistence import json_store
+
+# Image records are written before the summary rows that describe them
+WRITE_ORDER = {'image': 0, 'manifest': 1, 'project': 2}
+
+
+class UnitOfWork:
+    """Request-scoped identity map and unit of work for the models layer.
+
+    While a unit of work is active, ``Project.load`` and ``Image.load`` return
+    the same instance for the same ID, and ``save()`` only marks the object
+    dirty. Dirty objects are written once when the unit of work is flushed.
+    """
+
+    def __init__(self):
+        self.identity_map: Dict[Hashable, Any] = {}
+        self.dirty: Dict[Hashable, Any] = {}
+
+    def get(self, key: Hashable):
+        """Get loaded object from identity map"""
+        return self.identity_map.get(key)
+
+    def add(self, key: Hashable, obj: Any):
+        """Add loaded object to identity map"""
+        self.identity_map[key] = obj
+
+    def register_dirty(self, key: Hashable, obj: Any):
+        """Mark object for writing at flush time"""
+        self.identity_map[key] = obj
+        # إعادة الإدراج تضمن أن يُكتب الكائن بعد الكائنات التي عدّلها قبله
+        self.dirty.pop(key, None)
+        self.dirty[key] = obj
+
+    def mark_clean(self, key: Hashable):
+        """Forget pending write of an object that was written directly"""
+        self.dirty.pop(key, None)
+
+    def discard(self, key: Hashable):
+        """Forget object (e.g. after it was deleted)"""
+        self.identity_map.pop(key, None)
+        self.dirty.pop(key, None)
+
+    def rollback(self):
+        """Drop pending changes, letting shared objects restore their state"""
+        dirty = list(self.dirty.values())
+        self.dirty.clear()
+        self.identity_map.clear()
+        for obj in dirty:
+            rollback = getattr(obj, '_rollback', None)
+            if rollback is not None:
+                try:
+                    rollback()
+                except Exception as e:
+                    print(f"Error rolling back {obj}: {e}")
+
+    def flush(self):
+        """Write every dirty object once and wait until it is on disk.
+
+        Image records are written first, then manifests and project
+        metadata (WRITE_ORDER), each flushed synchronously before the next.
+        If a write fails, its queued files are dropped, it and the objects
+        not yet written are rolled back and the error is raised, so the
+        caller can report the failure. The commit is not atomic across
+        files: objects written before the failure stay written, which at
+        worst leaves summary rows behind the image records (repairable
+        with a statistics recount).
+        """
+        while self.dirty:
+            key = min(self.dirty, key=lambda k: WRITE_ORDER.get(k[0], 0))
+            obj = self.dirty.pop(key)
+            paths = {}
+            try:
+                with json_store.track() as paths:
+                    obj._write()
+                for path in paths:
+                    json_store.flush(path)
+            except Exception as e:
+                print(f"Error flushing {key}: {e}")
+                for path in paths:
+                    json_store.discard(path)
+                self.dirty[key] = obj
+                self.rollback()
+                raise
+
+
+_current_unit_of_work: ContextVar[Optional[UnitOfWork]] = ContextVar('unit_of_work', default=None)
+
+
+def current_unit_of_work() -> Optional[UnitOfWork]:
+    """Get active unit of work, if any"""
+    return _current_unit_of_work.get()
+
+
+def begin_unit_of_work() -> UnitOfWork:
+    """Start a new unit of work in the current context"""
+    uow = UnitOfWork()
+    _current_unit_of_work.set(uow)
+    return uow
+
+
+def end_unit_of_work(commit: bool = True):
+    """Flush (or discard) the active unit of work and deactivate it"""
+    uow = _current_unit_of_work.get()
+    _current_unit_of_work.set(None)
+    if uow is None:
+        return
+    if commit:
+        uow.flush()
+    else:
+        uow.rollback()
+
+
+def register_unit_of_work(blueprint):
+    """Wrap every request of a blueprint in a unit of work.
+
+    Changes are written to disk before the response is sent: error
+    responses (status >= 400) discard them, and a failed write turns the
+    response into a 500.
+    """
+    from flask import jsonify
+
+    @blueprint.before_request
+    def _begin_unit_of_work():
+        begin_unit_of_work()
+
+    @blueprint.after_request
+    def _commit_unit_of_work(response):
+        if current_unit_of_work() is None:
+            return response
+        if response.status_code >= 400:
+            end_unit_of_work(commit=False)
+            return response
+        try:
+            end_unit_of_work(commit=True)
+        except Exception as e:
+            failed = jsonify({'error': f'Failed to save changes: {e}'})
+            failed.status_code = 500
+            return failed
+        return response
+
+    @blueprint.teardown_request
+    def _end_unit_of_work(exc):
+        # لم يمر الطلب عبر after_request (استثناء غير معالج)
+        if current_unit_of_work() is not None:
+            end_unit_of_work(commit=False)
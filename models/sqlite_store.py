@@ -0,0 +1,453 @@
+import os
+import json
+import sqlite3
+import threading
+from typing import Any, Dict, Iterable, List, Optional
+
+from services.search_terms import search_confidence, search_terms
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS projects (
+    id TEXT PRIMARY KEY,
+    folder TEXT NOT NULL,
+    name TEXT NOT NULL,
+    created_at TEXT NOT NULL,
+    data TEXT NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS images (
+    id TEXT PRIMARY KEY,
+    project_id TEXT NOT NULL REFERENCES projects(id) ON DELETE CASCADE,
+    status TEXT NOT NULL,
+    created_at TEXT NOT NULL,
+    summary TEXT NOT NULL,
+    data TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_images_project_created ON images(project_id, created_at);
+CREATE INDEX IF NOT EXISTS idx_images_project_status ON images(project_id, status, created_at);
+
+CREATE TABLE IF NOT EXISTS annotations (
+    image_id TEXT NOT NULL REFERENCES images(id) ON DELETE CASCADE,
+    project_id TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    id TEXT,
+    type TEXT,
+    label TEXT,
+    level TEXT,
+    confidence REAL,
+    data TEXT NOT NULL,
+    PRIMARY KEY (image_id, position)
+);
+CREATE INDEX IF NOT EXISTS idx_annotations_project_label ON annotations(project_id, label);
+CREATE INDEX IF NOT EXISTS idx_annotations_project_level ON annotations(project_id, level);
+
+-- Search terms of each annotation, the same ones the JSON search index posts
+CREATE TABLE IF NOT EXISTS annotation_terms (
+    image_id TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    project_id TEXT NOT NULL,
+    term TEXT NOT NULL,
+    PRIMARY KEY (image_id, position, term),
+    FOREIGN KEY (image_id, position) REFERENCES annotations(image_id, position) ON DELETE CASCADE
+);
+CREATE INDEX IF NOT EXISTS idx_annotation_terms_project_term ON annotation_terms(project_id, term);
+"""
+
+
+def _dumps(data) -> str:
+    return json.dumps(data, ensure_ascii=False, separators=(',', ':'))
+
+
+def _term_rows(image_id: str, project_id: str, annotations: List[Dict[str, Any]]) -> List[tuple]:
+    return [
+        (image_id, position, project_id, term)
+        for position, ann in enumerate(annotations)
+        for term in search_terms(ann)
+    ]
+
+
+class SQLiteStore:
+    """SQLite storage backend for projects, images and annotations.
+
+    Project metadata and image records are stored as JSON documents next to
+    indexed columns (status, project_id, label, level) so status queries,
+    statistics and annotation searches run as indexed SQL. Searches match the
+    terms and confidence from services.search_terms, like the JSON search
+    index. Image files stay in the project folders on disk.
+    """
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(db_path) or '.', exist_ok=True)
+        self.connection.executescript(SCHEMA)
+        self._migrate()
+
+    def _migrate(self):
+        """Add search columns and terms to databases created before them"""
+        conn = self.connection
+        columns = {row['name'] for row in conn.execute('PRAGMA table_info(annotations)')}
+        if 'confidence' in columns:
+            return
+        with self.transaction() as conn:
+            conn.execute('ALTER TABLE annotations ADD COLUMN confidence REAL')
+            rows = conn.execute('SELECT image_id, project_id, position, data FROM annotations').fetchall()
+            for row in rows:
+                ann = json.loads(row['data'])
+                conn.execute(
+                    'UPDATE annotations SET confidence = ? WHERE image_id = ? AND position = ?',
+                    (search_confidence(ann), row['image_id'], row['position'])
+                )
+                conn.executemany(
+                    'INSERT OR IGNORE INTO annotation_terms (image_id, position, project_id, term) VALUES (?, ?, ?, ?)',
+                    [(row['image_id'], row['position'], row['project_id'], term) for term in search_terms(ann)]
+                )
+
+    @property
+    def connection(self) -> sqlite3.Connection:
+        """Get connection for the current thread"""
+        conn = getattr(self._local, 'connection', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.execute('PRAGMA foreign_keys=ON')
+            self._local.connection = conn
+        return conn
+
+    def transaction(self):
+        """Context manager running statements in one IMMEDIATE transaction"""
+        return _Transaction(self.connection)
+
+    # ---------- Projects ----------
+    def save_project(self, metadata: Dict[str, Any], folder: str):
+        with self.transaction() as conn:
+            conn.execute(
+                'INSERT INTO projects (id, folder, name, created_at, data) VALUES (?, ?, ?, ?, ?) '
+                'ON CONFLICT(id) DO UPDATE SET folder=excluded.folder, name=excluded.name, data=excluded.data',
+                (metadata['id'], folder, metadata['name'], metadata['created_at'], _dumps(metadata))
+            )
+
+    def load_project(self, project_id: str) -> Optional[Dict[str, Any]]:
+        row = self.connection.execute('SELECT data FROM projects WHERE id = ?', (project_id,)).fetchone()
+        return json.loads(row['data']) if row else None
+
+    def load_projects(self) -> List[Dict[str, Any]]:
+        rows = self.connection.execute('SELECT data FROM projects ORDER BY created_at DESC').fetchall()
+        return [json.loads(row['data']) for row in rows]
+
+    def project_folders(self) -> Dict[str, str]:
+        rows = self.connection.execute('SELECT id, folder FROM projects').fetchall()
+        return {row['id']: row['folder'] for row in rows}
+
+    def project_folder(self, project_id: str) -> Optional[str]:
+        row = self.connection.execute('SELECT folder FROM projects WHERE id = ?', (project_id,)).fetchone()
+        return row['folder'] if row else None
+
+    def delete_project(self, project_id: str):
+        with self.transaction() as conn:
+            conn.execute('DELETE FROM annotation_terms WHERE project_id = ?', (project_id,))
+            conn.execute('DELETE FROM annotations WHERE project_id = ?', (project_id,))
+            conn.execute('DELETE FROM images WHERE project_id = ?', (project_id,))
+            conn.execute('DELETE FROM projects WHERE id = ?', (project_id,))
+
+    # ---------- Images ----------
+    def put_summary(self, summary: Dict[str, Any]):
+        """Insert or update image summary columns, keeping the stored record"""
+        with self.transaction() as conn:
+            conn.execute(
+                'INSERT INTO images (id, project_id, status, created_at, summary) VALUES (?, ?, ?, ?, ?) '
+                'ON CONFLICT(id) DO UPDATE SET status=excluded.status, summary=excluded.summary',
+                (summary['id'], summary['project_id'], summary['status'], summary['created_at'], _dumps(summary))
+            )
+
+    def save_image(self, record: Dict[str, Any], summary: Dict[str, Any]):
+        """Save full image record and replace its annotation rows"""
+        annotations = record.get('annotations', [])
+        document = {k: v for k, v in record.items() if k != 'annotations'}
+        with self.transaction() as conn:
+            conn.execute(
+                'INSERT INTO images (id, project_id, status, created_at, summary, data) VALUES (?, ?, ?, ?, ?, ?) '
+                'ON CONFLICT(id) DO UPDATE SET status=excluded.status, summary=excluded.summary, data=excluded.data',
+                (record['id'], record['project_id'], record['status'], record['created_at'],
+                 _dumps(summary), _dumps(document))
+            )
+            conn.execute('DELETE FROM annotation_terms WHERE image_id = ?', (record['id'],))
+            conn.execute('DELETE FROM annotations WHERE image_id = ?', (record['id'],))
+            # label/level keep the statistics defaults; searches go through annotation_terms
+            conn.executemany(
+                'INSERT INTO annotations (image_id, project_id, position, id, type, label, level, confidence, data) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                [
+                    (record['id'], record['project_id'], position, ann.get('id'), ann.get('type'),
+                     ann.get('label', 'unlabeled'), ann.get('level', 'unknown'),
+                     search_confidence(ann), _dumps(ann))
+                    for position, ann in enumerate(annotations)
+                ]
+            )
+            conn.executemany(
+                'INSERT OR IGNORE INTO annotation_terms (image_id, position, project_id, term) VALUES (?, ?, ?, ?)',
+                _term_rows(record['id'], record['project_id'], annotations)
+            )
+
+    def load_image(self, project_id: str, image_id: str) -> Optional[Dict[str, Any]]:
+        conn = self.connection
+        row = conn.execute(
+            'SELECT data FROM images WHERE id = ? AND project_id = ?', (image_id, project_id)
+        ).fetchone()
+        if not row or row['data'] is None:
+            return None
+        record = json.loads(row['data'])
+        record['annotations'] = [
+            json.loads(ann['data']) for ann in conn.execute(
+                'SELECT data FROM annotations WHERE image_id = ? ORDER BY position', (image_id,)
+            )
+        ]
+        return record
+
+    def delete_image(self, image_id: str):
+        with self.transaction() as conn:
+            conn.execute('DELETE FROM annotation_terms WHERE image_id = ?', (image_id,))
+            conn.execute('DELETE FROM annotations WHERE image_id = ?', (image_id,))
+            conn.execute('DELETE FROM images WHERE id = ?', (image_id,))
+
+    def image_summaries(self, project_id: str, statuses: Optional[Iterable[str]] = None,
+                        limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        sql = 'SELECT summary FROM images WHERE project_id = ?'
+        params: List[Any] = [project_id]
+        if statuses is not None:
+            statuses = list(statuses)
+            sql += f" AND status IN ({','.join('?' * len(statuses))})"
+            params.extend(statuses)
+        sql += ' ORDER BY created_at'
+        if limit is not None:
+            sql += ' LIMIT ?'
+            params.append(limit)
+        return [json.loads(row['summary']) for row in self.connection.execute(sql, params)]
+
+    def image_sort_keys(self, project_id: str, sort: str, statuses: Optional[Iterable[str]] = None,
+                        default: Any = '') -> List[tuple]:
+        """Ascending (value, id) keys of a project's images, sorted by SQLite"""
+        column = 'created_at' if sort == 'created_at' else 'json_extract(summary, ?)'
+        sql = f'SELECT {column} AS value, id FROM images WHERE project_id = ?'
+        params: List[Any] = [] if sort == 'created_at' else [f'$.{sort}']
+        params.append(project_id)
+        if statuses is not None:
+            statuses = list(statuses)
+            sql += f" AND status IN ({','.join('?' * len(statuses))})"
+            params.extend(statuses)
+        if sort == 'created_at':
+            # يستخدم فهرس (project_id, created_at)
+            return [(row['value'], row['id']) for row in self.connection.execute(sql + ' ORDER BY created_at, id', params)]
+        return sorted((row['value'] or default, row['id']) for row in self.connection.execute(sql, params))
+
+    def get_summary(self, project_id: str, image_id: str) -> Optional[Dict[str, Any]]:
+        row = self.connection.execute(
+            'SELECT summary FROM images WHERE id = ? AND project_id = ?', (image_id, project_id)
+        ).fetchone()
+        return json.loads(row['summary']) if row else None
+
+    def count_images(self, project_id: str) -> int:
+        return self.connection.execute(
+            'SELECT COUNT(*) FROM images WHERE project_id = ?', (project_id,)
+        ).fetchone()[0]
+
+    def status_counts(self, project_id: str) -> Dict[str, int]:
+        rows = self.connection.execute(
+            'SELECT status, COUNT(*) AS n FROM images WHERE project_id = ? GROUP BY status', (project_id,)
+        )
+        return {row['status']: row['n'] for row in rows}
+
+    def processed_files_count(self, project_id: str) -> int:
+        return self.connection.execute(
+            "SELECT COUNT(*) FROM images WHERE project_id = ? AND status IN ('processed', 'annotated', 'completed') "
+            "AND json_extract(summary, '$.has_processed')", (project_id,)
+        ).fetchone()[0]
+
+    # ---------- Annotations ----------
+    def annotation_statistics(self, project_id: str, statuses: Optional[Iterable[str]] = None) -> Dict[str, Any]:
+        """Label/level histograms over annotations of images with the given statuses"""
+        where = 'a.project_id = ?'
+        params: List[Any] = [project_id]
+        if statuses is not None:
+            statuses = list(statuses)
+            where += f" AND i.status IN ({','.join('?' * len(statuses))})"
+            params.extend(statuses)
+        join = 'FROM annotations a JOIN images i ON i.id = a.image_id'
+        conn = self.connection
+
+        labels = {row[0]: row[1] for row in conn.execute(
+            f'SELECT a.label, COUNT(*) {join} WHERE {where} GROUP BY a.label', params)}
+        levels = {row[0]: row[1] for row in conn.execute(
+            f'SELECT a.level, COUNT(*) {join} WHERE {where} GROUP BY a.level', params)}
+        annotated_images = conn.execute(
+            f'SELECT COUNT(DISTINCT a.image_id) {join} WHERE {where}', params).fetchone()[0]
+        return {
+            'total_annotations': sum(labels.values()),
+            'annotated_images': annotated_images,
+            'labels': labels,
+            'levels': levels
+        }
+
+    def search_annotations(self, project_id: str, filters: Dict[str, List[str]],
+                           min_confidence: Optional[float] = None, max_confidence: Optional[float] = None,
+                           statuses: Optional[List[str]] = None, limit: int = 100,
+                           after: Optional[tuple] = None) -> Dict[str, Any]:
+        """Find annotations matching every filter, ordered by image (created_at, id) and position.
+
+        ``filters`` maps label/level/type/reason to accepted values (any of
+        them); ``after`` is the (created_at, image_id, position) key of the
+        last row of the previous page. Returns the page rows, whether more
+        follow and the total number of matches.
+        """
+        where = ['a.project_id = ?']
+        params: List[Any] = [project_id]
+        # قيم الحقل الواحد تُجمع (OR) والحقول المختلفة تتقاطع (AND)، كما في فهرس JSON
+        for field, values in filters.items():
+            if values:
+                where.append(
+                    'EXISTS (SELECT 1 FROM annotation_terms t WHERE t.image_id = a.image_id '
+                    f"AND t.position = a.position AND t.term IN ({', '.join('?' * len(values))}))"
+                )
+                params.extend(f"{field}:{value}" for value in values)
+        if min_confidence is not None:
+            where.append('a.confidence >= ?')
+            params.append(min_confidence)
+        if max_confidence is not None:
+            where.append('a.confidence <= ?')
+            params.append(max_confidence)
+        if statuses:
+            where.append(f"i.status IN ({', '.join('?' * len(statuses))})")
+            params.extend(statuses)
+
+        base = f"FROM annotations a JOIN images i ON i.id = a.image_id WHERE {' AND '.join(where)}"
+        conn = self.connection
+        total = conn.execute(f'SELECT COUNT(*) {base}', params).fetchone()[0]
+
+        page_sql = base
+        page_params = list(params)
+        if after is not None:
+            page_sql += ' AND (i.created_at, a.image_id, a.position) > (?, ?, ?)'
+            page_params.extend(after)
+        rows = conn.execute(
+            'SELECT i.created_at, a.image_id, a.position, a.data, '
+            f"json_extract(i.summary, '$.filename') AS filename {page_sql} "
+            'ORDER BY i.created_at, a.image_id, a.position LIMIT ?',
+            page_params + [limit + 1]
+        ).fetchall()
+        return {
+            'has_more': len(rows) > limit,
+            'rows': [
+                {
+                    'key': (row['created_at'], row['image_id'], row['position']),
+                    'image_id': row['image_id'],
+                    'filename': row['filename'],
+                    'annotation': json.loads(row['data'])
+                }
+                for row in rows[:limit]
+            ],
+            'total_count': total
+        }
+
+    def manifest(self, project_id: str) -> 'SQLiteManifest':
+        return SQLiteManifest(self, project_id)
+
+
+class _Transaction:
+    def __init__(self, conn: sqlite3.Connection):
+        self.conn = conn
+
+    def __enter__(self) -> sqlite3.Connection:
+        self.conn.execute('BEGIN IMMEDIATE')
+        return self.conn
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.conn.execute('COMMIT')
+        else:
+            self.conn.execute('ROLLBACK')
+        return False
+
+
+class SQLiteManifest:
+    """ProjectManifest interface backed by the images table"""
+
+    def __init__(self, store: SQLiteStore, project_id: str):
+        self.store = store
+        self.project_id = project_id
+
+    def get(self, image_id: str) -> Optional[Dict[str, Any]]:
+        return self.store.get_summary(self.project_id, image_id)
+
+    def put(self, row: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        previous = self.get(row['id'])
+        self.store.put_summary(row)
+        return previous
+
+    def remove(self, image_id: str) -> Optional[Dict[str, Any]]:
+        previous = self.get(image_id)
+        self.store.delete_image(image_id)
+        return previous
+
+    def save(self):
+        # Rows are written as they change
+        pass
+
+    def log_row(self, image_id: str):
+        # put() already wrote the row; there is no file to append to
+        pass
+
+    def rebuild(self):
+        """Recompute every summary row from the stored image records"""
+        from models.image import Image
+        from models.project import Project
+
+        project = Project.load(self.project_id)
+        if not project:
+            return
+        for row in self.store.image_summaries(self.project_id):
+            data = self.store.load_image(self.project_id, row['id'])
+            if data:
+                self.store.put_summary(Image.from_record(data, project.project_folder).to_summary())
+
+    def ordered_rows(self, statuses: Optional[Iterable[str]] = None) -> List[Dict[str, Any]]:
+        return self.store.image_summaries(self.project_id, statuses)
+
+    def sort_keys(self, sort: str = 'created_at', statuses: Optional[Iterable[str]] = None,
+                  default: Any = '') -> List[tuple]:
+        return self.store.image_sort_keys(self.project_id, sort, statuses, default)
+
+    def first_with_status(self, status: str) -> Optional[Dict[str, Any]]:
+        rows = self.store.image_summaries(self.project_id, [status], limit=1)
+        return rows[0] if rows else None
+
+    def status_counts(self) -> Dict[str, int]:
+        return self.store.status_counts(self.project_id)
+
+    def processed_files_count(self) -> int:
+        return self.store.processed_files_count(self.project_id)
+
+    def annotation_statistics(self, statuses: Optional[Iterable[str]] = None) -> Dict[str, Any]:
+        return self.store.annotation_statistics(self.project_id, statuses)
+
+    def __len__(self):
+        return self.store.count_images(self.project_id)
+
+
+_store: Optional[SQLiteStore] = None
+
+
+def configure_store(backend: str, db_path: str) -> Optional[SQLiteStore]:
+    """Select storage backend ('json' or 'sqlite')"""
+    global _store
+    if backend == 'sqlite':
+        _store = SQLiteStore(db_path)
+    else:
+        _store = None
+    return _store
+
+
+def get_store() -> Optional[SQLiteStore]:
+    """Get SQLite store, or None when the JSON file backend is active"""
+    return _store
@@ -0,0 +1,200 @@
+from typing import Any, Dict, Iterable, List, Mapping, Optional
+
+import numpy as np
+
+from services.spatial_index import annotation_extent
+
+LEVELS = ['character', 'word', 'line', 'paragraph']
+TYPES = ['bbox', 'polygon', 'missing_region']
+UNKNOWN_CODE = -1
+NO_LABEL = -1
+
+
+class LabelDictionary:
+    """Project-wide mapping between label strings and integer IDs"""
+
+    def __init__(self, labels: Iterable[str] = ()):
+        self.labels: List[str] = []
+        self._ids: Dict[str, int] = {}
+        for label in labels:
+            self.add(label)
+
+    @classmethod
+    def from_images(cls, images) -> 'LabelDictionary':
+        """Build dictionary of the (stripped, sorted) labels used by images"""
+        labels = set()
+        for image in images:
+            for annotation in image.annotations:
+                label = (annotation.get('label') or '').strip()
+                if label:
+                    labels.add(label)
+        return cls(sorted(labels))
+
+    def add(self, label: str) -> int:
+        """Get ID of label, registering it if new"""
+        label_id = self._ids.get(label)
+        if label_id is None:
+            label_id = self._ids[label] = len(self.labels)
+            self.labels.append(label)
+        return label_id
+
+    def get(self, label: str) -> int:
+        """Get ID of label, or NO_LABEL"""
+        return self._ids.get(label, NO_LABEL)
+
+    def __getitem__(self, label_id: int) -> str:
+        return self.labels[label_id]
+
+    def __contains__(self, label: str) -> bool:
+        return label in self._ids
+
+    def __len__(self):
+        return len(self.labels)
+
+
+def _source_box(annotation: Dict[str, Any]) -> List[float]:
+    """x, y, width, height as stored (the bounding extent for polygons)"""
+    bbox = annotation.get('bbox')
+    if isinstance(bbox, Mapping) and 'x' in bbox and 'y' in bbox:
+        return [float(bbox['x']), float(bbox['y']), float(bbox.get('width', 0)), float(bbox.get('height', 0))]
+    x0, y0, x1, y1 = annotation_extent(annotation)
+    return [x0, y0, x1 - x0, y1 - y0]
+
+
+def _code(value: Optional[str], names: List[str]) -> int:
+    try:
+        return names.index(value)
+    except ValueError:
+        return UNKNOWN_CODE
+
+
+class AnnotationColumns:
+    """Columnar view of one image's annotations.
+
+    Geometry is held as float32 ``x``/``y``/``w``/``h`` arrays (the bounding
+    extent for polygons), labels as IDs into a LabelDictionary and level and
+    type as small integer codes, so exports, IoU checks and coordinate
+    transforms run as NumPy operations instead of per-dict Python loops.
+    Row ``i`` is ``annotations[i]``; indexing and iteration still return the
+    original annotation dicts.
+    """
+
+    def __init__(self, annotations: List[Dict[str, Any]], labels: Optional[LabelDictionary] = None):
+        self.annotations = annotations
+        self.labels = labels if labels is not None else LabelDictionary()
+
+        count = len(annotations)
+        self.ids: List[Any] = [annotation.get('id') for annotation in annotations]
+        self.x = np.zeros(count, dtype=np.float32)
+        self.y = np.zeros(count, dtype=np.float32)
+        self.w = np.zeros(count, dtype=np.float32)
+        self.h = np.zeros(count, dtype=np.float32)
+        self.has_geometry = np.zeros(count, dtype=bool)
+        self.has_bbox = np.zeros(count, dtype=bool)
+        self.label_ids = np.full(count, NO_LABEL, dtype=np.int32)
+        self.levels = np.full(count, UNKNOWN_CODE, dtype=np.int8)
+        self.types = np.full(count, UNKNOWN_CODE, dtype=np.int8)
+
+        for i, annotation in enumerate(annotations):
+            extent = annotation_extent(annotation)
+            if extent is not None:
+                self.x[i], self.y[i] = extent[0], extent[1]
+                self.w[i], self.h[i] = extent[2] - extent[0], extent[3] - extent[1]
+                self.has_geometry[i] = True
+            self.has_bbox[i] = 'bbox' in annotation
+            label = (annotation.get('label') or '').strip()
+            if label:
+                self.label_ids[i] = self.labels.add(label)
+            self.levels[i] = _code(annotation.get('level'), LEVELS)
+            self.types[i] = _code(annotation.get('type'), TYPES)
+
+    def __len__(self):
+        return len(self.annotations)
+
+    def __getitem__(self, i: int) -> Dict[str, Any]:
+        return self.annotations[i]
+
+    def __iter__(self):
+        return iter(self.annotations)
+
+    # Selection
+
+    def mask(self, type: Optional[str] = None, level: Optional[str] = None, labeled: bool = False) -> np.ndarray:
+        """Boolean row mask for annotations with geometry matching the filters"""
+        result = self.has_geometry.copy()
+        if type is not None:
+            result &= self.types == _code(type, TYPES)
+        if level is not None:
+            result &= self.levels == _code(level, LEVELS)
+        if labeled:
+            result &= self.label_ids != NO_LABEL
+        return result
+
+    def boxes(self, mask: Optional[np.ndarray] = None) -> np.ndarray:
+        """(N, 4) float32 array of x, y, w, h"""
+        boxes = np.stack([self.x, self.y, self.w, self.h], axis=1)
+        return boxes if mask is None else boxes[mask]
+
+    def extents(self, mask: Optional[np.ndarray] = None) -> np.ndarray:
+        """(N, 4) float32 array of x0, y0, x1, y1"""
+        extents = np.stack([self.x, self.y, self.x + self.w, self.y + self.h], axis=1)
+        return extents if mask is None else extents[mask]
+
+    def areas(self) -> np.ndarray:
+        """Box areas"""
+        return self.w * self.h
+
+    # Transforms
+
+    def transform(self, scale: float, offset_x: float = 0, offset_y: float = 0) -> np.ndarray:
+        """Scale and translate all boxes; returns (N, 4) x, y, w, h"""
+        boxes = self.boxes()
+        boxes *= np.float32(scale)
+        boxes[:, 0] += offset_x
+        boxes[:, 1] += offset_y
+        return boxes
+
+    def to_yolo(self, scale: float, pad_x: float, pad_y: float, size: int, mask: Optional[np.ndarray] = None):
+        """Letterbox boxes into a size x size canvas in normalized YOLO form.
+
+        Returns (label_ids, boxes) where boxes is (N, 4) float64 of
+        x_center, y_center, width, height clipped to [0, 1]. By default
+        only labeled bbox annotations with a ``bbox`` key are exported.
+        The coordinates are read from the annotations in float64 rather
+        than from the float32 columns, so the written 6-decimal values
+        don't depend on the column precision.
+        """
+        if mask is None:
+            mask = self.mask(type='bbox', labeled=True) & self.has_bbox
+        rows = np.flatnonzero(mask)
+        boxes = np.array([_source_box(self.annotations[i]) for i in rows], dtype=np.float64).reshape(-1, 4)
+        boxes[:, 0] = boxes[:, 0] * scale + pad_x
+        boxes[:, 1] = boxes[:, 1] * scale + pad_y
+        boxes[:, 2:] *= scale
+        boxes[:, 0] += boxes[:, 2] / 2
+        boxes[:, 1] += boxes[:, 3] / 2
+        boxes /= size
+        np.clip(boxes, 0, 1, out=boxes)
+        return self.label_ids[rows], boxes
+
+    # Overlap
+
+    def pairwise_iou(self, mask: Optional[np.ndarray] = None) -> np.ndarray:
+        """(N, N) IoU matrix between the selected boxes"""
+        extents = self.extents(mask)
+        return extents_iou(extents, extents)
+
+
+def extents_iou(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """IoU matrix between (N, 4) and (M, 4) arrays of x0, y0, x1, y1"""
+    a = a.astype(np.float64, copy=False)
+    b = b.astype(np.float64, copy=False)
+    ix = np.minimum(a[:, None, 2], b[None, :, 2]) - np.maximum(a[:, None, 0], b[None, :, 0])
+    iy = np.minimum(a[:, None, 3], b[None, :, 3]) - np.maximum(a[:, None, 1], b[None, :, 1])
+    intersection = np.clip(ix, 0, None) * np.clip(iy, 0, None)
+    area_a = (a[:, 2] - a[:, 0]) * (a[:, 3] - a[:, 1])
+    area_b = (b[:, 2] - b[:, 0]) * (b[:, 3] - b[:, 1])
+    union = area_a[:, None] + area_b[None, :] - intersection
+    with np.errstate(divide='ignore', invalid='ignore'):
+        iou = np.where(union > 0, intersection / union, 0.0)
+    return iou
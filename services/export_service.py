@@ -8,6 +8,7 @@ from datetime import datetime
 from typing import Dict, List
 from models.project import Project
 from models.image import Image
+from services.annotation_columns import LabelDictionary
 import cv2
 import numpy as np
 
@@ -67,18 +68,11 @@ class ExportService:
         }
         
         # Create class names from annotations
-        class_names = set()
-        for image in annotated_images:
-            for annotation in image.annotations:
-                if annotation.get('label') and annotation['label'].strip():
-                    class_names.add(annotation['label'].strip())
-        
-        class_names = sorted(list(class_names))
+        labels = LabelDictionary.from_images(annotated_images)
+        class_names = labels.labels
         if not class_names:
             raise ValueError("No labeled annotations found for export")
         
-        class_to_id = {name: idx for idx, name in enumerate(class_names)}
-        
         # Write classes.txt
         with open(os.path.join(export_dir, 'classes.txt'), 'w', encoding='utf-8') as f:
             for class_name in class_names:
@@ -126,29 +120,11 @@ class ExportService:
                     pad_y = (target_size - new_h) // 2
                 label_filename = f"{os.path.splitext(image.filename)[0]}.txt"
                 label_file = os.path.join(export_dir, 'labels', split_name, label_filename)
+                columns = image.get_annotation_columns(labels)
+                class_ids, boxes = columns.to_yolo(scale, pad_x, pad_y, target_size)
                 with open(label_file, 'w', encoding='utf-8') as f:
-                    for annotation in image.annotations:
-                        if annotation.get('type') == 'missing_region':
-                            continue
-                        if (annotation.get('type') == 'bbox' and 
-                            annotation.get('label') and 
-                            annotation['label'].strip() and
-                            'bbox' in annotation):
-                            class_id = class_to_id.get(annotation['label'].strip(), 0)
-                            b = annotation['bbox']
-                            x = b['x'] * scale + pad_x
-                            y = b['y'] * scale + pad_y
-                            w = b['width'] * scale
-                            h = b['height'] * scale
-                            x_center = (x + w / 2) / target_size
-                            y_center = (y + h / 2) / target_size
-                            nw = w / target_size
-                            nh = h / target_size
-                            x_center = max(0, min(1, x_center))
-                            y_center = max(0, min(1, y_center))
-                            nw = max(0, min(1, nw))
-                            nh = max(0, min(1, nh))
-                            f.write(f"{class_id} {x_center:.6f} {y_center:.6f} {nw:.6f} {nh:.6f}\n")
+                    for class_id, (x_center, y_center, nw, nh) in zip(class_ids.tolist(), boxes.tolist()):
+                        f.write(f"{class_id} {x_center:.6f} {y_center:.6f} {nw:.6f} {nh:.6f}\n")
         
         # Create data.yaml
         yaml_content = f"""path: {export_dir}
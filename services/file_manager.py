@@ -6,6 +6,9 @@ from PIL import Image as PILImage
 from typing import List
 from models.project import Project
 from models.image import Image
+from models.session import current_unit_of_work, begin_unit_of_work, end_unit_of_work
+from models.persistence import json_store
+from models.sqlite_store import get_store
 
 class FileManager:
     def __init__(self):
@@ -31,6 +34,22 @@ class FileManager:
         # Sort files for consistent ordering
         image_files.sort()
         
+        # Batch metadata writes (manifest, project statistics) into one flush
+        own_unit_of_work = current_unit_of_work() is None
+        if own_unit_of_work:
+            begin_unit_of_work()
+        try:
+            self._copy_image_files(project, images_path, image_files, images)
+        finally:
+            if own_unit_of_work:
+                end_unit_of_work()
+        
+        # Keep the caller's project instance in sync with the new counters
+        project.update_statistics()
+        
+        return images
+    
+    def _copy_image_files(self, project: Project, images_path: str, image_files: List[str], images: List[Image]):
         for filename in image_files:
             source_path = os.path.join(images_path, filename)
             
@@ -48,8 +67,6 @@ class FileManager:
             except Exception as e:
                 print(f"Error processing image {filename}: {e}")
                 continue
-        
-        return images
 
     def _sanitize_filename(self, filename: str) -> str:
         """Sanitize filename to be filesystem safe"""
@@ -98,29 +115,31 @@ class FileManager:
     
     def cleanup_project(self, project: Project):
         """Clean up all project files"""
-        if os.path.exists(project.project_folder):
-            shutil.rmtree(project.project_folder)
+        project.delete()
+    
+    def _get_next_image_with_status(self, project_id: str, status: str) -> Image:
+        manifest = Image.get_manifest(project_id)
+        if manifest is None:
+            return None
+        row = manifest.first_with_status(status)
+        return Image.load(project_id, row['id']) if row else None
     
     def get_next_unprocessed_image(self, project_id: str) -> Image:
         """Get next unprocessed image for auto-flow"""
-        images = Image.load_all_for_project(project_id)
-        for image in images:
-            if image.status == 'unprocessed':
-                return image
-        return None
+        return self._get_next_image_with_status(project_id, 'unprocessed')
     
     def get_next_unannotated_image(self, project_id: str) -> Image:
         """Get next processed but unannotated image for auto-flow"""
-        images = Image.load_all_for_project(project_id)
-        for image in images:
-            if image.status == 'processed':
-                return image
-        return None
+        return self._get_next_image_with_status(project_id, 'processed')
     
     def get_images_by_status(self, project_id: str, status: str) -> List[Image]:
         """Get all images with specific status"""
-        images = Image.load_all_for_project(project_id)
-        return [img for img in images if img.status == status]
+        images = []
+        for row in Image.list_summaries(project_id, [status]):
+            image = Image.load(project_id, row['id'])
+            if image:
+                images.append(image)
+        return images
     
     def get_images_for_workflow(self, project_id: str, workflow: str) -> List[Image]:
         """Get images appropriate for specific workflow"""
@@ -235,6 +254,8 @@ class FileManager:
         import zipfile
         
         os.makedirs(os.path.dirname(backup_path), exist_ok=True)
+        # Queued metadata/annotation writes must be on disk before zipping
+        json_store.flush()
         
         with zipfile.ZipFile(backup_path, 'w', zipfile.ZIP_DEFLATED) as zipf:
             for root, dirs, files in os.walk(project.project_folder):
@@ -242,6 +263,16 @@ class FileManager:
                     file_path = os.path.join(root, file)
                     arcname = os.path.relpath(file_path, project.project_folder)
                     zipf.write(file_path, arcname)
+            
+            # With the SQLite backend, metadata lives in the database; back it up in the JSON layout
+            store = get_store()
+            if store is not None:
+                zipf.writestr('metadata.json', json.dumps(project.to_metadata(), indent=2, ensure_ascii=False))
+                for summary in store.image_summaries(project.id):
+                    record = store.load_image(project.id, summary['id'])
+                    if record:
+                        zipf.writestr(f"annotations/{record['id']}.json",
+                                      json.dumps(record, indent=2, ensure_ascii=False))
         
         return backup_path
     
@@ -284,6 +315,7 @@ class FileManager:
             
             project.created_at = data['created_at']
             project.updated_at = data['updated_at']
+            project.storage_version = data.get('storage_version', 1)
             project.settings = data.get('settings', project.settings)
             project.statistics = data.get('statistics', project.statistics)
             
@@ -300,4 +332,15 @@ class FileManager:
                     os.makedirs(os.path.dirname(dst_path), exist_ok=True)
                     shutil.copy2(src_path, dst_path)
             
+            # Make restored project visible to Project.load
+            project.register()
+            store = get_store()
+            if store is not None:
+                from services.storage_migration import import_project_folder
+                import_project_folder(store, project.project_folder)
+            
+            # Backups may predate the current storage layout
+            from models.migrations import migrate_project
+            migrate_project(project)
+            
             return project
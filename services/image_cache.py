@@ -0,0 +1,99 @@
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+import cv2
+
+DEFAULT_BUDGET_BYTES = 256 * 1024 * 1024
+# Decode scale -> cv2.imread flag (the reduced flags decode JPEGs at 1/n directly)
+READ_FLAGS = {
+    1: cv2.IMREAD_COLOR,
+    2: cv2.IMREAD_REDUCED_COLOR_2,
+    4: cv2.IMREAD_REDUCED_COLOR_4,
+    8: cv2.IMREAD_REDUCED_COLOR_8
+}
+
+
+class DecodedImageCache:
+    """Byte-budgeted LRU cache of decoded images.
+
+    Entries are keyed by ``(path, mtime, size, scale)``, so a file replaced
+    on disk is decoded again. Arrays are returned read-only and shared by
+    all callers (preview, processing, statistics, segmentation); code that
+    needs to draw on an image must copy it first.
+    """
+
+    def __init__(self, budget_bytes: int = DEFAULT_BUDGET_BYTES):
+        self.budget_bytes = budget_bytes
+        self._entries: 'OrderedDict[Tuple, Any]' = OrderedDict()
+        self._lock = threading.Lock()
+        self.size_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def configure(self, budget_bytes: int):
+        """Apply memory budget (0 disables the cache)"""
+        with self._lock:
+            self.budget_bytes = max(int(budget_bytes), 0)
+            self._evict()
+
+    def read(self, path: str, scale: int = 1):
+        """Decode path at 1/scale (1, 2, 4 or 8), or None if it can't be read"""
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        key = (path, stat.st_mtime_ns, stat.st_size, scale)
+        with self._lock:
+            img = self._entries.get(key)
+            if img is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return img
+            self.misses += 1
+
+        img = cv2.imread(path, READ_FLAGS[scale])
+        if img is None:
+            return None
+        img.flags.writeable = False
+        if img.nbytes <= self.budget_bytes:
+            with self._lock:
+                if key not in self._entries:
+                    self._entries[key] = img
+                    self.size_bytes += img.nbytes
+                    self._evict()
+        return img
+
+    def _evict(self):
+        while self._entries and self.size_bytes > self.budget_bytes:
+            _, img = self._entries.popitem(last=False)
+            self.size_bytes -= img.nbytes
+            self.evictions += 1
+
+    def discard(self, path: Optional[str] = None):
+        """Drop all decoded versions of path, or everything"""
+        with self._lock:
+            if path is None:
+                self._entries.clear()
+                self.size_bytes = 0
+                return
+            for key in [key for key in self._entries if key[0] == path]:
+                self.size_bytes -= self._entries.pop(key).nbytes
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'size_bytes': self.size_bytes,
+                'budget_bytes': self.budget_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': round(self.hits / lookups, 4) if lookups else 0.0,
+                'evictions': self.evictions
+            }
+
+
+decoded_images = DecodedImageCache()
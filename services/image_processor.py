@@ -2,14 +2,17 @@ import cv2
 import numpy as np
 from PIL import Image as PILImage
 import os
-from typing import Dict, Any, Tuple
-import json
-import hashlib
+from typing import Dict, Any, Optional, Tuple
 from datetime import datetime
+from models.persistence import write_file_atomic
+from services.processing_plan import compile_plan, settings_fingerprint
+from services.stage_cache import stage_cache, SOURCE_PREFIX
+from services.image_cache import decoded_images, READ_FLAGS
+from services.preview_cache import preview_cache, preview_filename
 
 class ImageProcessor:
     def __init__(self):
-        self.preview_cache = {}  # ذاكرة تخزين مؤقت للمعاينات
+        self.preview_cache = preview_cache  # فهرس ملفات المعاينة المشترك (محدود الحجم)
 
     def _letterbox_resize_array(self, img, size: int = 640):
         h, w = img.shape[:2]
@@ -28,11 +31,44 @@ class ImageProcessor:
     # ---------- Helpers ----------
     def _settings_fingerprint(self, settings: Dict[str, Any]) -> str:
         """Create a deterministic short fingerprint for settings for cache keys and filenames."""
+        return settings_fingerprint(settings)
+
+    def _original_size(self, image) -> Optional[Tuple[int, int]]:
+        """Get (width, height) of the original without decoding it"""
+        if image.original_width and image.original_height:
+            return image.original_width, image.original_height
+        # سجلات قديمة بدون أبعاد محفوظة: PIL يقرأ ترويسة الملف فقط
         try:
-            dumped = json.dumps(settings or {}, sort_keys=True, separators=(",", ":"))
+            with PILImage.open(image.original_image_path) as pil_img:
+                return pil_img.size
         except Exception:
-            dumped = str(settings)
-        return hashlib.md5(dumped.encode("utf-8")).hexdigest()[:12]
+            return None
+
+    def _read_preview_source(self, image, width: int, height: int):
+        """Decode the original scaled to fit (width, height).
+
+        JPEG originals are decoded at 1/2, 1/4 or 1/8 scale directly by the
+        codec when the preview is that much smaller, so the cost follows
+        the preview size instead of the scan resolution.
+        """
+        size = self._original_size(image)
+        reduction = 1
+        if size is not None and (size[0] > width or size[1] > height):
+            scale = min(width / size[0], height / size[1])
+            # أكبر تصغير لا يقل ناتجه عن حجم المعاينة
+            reduction = max(n for n in READ_FLAGS if n <= 1 / scale)
+
+        img = decoded_images.read(image.original_image_path, reduction)
+        if img is None:
+            return None
+
+        original_width, original_height = size or (img.shape[1], img.shape[0])
+        if original_width > width or original_height > height:
+            scale = min(width / original_width, height / original_height)
+            new_width = int(original_width * scale)
+            new_height = int(original_height * scale)
+            img = cv2.resize(img, (new_width, new_height), interpolation=cv2.INTER_AREA)
+        return img
 
     def _normalize_preview_size(self, preview_size) -> Tuple[int, int]:
         """Normalize preview_size to (width, height), supporting dict or tuple."""
@@ -57,7 +93,7 @@ class ImageProcessor:
                 print(f"Original image not found: {image.original_image_path}")
                 return False
             
-            img = cv2.imread(image.original_image_path)
+            img = decoded_images.read(image.original_image_path)
             if img is None:
                 print(f"Failed to load image: {image.original_image_path}")
                 return False
@@ -109,36 +145,9 @@ class ImageProcessor:
                              preview_size: Tuple[int, int] = (640, 640)) -> str:
         """Generate processing preview and return preview path"""
         try:
-            # Normalize size and create deterministic cache key
+            # Normalize size and build the deterministic preview path
             width, height = self._normalize_preview_size(preview_size)
             fp = self._settings_fingerprint(settings)
-            cache_key = f"{image.id}_{fp}_{width}x{height}"
-
-            # التحقق من الذاكرة المؤقتة أولاً
-            if cache_key in self.preview_cache:
-                preview_path = self.preview_cache[cache_key]
-                if os.path.exists(preview_path):
-                    return preview_path
-
-            if not os.path.exists(image.original_image_path):
-                raise Exception("Original image not found")
-
-            img = cv2.imread(image.original_image_path)
-            if img is None:
-                raise Exception("Failed to load image")
-
-            # حفظ الأبعاد الأصلية
-            original_height, original_width = img.shape[:2]
-
-            # تغيير الحجم للمعاينة لتحسين الأداء
-            if original_width > width or original_height > height:
-                scale = min(width / original_width, height / original_height)
-                new_width = int(original_width * scale)
-                new_height = int(original_height * scale)
-                img = cv2.resize(img, (new_width, new_height), interpolation=cv2.INTER_AREA)
-
-            # تطبيق المعالجة
-            processed_img = self.apply_processing_pipeline(img, settings)
 
             # حفظ المعاينة في المجلد المخصص
             from models.project import Project
@@ -148,16 +157,53 @@ class ImageProcessor:
             else:
                 # fallback للطريقة القديمة
                 preview_dir = os.path.join(os.path.dirname(image.original_image_path), 'previews')
-            os.makedirs(preview_dir, exist_ok=True)
+            preview_path = os.path.join(preview_dir, preview_filename(image.id, fp, width, height))
+
+            # التحقق من الذاكرة المؤقتة أولاً
+            if self.preview_cache.get(preview_path):
+                return preview_path
+
+            if not os.path.exists(image.original_image_path):
+                raise Exception("Original image not found")
+
+            # استئناف المعالجة من أعمق مرحلة محفوظة لنفس الصورة والإعدادات السابقة
+            stat = os.stat(image.original_image_path)
+            source = (image.id, stat.st_mtime_ns, stat.st_size, width, height)
+            try:
+                plan = compile_plan(settings)
+            except Exception as e:
+                # إعدادات غير صالحة (مثل "abc" بدل رقم): معاينة الصورة دون معالجة
+                print(f"Error in processing settings: {e}")
+                plan = compile_plan({})
+            start, img = stage_cache.resume_point(source, plan)
+
+            if img is None:
+                img = self._read_preview_source(image, width, height)
+                if img is None:
+                    raise Exception("Failed to load image")
+                stage_cache.put(source, SOURCE_PREFIX, img)
+
+            # تطبيق المعالجة مع حفظ ناتج كل مرحلة
+            try:
+                processed_img = plan.run(
+                    img, start,
+                    on_stage=lambda i, buffer: stage_cache.put(source, plan.prefixes[i], buffer)
+                )
+            except Exception as e:
+                print(f"Error in processing pipeline: {e}")
+                processed_img = plan.to_bgr(img)
 
-            preview_filename = f"{image.id}_preview_{fp}.jpg"
-            preview_path = os.path.join(preview_dir, preview_filename)
+            os.makedirs(preview_dir, exist_ok=True)
 
             quality = min(max(settings.get('quality', 85), 1), 100)
-            cv2.imwrite(preview_path, processed_img, [cv2.IMWRITE_JPEG_QUALITY, quality])
+            ok, encoded = cv2.imencode('.jpg', processed_img, [cv2.IMWRITE_JPEG_QUALITY, quality])
+            if not ok:
+                raise Exception("Failed to encode preview")
+            # طلبات متزامنة لنفس المعاينة لا ترى ملفاً نصف مكتوب
+            write_file_atomic(preview_path, encoded.tobytes(), fsync=False)
 
-            # تخزين في الذاكرة المؤقتة
-            self.preview_cache[cache_key] = preview_path
+            # تسجيل الملف في الفهرس (قد يحذف أقدم المعاينات)
+            self.preview_cache.add(preview_path)
 
             return preview_path
 
@@ -170,217 +216,7 @@ class ImageProcessor:
     def apply_processing_pipeline(self, img, settings: Dict[str, Any]):
         """Apply processing pipeline to image"""
         try:
-            processed_img = img.copy()
-
-            # 1. Grayscale conversion
-            if settings.get('grayscale', False):
-                if len(processed_img.shape) == 3:
-                    processed_img = cv2.cvtColor(processed_img, cv2.COLOR_BGR2GRAY)
-                    processed_img = cv2.cvtColor(processed_img, cv2.COLOR_GRAY2BGR)
-
-            # 1.5 Illumination/background correction
-            illum_settings = settings.get('illumination', {})
-            if illum_settings.get('enabled', False):
-                # Estimate background using a large blur then normalize
-                gray = cv2.cvtColor(processed_img, cv2.COLOR_BGR2GRAY)
-                k = int(illum_settings.get('blur_kernel', 41))
-                k = max(3, k if k % 2 == 1 else k + 1)
-                background = cv2.GaussianBlur(gray, (k, k), 0)
-                # Avoid division by zero
-                background = np.maximum(background, 1)
-                norm = (gray.astype(np.float32) / background.astype(np.float32))
-                norm = np.clip(norm * 255.0, 0, 255).astype(np.uint8)
-                processed_img = cv2.cvtColor(norm, cv2.COLOR_GRAY2BGR)
-
-            # 1.7 Shadow removal (Gaussian blur background subtraction)
-            shadow_settings = settings.get('shadow_remove', {})
-            if shadow_settings.get('enabled', False):
-                gray = cv2.cvtColor(processed_img, cv2.COLOR_BGR2GRAY)
-                k = int(shadow_settings.get('blur_kernel', 31))
-                k = max(3, k if k % 2 == 1 else k + 1)
-                background = cv2.GaussianBlur(gray, (k, k), 0)
-                sub = cv2.subtract(gray, background)
-                sub = cv2.normalize(sub, None, 0, 255, cv2.NORM_MINMAX)
-                processed_img = cv2.cvtColor(sub, cv2.COLOR_GRAY2BGR)
-
-            # 2. CLAHE (Contrast Limited Adaptive Histogram Equalization)
-            clahe_settings = settings.get('clahe', {})
-            if clahe_settings.get('enabled', False):
-                clip_limit = max(float(clahe_settings.get('clip_limit', 2.0)), 0.01)
-                tile_grid_size = int(clahe_settings.get('tile_grid_size', 8))
-                tile_grid_size = max(tile_grid_size, 1)
-
-                # Convert to LAB color space
-                lab = cv2.cvtColor(processed_img, cv2.COLOR_BGR2LAB)
-                l, a, b = cv2.split(lab)
-
-                # Apply CLAHE to L channel
-                clahe = cv2.createCLAHE(clipLimit=clip_limit, tileGridSize=(tile_grid_size, tile_grid_size))
-                l = clahe.apply(l)
-
-                # Merge channels and convert back
-                lab = cv2.merge([l, a, b])
-                processed_img = cv2.cvtColor(lab, cv2.COLOR_LAB2BGR)
-
-            # 2.2 Local contrast (advanced) using CLAHE or equalizeHist
-            lc_settings = settings.get('local_contrast', {})
-            if lc_settings.get('enabled', False):
-                method = (lc_settings.get('method') or 'clahe').lower()
-                gray = cv2.cvtColor(processed_img, cv2.COLOR_BGR2GRAY)
-                if method == 'equalize':
-                    eq = cv2.equalizeHist(gray)
-                    processed_img = cv2.cvtColor(eq, cv2.COLOR_GRAY2BGR)
-                else:
-                    clip = max(float(lc_settings.get('clip_limit', 2.5)), 0.01)
-                    tile = int(lc_settings.get('tile_grid_size', 8))
-                    tile = max(tile, 1)
-                    clahe = cv2.createCLAHE(clipLimit=clip, tileGridSize=(tile, tile))
-                    eq = clahe.apply(gray)
-                    processed_img = cv2.cvtColor(eq, cv2.COLOR_GRAY2BGR)
-
-            # 2.5 Gamma correction
-            gamma_settings = settings.get('gamma', {})
-            if gamma_settings.get('enabled', False):
-                g = float(gamma_settings.get('value', 1.0))
-                g = max(0.1, min(5.0, g))
-                inv = 1.0 / g
-                table = (np.linspace(0, 1, 256) ** inv * 255).astype('uint8')
-                processed_img = cv2.LUT(processed_img, table)
-
-            # 3. Thresholding
-            threshold_settings = settings.get('threshold', {})
-            if threshold_settings.get('enabled', False):
-                gray = cv2.cvtColor(processed_img, cv2.COLOR_BGR2GRAY)
-                thresh_type = threshold_settings.get('type', 'binary')
-                thresh_value = int(threshold_settings.get('value', 127))
-                max_value = int(threshold_settings.get('max_value', 255))
-                thresh_value = min(max(thresh_value, 0), 255)
-                max_value = min(max(max_value, 1), 255)
-
-                if thresh_type == 'binary':
-                    _, thresh = cv2.threshold(gray, thresh_value, max_value, cv2.THRESH_BINARY)
-                elif thresh_type == 'binary_inv':
-                    _, thresh = cv2.threshold(gray, thresh_value, max_value, cv2.THRESH_BINARY_INV)
-                elif thresh_type == 'adaptive_mean':
-                    block_size = int(threshold_settings.get('block_size', 11))
-                    c_val = int(threshold_settings.get('c', 2))
-                    block_size = block_size if block_size % 2 == 1 else block_size + 1
-                    block_size = max(block_size, 3)
-                    thresh = cv2.adaptiveThreshold(gray, max_value, cv2.ADAPTIVE_THRESH_MEAN_C, cv2.THRESH_BINARY, block_size, c_val)
-                elif thresh_type == 'adaptive_gaussian':
-                    block_size = int(threshold_settings.get('block_size', 11))
-                    c_val = int(threshold_settings.get('c', 2))
-                    block_size = block_size if block_size % 2 == 1 else block_size + 1
-                    block_size = max(block_size, 3)
-                    thresh = cv2.adaptiveThreshold(gray, max_value, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, cv2.THRESH_BINARY, block_size, c_val)
-                else:
-                    _, thresh = cv2.threshold(gray, thresh_value, max_value, cv2.THRESH_BINARY)
-
-                processed_img = cv2.cvtColor(thresh, cv2.COLOR_GRAY2BGR)
-
-            # 4. Deskewing
-            if settings.get('deskew', {}).get('enabled', False):
-                # Simple deskewing using Hough lines
-                gray = cv2.cvtColor(processed_img, cv2.COLOR_BGR2GRAY)
-                edges = cv2.Canny(gray, 50, 150, apertureSize=3)
-                lines = cv2.HoughLines(edges, 1, np.pi/180, threshold=100)
-
-                if lines is not None:
-                    angles = []
-                    for line in lines[:10]:  # Use first 10 lines
-                        rho, theta = line[0]
-                        angle = (theta * 180.0 / np.pi)
-                        if angle > 90:
-                            angle = angle - 180
-                        angles.append(angle)
-
-                    if angles:
-                        median_angle = np.median(angles)
-                        if abs(median_angle) > 0.5:  # Only rotate if angle is significant
-                            h, w = processed_img.shape[:2]
-                            center = (w // 2, h // 2)
-                            rotation_matrix = cv2.getRotationMatrix2D(center, median_angle, 1.0)
-                            processed_img = cv2.warpAffine(processed_img, rotation_matrix, (w, h),
-                                                         flags=cv2.INTER_CUBIC, borderMode=cv2.BORDER_REPLICATE)
-
-            # 4.5 Smoothing: bilateral and median (before morphology)
-            bilateral_settings = settings.get('bilateral', {})
-            if bilateral_settings.get('enabled', False):
-                d = int(bilateral_settings.get('diameter', 7))
-                sigma_color = float(bilateral_settings.get('sigma_color', 50))
-                sigma_space = float(bilateral_settings.get('sigma_space', 50))
-                d = max(1, d)
-                processed_img = cv2.bilateralFilter(processed_img, d, sigma_color, sigma_space)
-
-            median_settings = settings.get('median', {})
-            if median_settings.get('enabled', False):
-                k = int(median_settings.get('kernel', 3))
-                k = max(3, k if k % 2 == 1 else k + 1)
-                processed_img = cv2.medianBlur(processed_img, k)
-
-            # 5. Morphological operations
-            morph_settings = settings.get('morphology', {})
-            if morph_settings.get('enabled', False):
-                operation = (morph_settings.get('operation', 'opening') or 'opening')
-                kernel_size = int(morph_settings.get('kernel_size', 3))
-                iterations = int(morph_settings.get('iterations', 1))
-                kernel_size = max(kernel_size, 1)
-                iterations = max(iterations, 1)
-
-                kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (kernel_size, kernel_size))
-
-                if operation == 'opening':
-                    processed_img = cv2.morphologyEx(processed_img, cv2.MORPH_OPEN, kernel, iterations=iterations)
-                elif operation == 'closing':
-                    processed_img = cv2.morphologyEx(processed_img, cv2.MORPH_CLOSE, kernel, iterations=iterations)
-                elif operation == 'erosion':
-                    processed_img = cv2.erode(processed_img, kernel, iterations=iterations)
-                elif operation == 'dilation':
-                    processed_img = cv2.dilate(processed_img, kernel, iterations=iterations)
-
-            # 6. Denoising
-            denoise_settings = settings.get('denoise', {})
-            if denoise_settings.get('enabled', False):
-                strength = int(denoise_settings.get('strength', 10))
-                strength = min(max(strength, 1), 30)
-                processed_img = cv2.fastNlMeansDenoisingColored(processed_img, None, strength, strength, 7, 21)
-
-            # 7. Sharpening
-            sharpen_settings = settings.get('sharpen', {})
-            if sharpen_settings.get('enabled', False):
-                strength = float(sharpen_settings.get('strength', 1.0))
-                strength = max(strength, 0.0)
-                kernel = np.array([[-1,-1,-1], [-1,9,-1], [-1,-1,-1]], dtype=np.float32) * strength
-                processed_img = cv2.filter2D(processed_img, -1, kernel)
-
-            # 7.5 Edge enhancement (Laplacian)
-            edge_settings = settings.get('edge_enhance', {})
-            if edge_settings.get('enabled', False):
-                alpha = float(edge_settings.get('alpha', 0.3))
-                alpha = max(0.0, min(2.0, alpha))
-                gray = cv2.cvtColor(processed_img, cv2.COLOR_BGR2GRAY)
-                lap = cv2.Laplacian(gray, cv2.CV_16S, ksize=3)
-                lap = cv2.convertScaleAbs(lap)
-                lap = cv2.cvtColor(lap, cv2.COLOR_GRAY2BGR)
-                processed_img = cv2.addWeighted(processed_img, 1.0, lap, alpha, 0)
-
-            # 7.8 Speck removal/inpainting (simple mask-based smoothing)
-            speck_settings = settings.get('speck_remove', {})
-            if speck_settings.get('enabled', False):
-                area_thr = int(speck_settings.get('max_area', 20))
-                gray = cv2.cvtColor(processed_img, cv2.COLOR_BGR2GRAY)
-                _, bw = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
-                inv = 255 - bw
-                cnts, _ = cv2.findContours(inv, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
-                mask = np.zeros_like(gray)
-                for c in cnts:
-                    if cv2.contourArea(c) <= area_thr:
-                        cv2.drawContours(mask, [c], -1, 255, thickness=cv2.FILLED)
-                if np.count_nonzero(mask) > 0:
-                    processed_img = cv2.inpaint(processed_img, mask, 3, cv2.INPAINT_TELEA)
-
-            return processed_img
-
+            return compile_plan(settings).run(img)
         except Exception as e:
             print(f"Error in processing pipeline: {e}")
             import traceback
@@ -389,26 +225,73 @@ class ImageProcessor:
     
     def clear_preview_cache(self, image_id: str = None):
         """Clear preview cache for specific image or all images"""
-        if image_id:
-            keys_to_remove = [k for k in self.preview_cache.keys() if k.startswith(image_id)]
-            for key in keys_to_remove:
-                # حذف ملف المعاينة من القرص
-                try:
-                    if os.path.exists(self.preview_cache[key]):
-                        os.remove(self.preview_cache[key])
-                except:
-                    pass
-                del self.preview_cache[key]
-        else:
-            # حذف جميع ملفات المعاينة
-            for preview_path in self.preview_cache.values():
-                try:
-                    if os.path.exists(preview_path):
-                        os.remove(preview_path)
-                except:
-                    pass
-            self.preview_cache.clear()
+        stage_cache.discard(image_id)
+        # حذف ملفات المعاينة من القرص
+        self.preview_cache.discard(image_id)
     
+    def get_image_statistics(self, image_path: str) -> Dict[str, Any]:
+        """Get statistics about an image"""
+        stats = {
+            'width': 0,
+            'height': 0,
+            'file_size': 0,
+            'brightness': 0,
+            'contrast': 0,
+            'sharpness': 0
+        }
+        
+        try:
+            if os.path.exists(image_path):
+                stats['file_size'] = os.path.getsize(image_path)
+            
+            img = decoded_images.read(image_path)
+            if img is None:
+                return stats
+            
+            height, width = img.shape[:2]
+            stats['width'] = width
+            stats['height'] = height
+            
+            if len(img.shape) == 3:
+                gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+            else:
+                gray = img
+            
+            stats['brightness'] = float(np.mean(gray))
+            stats['contrast'] = float(np.std(gray))
+            
+            laplacian = cv2.Laplacian(gray, cv2.CV_64F)
+            stats['sharpness'] = float(laplacian.var())
+            
+        except Exception as e:
+            print(f"Error calculating image statistics: {e}")
+        
+        return stats
+
+    def suggest_processing_settings(self, image_path: str) -> Dict[str, Any]:
+        """Suggest processing settings from image brightness, contrast and sharpness"""
+        stats = self.get_image_statistics(image_path)
+        brightness = stats['brightness']
+        contrast = stats['contrast']
+        sharpness = stats['sharpness']
+
+        return {
+            'grayscale': True,  # Always good for OCR
+            'illumination': {'enabled': brightness < 80, 'blur_kernel': 41},
+            'clahe': {
+                'enabled': brightness < 100 or contrast < 30,
+                'clip_limit': 3.0 if brightness < 80 or contrast < 20 else 2.0,
+                'tile_grid_size': 8
+            },
+            'gamma': {'enabled': brightness > 200, 'value': 0.8},
+            'threshold': {'enabled': False, 'type': 'adaptive_gaussian', 'value': 127, 'max_value': 255},
+            'deskew': {'enabled': True},
+            # الصور الحادة تحتمل إزالة تشويش أقوى دون فقدان تفاصيل الحروف
+            'denoise': {'enabled': True, 'strength': 8 if sharpness > 100 else 5},
+            'sharpen': {'enabled': sharpness < 100, 'strength': 2.0 if sharpness < 50 else 1.5},
+            'quality': 90
+        }
+
     def clear_processing_cache(self):
         """Clear processing cache"""
         self.clear_preview_cache()
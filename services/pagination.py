@@ -0,0 +1,107 @@
+import json
+import base64
+import bisect
+from typing import Any, Dict, List, Optional
+
+from models.image import Image
+
+SORT_FIELDS = ['created_at', 'updated_at', 'filename', 'status', 'file_size', 'annotations_count']
+NUMERIC_SORT_FIELDS = ('file_size', 'annotations_count')
+NUMBER = (int, float)
+MAX_PAGE_SIZE = 1000
+
+
+def encode_cursor(key) -> str:
+    """Encode a sort key as an opaque page cursor"""
+    raw = json.dumps(list(key), ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii')
+
+
+def decode_cursor(cursor: str, types: tuple = (str, str)) -> tuple:
+    """Decode a page cursor back into its sort key.
+
+    ``types`` holds the expected type of each key element, so a cursor
+    from another sort order is rejected instead of failing to compare.
+    """
+    try:
+        key = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+    except Exception:
+        raise ValueError('Invalid cursor')
+    if not isinstance(key, list) or len(key) != len(types):
+        raise ValueError('Invalid cursor')
+    for value, expected in zip(key, types):
+        if isinstance(value, bool) or not isinstance(value, expected):
+            raise ValueError('Invalid cursor')
+    return tuple(key)
+
+
+def parse_limit(args, default: Optional[int] = None) -> Optional[int]:
+    """Read the ``limit`` request arg, capped at MAX_PAGE_SIZE"""
+    limit = args.get('limit', default)
+    if limit is None:
+        return None
+    try:
+        limit = int(limit)
+    except ValueError:
+        raise ValueError('limit must be an integer')
+    if limit < 1:
+        raise ValueError('limit must be positive')
+    return min(limit, MAX_PAGE_SIZE)
+
+
+def paginate_images(manifest, args, statuses: Optional[List[str]] = None) -> Dict[str, Any]:
+    """Sort, page and project a project's image summary rows according to request args.
+
+    Supported args: ``sort`` (one of SORT_FIELDS), ``order`` (asc/desc),
+    ``limit``, ``cursor`` (the ``next_cursor`` of the previous page) and
+    ``fields`` (comma separated list of keys to return). Without ``limit``
+    all rows are returned, as before. Only images with one of ``statuses``
+    are listed when given.
+
+    The sorted keys come from the manifest (status queues for created_at,
+    cached until the next change otherwise), so a page costs a bisect and
+    the page itself.
+    """
+    sort = args.get('sort', 'created_at')
+    if sort not in SORT_FIELDS:
+        raise ValueError(f"Invalid sort field: {sort}")
+    descending = args.get('order', 'asc').lower() == 'desc'
+
+    limit = parse_limit(args)
+
+    numeric = sort in NUMERIC_SORT_FIELDS
+    keys = manifest.sort_keys(sort, statuses, 0 if numeric else '') if manifest is not None else []
+
+    cursor = args.get('cursor')
+    cursor_key = decode_cursor(cursor, (NUMBER if numeric else str, str)) if cursor else None
+    if descending:
+        # الترتيب التنازلي يُقرأ من نهاية المفاتيح التصاعدية دون عكسها
+        stop = bisect.bisect_left(keys, cursor_key) if cursor_key is not None else len(keys)
+        start = 0 if limit is None else max(stop - limit, 0)
+        page_keys = keys[start:stop][::-1]
+        has_more = start > 0
+    else:
+        start = bisect.bisect_right(keys, cursor_key) if cursor_key is not None else 0
+        stop = len(keys) if limit is None else start + limit
+        page_keys = keys[start:stop]
+        has_more = stop < len(keys)
+    page = [row for row in (manifest.get(image_id) for _, image_id in page_keys) if row is not None]
+
+    fields = args.get('fields')
+    fields = [field.strip() for field in fields.split(',') if field.strip()] if fields else None
+
+    result = {
+        'images': [project_fields(Image.summary_to_dict(row), fields) for row in page],
+        'next_cursor': encode_cursor(page_keys[-1]) if limit is not None and has_more and page_keys else None,
+        'filtered_count': len(keys)
+    }
+    if limit is not None:
+        result['limit'] = limit
+    return result
+
+
+def project_fields(data: Dict[str, Any], fields: Optional[List[str]]) -> Dict[str, Any]:
+    """Keep only requested keys (the image id is always included)"""
+    if not fields:
+        return data
+    return {key: data[key] for key in ['id'] + fields if key in data}
@@ -0,0 +1,154 @@
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+DEFAULT_MAX_FILES = 500
+DEFAULT_MAX_BYTES = 200 * 1024 * 1024
+PREVIEW_MARKER = '_preview_'
+
+
+def preview_filename(image_id: str, fingerprint: str, width: int, height: int) -> str:
+    """Preview file name; starts with ``<image_id>_preview_`` as the serving endpoint expects"""
+    return f"{image_id}{PREVIEW_MARKER}{fingerprint}_{width}x{height}.jpg"
+
+
+class PreviewCache:
+    """Bounded LRU index of preview JPEGs on disk.
+
+    Every generated preview is registered with its size; when the number
+    of files or their total size exceeds the limits, the least recently
+    used previews are deleted from disk. Preview folders are scanned on
+    startup (and on first use of a folder), so files written by earlier
+    runs are indexed by mtime and garbage-collected like new ones instead
+    of piling up.
+    """
+
+    def __init__(self, max_files: int = DEFAULT_MAX_FILES, max_bytes: int = DEFAULT_MAX_BYTES):
+        self.max_files = max_files
+        self.max_bytes = max_bytes
+        self._entries: 'OrderedDict[str, int]' = OrderedDict()  # path -> size
+        self._scanned = set()
+        self._lock = threading.Lock()
+        self.size_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def configure(self, max_files: Optional[int] = None, max_bytes: Optional[int] = None):
+        """Apply limits from application settings"""
+        with self._lock:
+            if max_files is not None:
+                self.max_files = max(int(max_files), 0)
+            if max_bytes is not None:
+                self.max_bytes = max(int(max_bytes), 0)
+            self._evict()
+
+    def scan(self, folder: str):
+        """Index preview files already in folder (oldest first)"""
+        folder = os.path.normpath(folder)
+        with self._lock:
+            if folder in self._scanned:
+                return
+            self._scanned.add(folder)
+            found = []
+            try:
+                with os.scandir(folder) as entries:
+                    for entry in entries:
+                        if PREVIEW_MARKER in entry.name and entry.name.lower().endswith('.jpg') and entry.is_file():
+                            stat = entry.stat()
+                            found.append((stat.st_mtime, entry.path, stat.st_size))
+            except FileNotFoundError:
+                return
+            found.sort()
+            for _, path, size in found:
+                if path not in self._entries:
+                    self._entries[path] = size
+                    self.size_bytes += size
+            self._evict()
+
+    def get(self, path: str) -> bool:
+        """Check that a preview exists and mark it as recently used"""
+        path = os.path.normpath(path)
+        self.scan(os.path.dirname(path))
+        with self._lock:
+            if path in self._entries:
+                if os.path.exists(path):
+                    self._entries.move_to_end(path)
+                    self.hits += 1
+                    return True
+                # حُذف الملف من خارج التطبيق
+                self.size_bytes -= self._entries.pop(path)
+            self.misses += 1
+            return False
+
+    def add(self, path: str):
+        """Register a preview that was just written"""
+        path = os.path.normpath(path)
+        try:
+            size = os.path.getsize(path)
+        except OSError:
+            return
+        self.scan(os.path.dirname(path))
+        with self._lock:
+            previous = self._entries.pop(path, None)
+            if previous is not None:
+                self.size_bytes -= previous
+            self._entries[path] = size
+            self.size_bytes += size
+            self._evict(keep=path)
+
+    def _evict(self, keep: Optional[str] = None):
+        while self._entries and (len(self._entries) > self.max_files or self.size_bytes > self.max_bytes):
+            path, size = next(iter(self._entries.items()))
+            if path == keep:
+                break
+            del self._entries[path]
+            self.size_bytes -= size
+            self.evictions += 1
+            self._remove_file(path)
+
+    @staticmethod
+    def _remove_file(path: str):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            print(f"Error removing preview {path}: {e}")
+
+    def discard(self, image_id: Optional[str] = None):
+        """Delete previews of one image, or all indexed previews"""
+        prefix = f"{image_id}{PREVIEW_MARKER}" if image_id else None
+        with self._lock:
+            paths = [
+                path for path in self._entries
+                if prefix is None or os.path.basename(path).startswith(prefix)
+            ]
+            for path in paths:
+                self.size_bytes -= self._entries.pop(path)
+                self._remove_file(path)
+
+    def forget_folder(self, folder: str):
+        """Drop index entries under a deleted folder"""
+        folder = os.path.normpath(folder)
+        prefix = folder + os.sep
+        with self._lock:
+            self._scanned = {scanned for scanned in self._scanned if scanned != folder and not scanned.startswith(prefix)}
+            for path in [path for path in self._entries if path.startswith(prefix)]:
+                self.size_bytes -= self._entries.pop(path)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'files': len(self._entries),
+                'size_bytes': self.size_bytes,
+                'max_files': self.max_files,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions
+            }
+
+
+preview_cache = PreviewCache()
@@ -0,0 +1,399 @@
+import json
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional, Tuple
+
+import cv2
+import numpy as np
+
+MAX_CACHED_PLANS = 64
+
+
+def _odd(value: int, minimum: int = 3) -> int:
+    value = value if value % 2 == 1 else value + 1
+    return max(minimum, value)
+
+
+def _is_gray(img) -> bool:
+    return len(img.shape) == 2
+
+
+def _to_gray(img):
+    return img if _is_gray(img) else cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+
+
+def _build_lab_luts(to_lab: int, from_lab: int) -> Tuple[np.ndarray, np.ndarray]:
+    """LUTs between gray level and LAB lightness of the equivalent neutral BGR pixel.
+
+    Lets stages that work on the L channel of a colour image (CLAHE,
+    colour denoising) run directly on a single-channel buffer: for a
+    neutral image a and b are constant, so only L needs processing.
+    """
+    ramp = np.arange(256, dtype=np.uint8).reshape(1, 256)
+    lab = cv2.cvtColor(cv2.cvtColor(ramp, cv2.COLOR_GRAY2BGR), to_lab)
+    gray_to_l = lab[0, :, 0].copy()
+    neutral = np.full((1, 256, 3), 128, dtype=np.uint8)
+    neutral[0, :, 0] = ramp[0]
+    l_to_gray = cv2.cvtColor(cv2.cvtColor(neutral, from_lab), cv2.COLOR_BGR2GRAY)[0].copy()
+    return gray_to_l, l_to_gray
+
+
+_lab_luts: Dict[int, Tuple[np.ndarray, np.ndarray]] = {}
+
+
+def _on_lightness(img, fn: Callable, linear: bool = False):
+    """Apply fn to the LAB lightness of img (gray or BGR).
+
+    ``linear`` selects the linear-BGR LAB conversion used internally by
+    fastNlMeansDenoisingColored.
+    """
+    to_lab, from_lab = (cv2.COLOR_LBGR2Lab, cv2.COLOR_Lab2LBGR) if linear else (cv2.COLOR_BGR2LAB, cv2.COLOR_LAB2BGR)
+    if _is_gray(img):
+        luts = _lab_luts.get(to_lab)
+        if luts is None:
+            luts = _lab_luts[to_lab] = _build_lab_luts(to_lab, from_lab)
+        return cv2.LUT(fn(cv2.LUT(img, luts[0])), luts[1])
+    lab = cv2.cvtColor(img, to_lab)
+    l, a, b = cv2.split(lab)
+    return cv2.cvtColor(cv2.merge([fn(l), a, b]), from_lab)
+
+
+class Stage:
+    """One compiled pipeline step.
+
+    ``params`` holds the normalised settings the step depends on; together
+    with ``name`` it identifies the step's output for a given input.
+    ``run`` accepts a single-channel (gray) or BGR buffer and returns
+    either; gray stays gray unless the step needs colour.
+    """
+
+    __slots__ = ('name', 'params', 'run')
+
+    def __init__(self, name: str, params: tuple, run: Callable):
+        self.name = name
+        self.params = params
+        self.run = run
+
+    @property
+    def key(self) -> str:
+        return f"{self.name}{self.params!r}"
+
+    def __repr__(self):
+        return f"Stage({self.key})"
+
+
+# ---------- Stage builders (settings -> Stage or None) ----------
+
+def _grayscale(settings):
+    if not settings.get('grayscale', False):
+        return None
+    return Stage('grayscale', (), _to_gray)
+
+
+def _illumination(settings):
+    s = settings.get('illumination', {})
+    if not s.get('enabled', False):
+        return None
+    k = _odd(int(s.get('blur_kernel', 41)))
+
+    def run(img):
+        # Estimate background using a large blur then normalize
+        gray = _to_gray(img)
+        background = np.maximum(cv2.GaussianBlur(gray, (k, k), 0), 1)
+        norm = gray.astype(np.float32) / background.astype(np.float32)
+        return np.clip(norm * 255.0, 0, 255).astype(np.uint8)
+    return Stage('illumination', (k,), run)
+
+
+def _shadow_remove(settings):
+    s = settings.get('shadow_remove', {})
+    if not s.get('enabled', False):
+        return None
+    k = _odd(int(s.get('blur_kernel', 31)))
+
+    def run(img):
+        gray = _to_gray(img)
+        sub = cv2.subtract(gray, cv2.GaussianBlur(gray, (k, k), 0))
+        return cv2.normalize(sub, None, 0, 255, cv2.NORM_MINMAX)
+    return Stage('shadow_remove', (k,), run)
+
+
+def _clahe(settings):
+    s = settings.get('clahe', {})
+    if not s.get('enabled', False):
+        return None
+    clip_limit = max(float(s.get('clip_limit', 2.0)), 0.01)
+    tile = max(int(s.get('tile_grid_size', 8)), 1)
+
+    def run(img):
+        # CLAHE objects keep internal buffers, so each run gets its own
+        clahe = cv2.createCLAHE(clipLimit=clip_limit, tileGridSize=(tile, tile))
+        return _on_lightness(img, clahe.apply)
+    return Stage('clahe', (clip_limit, tile), run)
+
+
+def _local_contrast(settings):
+    s = settings.get('local_contrast', {})
+    if not s.get('enabled', False):
+        return None
+    method = (s.get('method') or 'clahe').lower()
+    if method == 'equalize':
+        return Stage('local_contrast', ('equalize',), lambda img: cv2.equalizeHist(_to_gray(img)))
+    clip = max(float(s.get('clip_limit', 2.5)), 0.01)
+    tile = max(int(s.get('tile_grid_size', 8)), 1)
+
+    def run(img):
+        clahe = cv2.createCLAHE(clipLimit=clip, tileGridSize=(tile, tile))
+        return clahe.apply(_to_gray(img))
+    return Stage('local_contrast', ('clahe', clip, tile), run)
+
+
+def _gamma(settings):
+    s = settings.get('gamma', {})
+    if not s.get('enabled', False):
+        return None
+    g = max(0.1, min(5.0, float(s.get('value', 1.0))))
+    table = (np.linspace(0, 1, 256) ** (1.0 / g) * 255).astype('uint8')
+    return Stage('gamma', (g,), lambda img: cv2.LUT(img, table))
+
+
+def _threshold(settings):
+    s = settings.get('threshold', {})
+    if not s.get('enabled', False):
+        return None
+    thresh_type = s.get('type', 'binary')
+    thresh_value = min(max(int(s.get('value', 127)), 0), 255)
+    max_value = min(max(int(s.get('max_value', 255)), 1), 255)
+
+    if thresh_type in ('adaptive_mean', 'adaptive_gaussian'):
+        block_size = _odd(int(s.get('block_size', 11)))
+        c_val = int(s.get('c', 2))
+        method = cv2.ADAPTIVE_THRESH_MEAN_C if thresh_type == 'adaptive_mean' else cv2.ADAPTIVE_THRESH_GAUSSIAN_C
+
+        def run(img):
+            return cv2.adaptiveThreshold(_to_gray(img), max_value, method, cv2.THRESH_BINARY, block_size, c_val)
+        return Stage('threshold', (thresh_type, max_value, block_size, c_val), run)
+
+    mode = cv2.THRESH_BINARY_INV if thresh_type == 'binary_inv' else cv2.THRESH_BINARY
+
+    def run(img):
+        return cv2.threshold(_to_gray(img), thresh_value, max_value, mode)[1]
+    return Stage('threshold', (mode, thresh_value, max_value), run)
+
+
+def _deskew(settings):
+    if not settings.get('deskew', {}).get('enabled', False):
+        return None
+
+    def run(img):
+        # Simple deskewing using Hough lines
+        edges = cv2.Canny(_to_gray(img), 50, 150, apertureSize=3)
+        lines = cv2.HoughLines(edges, 1, np.pi / 180, threshold=100)
+        if lines is None:
+            return img
+        angles = []
+        for line in lines[:10]:  # Use first 10 lines
+            rho, theta = line[0]
+            angle = theta * 180.0 / np.pi
+            if angle > 90:
+                angle = angle - 180
+            angles.append(angle)
+        median_angle = np.median(angles)
+        if abs(median_angle) <= 0.5:  # Only rotate if angle is significant
+            return img
+        h, w = img.shape[:2]
+        rotation_matrix = cv2.getRotationMatrix2D((w // 2, h // 2), median_angle, 1.0)
+        return cv2.warpAffine(img, rotation_matrix, (w, h), flags=cv2.INTER_CUBIC, borderMode=cv2.BORDER_REPLICATE)
+    return Stage('deskew', (), run)
+
+
+def _bilateral(settings):
+    s = settings.get('bilateral', {})
+    if not s.get('enabled', False):
+        return None
+    d = max(1, int(s.get('diameter', 7)))
+    sigma_color = float(s.get('sigma_color', 50))
+    sigma_space = float(s.get('sigma_space', 50))
+
+    def run(img):
+        # على صورة BGR يُجمع فرق الألوان من القنوات الثلاث (3 أضعاف فرق الرمادي)، لذا تُقسم sigma على 3
+        if _is_gray(img):
+            return cv2.bilateralFilter(img, d, sigma_color / 3, sigma_space)
+        return cv2.bilateralFilter(img, d, sigma_color, sigma_space)
+    return Stage('bilateral', (d, sigma_color, sigma_space), run)
+
+
+def _median(settings):
+    s = settings.get('median', {})
+    if not s.get('enabled', False):
+        return None
+    k = _odd(int(s.get('kernel', 3)))
+    return Stage('median', (k,), lambda img: cv2.medianBlur(img, k))
+
+
+def _morphology(settings):
+    s = settings.get('morphology', {})
+    if not s.get('enabled', False):
+        return None
+    operation = s.get('operation', 'opening') or 'opening'
+    kernel_size = max(int(s.get('kernel_size', 3)), 1)
+    iterations = max(int(s.get('iterations', 1)), 1)
+    kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (kernel_size, kernel_size))
+    operations = {
+        'opening': lambda img: cv2.morphologyEx(img, cv2.MORPH_OPEN, kernel, iterations=iterations),
+        'closing': lambda img: cv2.morphologyEx(img, cv2.MORPH_CLOSE, kernel, iterations=iterations),
+        'erosion': lambda img: cv2.erode(img, kernel, iterations=iterations),
+        'dilation': lambda img: cv2.dilate(img, kernel, iterations=iterations),
+    }
+    if operation not in operations:
+        return None
+    return Stage('morphology', (operation, kernel_size, iterations), operations[operation])
+
+
+def _denoise(settings):
+    s = settings.get('denoise', {})
+    if not s.get('enabled', False):
+        return None
+    strength = min(max(int(s.get('strength', 10)), 1), 30)
+
+    def run(img):
+        if _is_gray(img):
+            # The colored variant denoises LAB lightness with h; a and b are constant for gray
+            return _on_lightness(img, lambda l: cv2.fastNlMeansDenoising(l, None, strength, 7, 21), linear=True)
+        return cv2.fastNlMeansDenoisingColored(img, None, strength, strength, 7, 21)
+    return Stage('denoise', (strength,), run)
+
+
+def _sharpen(settings):
+    s = settings.get('sharpen', {})
+    if not s.get('enabled', False):
+        return None
+    strength = max(float(s.get('strength', 1.0)), 0.0)
+    kernel = np.array([[-1, -1, -1], [-1, 9, -1], [-1, -1, -1]], dtype=np.float32) * strength
+    return Stage('sharpen', (strength,), lambda img: cv2.filter2D(img, -1, kernel))
+
+
+def _edge_enhance(settings):
+    s = settings.get('edge_enhance', {})
+    if not s.get('enabled', False):
+        return None
+    alpha = max(0.0, min(2.0, float(s.get('alpha', 0.3))))
+
+    def run(img):
+        lap = cv2.convertScaleAbs(cv2.Laplacian(_to_gray(img), cv2.CV_16S, ksize=3))
+        if not _is_gray(img):
+            lap = cv2.cvtColor(lap, cv2.COLOR_GRAY2BGR)
+        return cv2.addWeighted(img, 1.0, lap, alpha, 0)
+    return Stage('edge_enhance', (alpha,), run)
+
+
+def _speck_remove(settings):
+    s = settings.get('speck_remove', {})
+    if not s.get('enabled', False):
+        return None
+    area_thr = int(s.get('max_area', 20))
+
+    def run(img):
+        gray = _to_gray(img)
+        _, bw = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+        cnts, _ = cv2.findContours(255 - bw, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+        mask = np.zeros_like(gray)
+        for c in cnts:
+            if cv2.contourArea(c) <= area_thr:
+                cv2.drawContours(mask, [c], -1, 255, thickness=cv2.FILLED)
+        if np.count_nonzero(mask) == 0:
+            return img
+        return cv2.inpaint(img, mask, 3, cv2.INPAINT_TELEA)
+    return Stage('speck_remove', (area_thr,), run)
+
+
+# Pipeline order
+STAGE_BUILDERS = [
+    _grayscale, _illumination, _shadow_remove, _clahe, _local_contrast, _gamma, _threshold,
+    _deskew, _bilateral, _median, _morphology, _denoise, _sharpen, _edge_enhance, _speck_remove
+]
+
+
+class ProcessingPlan:
+    """Processing settings compiled into an ordered tuple of stages.
+
+    Settings are parsed and validated once, at compile time. While running,
+    the working buffer stays single-channel from the first stage that
+    produces gray output (grayscale, illumination, threshold, ...), so the
+    following filters process one channel instead of three identical ones.
+    The result is converted back to BGR once at the end.
+    """
+
+    __slots__ = ('stages', 'prefixes')
+
+    def __init__(self, stages: Tuple[Stage, ...]):
+        self.stages = stages
+        # prefixes[i] identifies the output of stages[0..i] for a given input
+        prefixes = []
+        digest = hashlib.md5()
+        for stage in stages:
+            digest.update(stage.key.encode('utf-8') + b';')
+            prefixes.append(digest.hexdigest()[:16])
+        self.prefixes = tuple(prefixes)
+
+    @classmethod
+    def compile(cls, settings: Dict[str, Any]) -> 'ProcessingPlan':
+        stages = []
+        for builder in STAGE_BUILDERS:
+            stage = builder(settings or {})
+            if stage is not None:
+                stages.append(stage)
+        return cls(tuple(stages))
+
+    def run(self, img, start: int = 0, on_stage: Optional[Callable[[int, Any], None]] = None):
+        """Run stages from index start; on_stage(i, buffer) sees each stage's output"""
+        buffer = img
+        for i in range(start, len(self.stages)):
+            buffer = self.stages[i].run(buffer)
+            if on_stage is not None:
+                on_stage(i, buffer)
+        result = self.to_bgr(buffer)
+        if result is img:
+            # Callers own the result, as with the former in-place pipeline on a copy
+            return img.copy()
+        return result
+
+    @staticmethod
+    def to_bgr(img):
+        return cv2.cvtColor(img, cv2.COLOR_GRAY2BGR) if _is_gray(img) else img
+
+    def __len__(self):
+        return len(self.stages)
+
+    def __repr__(self):
+        return f"ProcessingPlan({list(self.stages)})"
+
+
+def settings_fingerprint(settings: Dict[str, Any]) -> str:
+    """Deterministic short fingerprint of a settings dict"""
+    try:
+        dumped = json.dumps(settings or {}, sort_keys=True, separators=(",", ":"))
+    except Exception:
+        dumped = str(settings)
+    return hashlib.md5(dumped.encode("utf-8")).hexdigest()[:12]
+
+
+_plans: 'OrderedDict[str, ProcessingPlan]' = OrderedDict()
+_plans_lock = threading.Lock()
+
+
+def compile_plan(settings: Dict[str, Any]) -> ProcessingPlan:
+    """Get the compiled plan for settings, compiling it on first use"""
+    key = settings_fingerprint(settings)
+    with _plans_lock:
+        plan = _plans.get(key)
+        if plan is not None:
+            _plans.move_to_end(key)
+            return plan
+    plan = ProcessingPlan.compile(settings)
+    with _plans_lock:
+        _plans[key] = plan
+        while len(_plans) > MAX_CACHED_PLANS:
+            _plans.popitem(last=False)
+    return plan
@@ -0,0 +1,362 @@
+import os
+import bisect
+import heapq
+import threading
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+from models.image import Image
+from models.persistence import json_store, dumps, loads
+from services.spatial_index import annotation_extent
+from services.search_terms import SEARCH_FIELDS, confidence_bucket, search_confidence, search_terms
+
+SEARCH_INDEX_FILENAME = 'search_index.json'
+SEARCH_INDEX_LOG_FILENAME = 'search_index.log'
+SEARCH_INDEX_VERSION = 2
+SEARCH_INDEX_COMMIT_DELAY = 1.0
+# Rewrite the index once the log holds this many image entries
+SEARCH_INDEX_LOG_THRESHOLD = 500
+# Term every annotation is posted under (search without filters)
+ALL_TERM = '*'
+
+Posting = Tuple[str, str, int]  # created_at, image_id, position of the annotation in the image
+
+
+def _index_entry(annotation: Dict[str, Any]) -> Dict[str, Any]:
+    terms = search_terms(annotation)
+    confidence = search_confidence(annotation)
+    if confidence is not None:
+        terms.append(f"confidence:{confidence_bucket(confidence)}")
+    extent = annotation_extent(annotation)
+    return {
+        'id': annotation.get('id'),
+        'bbox': None if extent is None else [extent[0], extent[1], extent[2] - extent[0], extent[3] - extent[1]],
+        'confidence': confidence,
+        'terms': terms
+    }
+
+
+def search_store(store, project_id: str, filters: Dict[str, List[str]],
+                 min_confidence: Optional[float] = None, max_confidence: Optional[float] = None,
+                 statuses: Optional[List[str]] = None, limit: int = 100,
+                 after: Optional[tuple] = None) -> Dict[str, Any]:
+    """Same search as ``AnnotationSearchIndex.search``, run as SQL on the sqlite backend"""
+    result = store.search_annotations(project_id, filters, min_confidence, max_confidence,
+                                      statuses, limit, after)
+    hits = []
+    for row in result['rows']:
+        extent = annotation_extent(row['annotation'])
+        hits.append({
+            'image_id': row['image_id'],
+            'filename': row['filename'],
+            'annotation_id': row['annotation'].get('id'),
+            'bbox': None if extent is None else {
+                'x': extent[0], 'y': extent[1], 'width': extent[2] - extent[0], 'height': extent[3] - extent[1]
+            }
+        })
+    rows = result['rows']
+    return {
+        'hits': hits,
+        'total_count': result['total_count'],
+        'next_key': rows[-1]['key'] if rows and result['has_more'] else None
+    }
+
+
+def _signature(row: Dict[str, Any]) -> list:
+    return [row.get('annotations_version', 0), row.get('updated_at')]
+
+
+def _tail(postings: List[Posting], start: int) -> Iterable[Posting]:
+    """Iterate postings from start without copying the list"""
+    for i in range(start, len(postings)):
+        yield postings[i]
+
+
+class AnnotationSearchIndex:
+    """Inverted index over the annotations of one project.
+
+    Maps terms such as ``label:<label>``, ``level:word``, ``type:bbox``,
+    ``reason:damaged`` and ``confidence:<bucket>`` to the annotations that
+    carry them. Posting lists are kept sorted by hit order (image
+    created_at, id, annotation position), so a page is read by merging the
+    lists of the most selective filter from the cursor on, without sorting
+    all matches.
+
+    The per-image entries are stored in ``search_index.json`` together
+    with the image's annotations version; before each search, images whose
+    manifest row shows a newer version are re-indexed, so only changed
+    images are ever loaded. Re-indexed entries are appended to
+    ``search_index.log`` instead of rewriting the whole file, which is
+    compacted once the log grows past SEARCH_INDEX_LOG_THRESHOLD.
+    """
+
+    _instances: Dict[str, 'AnnotationSearchIndex'] = {}
+    _instances_lock = threading.Lock()
+
+    def __init__(self, project_folder: str):
+        self.project_folder = project_folder
+        self.images: Dict[str, Dict[str, Any]] = {}
+        self.postings: Dict[str, List[Posting]] = {}
+        self._loaded = False
+        self._lock = threading.RLock()
+        self._log_lock = threading.Lock()
+        self._log_seq = 0
+        self._log_count = 0
+
+    @property
+    def index_file(self):
+        """Get index file path"""
+        return os.path.join(self.project_folder, SEARCH_INDEX_FILENAME)
+
+    @property
+    def log_file(self):
+        """Get entry log path"""
+        return os.path.join(self.project_folder, SEARCH_INDEX_LOG_FILENAME)
+
+    @classmethod
+    def for_folder(cls, project_folder: str) -> 'AnnotationSearchIndex':
+        """Get the shared search index for a project folder"""
+        with cls._instances_lock:
+            index = cls._instances.get(project_folder)
+            if index is None:
+                index = cls._instances[project_folder] = cls(project_folder)
+            return index
+
+    @classmethod
+    def forget(cls, project_folder: str):
+        """Drop cached index (e.g. after the project was deleted)"""
+        with cls._instances_lock:
+            cls._instances.pop(project_folder, None)
+
+    def _load(self):
+        if self._loaded:
+            return
+        self._loaded = True
+        try:
+            data = json_store.read(self.index_file, cache=False)
+        except Exception as e:
+            print(f"Error reading search index {self.index_file}, rebuilding: {e}")
+            data = None
+        if not data or data.get('version') != SEARCH_INDEX_VERSION:
+            # فهرس قديم أو تالف: يُبنى من جديد، وسجله لم يعد صالحاً
+            with self._log_lock:
+                self._remove_log()
+            return
+        for image_id, entry in data.get('images', {}).items():
+            self._add_image(image_id, entry, keep_sorted=False)
+        self._replay_log(data.get('log_seq', 0))
+        for postings in self.postings.values():
+            postings.sort()
+
+    def _add_image(self, image_id: str, entry: Dict[str, Any], keep_sorted: bool = True):
+        self.images[image_id] = entry
+        created_at = entry['created_at']
+        for position, annotation in enumerate(entry['annotations']):
+            key = (created_at, image_id, position)
+            for term in [ALL_TERM] + annotation['terms']:
+                postings = self.postings.setdefault(term, [])
+                if keep_sorted:
+                    bisect.insort(postings, key)
+                else:
+                    postings.append(key)
+
+    def _remove_image(self, image_id: str, keep_sorted: bool = True):
+        entry = self.images.pop(image_id, None)
+        if entry is None:
+            return
+        created_at = entry['created_at']
+        for position, annotation in enumerate(entry['annotations']):
+            key = (created_at, image_id, position)
+            for term in [ALL_TERM] + annotation['terms']:
+                postings = self.postings.get(term)
+                if postings is None:
+                    continue
+                if keep_sorted:
+                    i = bisect.bisect_left(postings, key)
+                    if i < len(postings) and postings[i] == key:
+                        del postings[i]
+                else:
+                    postings.remove(key)
+                if not postings:
+                    del self.postings[term]
+
+    def _write(self):
+        with self._log_lock:
+            log_seq = self._log_seq
+        json_store.write(self.index_file,
+                         {'version': SEARCH_INDEX_VERSION, 'images': self.images, 'log_seq': log_seq},
+                         delay=SEARCH_INDEX_COMMIT_DELAY,
+                         on_flushed=lambda mtime: self._flushed(log_seq))
+
+    def _flushed(self, log_seq: int):
+        with self._log_lock:
+            if log_seq == self._log_seq and self._log_count:
+                # كل أسطر السجل صارت ضمن الملف المكتوب
+                self._remove_log()
+
+    def _remove_log(self):
+        try:
+            os.remove(self.log_file)
+        except FileNotFoundError:
+            pass
+        self._log_count = 0
+
+    def _log_entries(self, image_ids: Iterable[str]):
+        """Persist the entries of changed images (None for removed ones) by appending to the log"""
+        if not os.path.exists(self.project_folder):
+            return
+        with self._log_lock:
+            with open(self.log_file, 'ab') as f:
+                for image_id in image_ids:
+                    self._log_seq += 1
+                    f.write(dumps({'seq': self._log_seq, 'image_id': image_id,
+                                   'entry': self.images.get(image_id)}) + b'\n')
+                    self._log_count += 1
+            compact = self._log_count >= SEARCH_INDEX_LOG_THRESHOLD
+        if compact:
+            self._write()
+
+    def _replay_log(self, after_seq: int):
+        """Apply logged entries newer than the loaded index file"""
+        seq, count = after_seq, 0
+        try:
+            with open(self.log_file, 'rb') as f:
+                for line in f:
+                    try:
+                        logged = loads(line)
+                    except ValueError:
+                        # سطر أخير غير مكتمل
+                        break
+                    count += 1
+                    if logged['seq'] > after_seq:
+                        self._remove_image(logged['image_id'], keep_sorted=False)
+                        if logged['entry'] is not None:
+                            self._add_image(logged['image_id'], logged['entry'], keep_sorted=False)
+                        seq = max(seq, logged['seq'])
+        except FileNotFoundError:
+            pass
+        with self._log_lock:
+            self._log_seq = max(self._log_seq, seq)
+            self._log_count = count
+
+    def refresh(self, project_id: str, rows: List[Dict[str, Any]]) -> int:
+        """Re-index images whose summary row changed; returns how many were loaded"""
+        with self._lock:
+            self._load()
+            changed = []
+            loaded = 0
+            current = set()
+            for row in rows:
+                image_id = row['id']
+                current.add(image_id)
+                entry = self.images.get(image_id)
+                if entry is not None and entry['signature'] == _signature(row):
+                    continue
+                image = Image.load(project_id, image_id)
+                self._remove_image(image_id)
+                if image is not None:
+                    self._add_image(image_id, {
+                        'signature': _signature(image.to_summary()),
+                        'created_at': row.get('created_at') or '',
+                        'annotations': [_index_entry(annotation) for annotation in image.annotations]
+                    })
+                    loaded += 1
+                changed.append(image_id)
+
+            for image_id in set(self.images) - current:
+                self._remove_image(image_id)
+                changed.append(image_id)
+
+            if changed:
+                if json_store.exists(self.index_file):
+                    self._log_entries(changed)
+                else:
+                    # أول بناء للفهرس: لا يوجد ملف يُطبق عليه السجل
+                    self._write()
+            return loaded
+
+    def _driver_and_checks(self, filters: Dict[str, List[str]], min_confidence: Optional[float],
+                           max_confidence: Optional[float]) -> Tuple[List[List[Posting]], List[Set[str]]]:
+        """Posting lists of the most selective filter and term sets the other filters require"""
+        term_sets = [
+            {f"{field}:{value}" for value in values}
+            for field, values in filters.items() if values
+        ]
+        if min_confidence is not None or max_confidence is not None:
+            low = confidence_bucket(min_confidence) if min_confidence is not None else None
+            high = confidence_bucket(max_confidence) if max_confidence is not None else None
+            term_sets.append({
+                term for term in self.postings
+                if term.startswith('confidence:')
+                and (low is None or float(term.split(':', 1)[1]) >= low)
+                and (high is None or float(term.split(':', 1)[1]) <= high)
+            })
+        if not term_sets:
+            return [self.postings.get(ALL_TERM, [])], []
+
+        # قيم الحقل الواحد تُجمع (OR) والحقول المختلفة تتقاطع (AND)؛ يُقرأ أصغر حقل ويُفحص الباقي لكل نتيجة
+        sizes = [sum(len(self.postings.get(term, ())) for term in terms) for terms in term_sets]
+        driver = sizes.index(min(sizes))
+        lists = [self.postings[term] for term in term_sets[driver] if term in self.postings]
+        return lists, term_sets[:driver] + term_sets[driver + 1:]
+
+    def search(self, rows: List[Dict[str, Any]], filters: Dict[str, List[str]],
+               min_confidence: Optional[float] = None, max_confidence: Optional[float] = None,
+               limit: int = 100, after: Optional[tuple] = None) -> Dict[str, Any]:
+        """Find annotations matching every filter among the images in rows.
+
+        Hits are ordered by image (created_at, id) and annotation position;
+        ``after`` is the key of the last hit of the previous page.
+        """
+        images = {row['id']: row for row in rows}
+        with self._lock:
+            lists, checks = self._driver_and_checks(filters, min_confidence, max_confidence)
+
+            def accepted(key):
+                _, image_id, position = key
+                if image_id not in images:
+                    return False
+                annotation = self.images[image_id]['annotations'][position]
+                if any(terms.isdisjoint(annotation['terms']) for terms in checks):
+                    return False
+                confidence = annotation['confidence']
+                if min_confidence is not None and (confidence is None or confidence < min_confidence):
+                    return False
+                if max_confidence is not None and (confidence is None or confidence > max_confidence):
+                    return False
+                return True
+
+            if not checks and min_confidence is None and max_confidence is None and len(images) >= len(self.images):
+                total_count = sum(len(postings) for postings in lists)
+            else:
+                # العدد الكلي يحتاج مروراً خطياً على المرشحين فقط، دون فرز
+                total_count = sum(1 for postings in lists for key in postings if accepted(key))
+
+            candidates = heapq.merge(*(
+                _tail(postings, bisect.bisect_right(postings, after) if after is not None else 0)
+                for postings in lists
+            ))
+            page = []
+            has_more = False
+            for key in candidates:
+                if not accepted(key):
+                    continue
+                if len(page) == limit:
+                    has_more = True
+                    break
+                page.append(key)
+
+            hits = []
+            for _, image_id, position in page:
+                annotation = self.images[image_id]['annotations'][position]
+                bbox = annotation['bbox']
+                hits.append({
+                    'image_id': image_id,
+                    'filename': images[image_id].get('filename'),
+                    'annotation_id': annotation['id'],
+                    'bbox': None if bbox is None else dict(zip(('x', 'y', 'width', 'height'), bbox))
+                })
+        return {
+            'hits': hits,
+            'total_count': total_count,
+            'next_key': page[-1] if page and has_more else None
+        }
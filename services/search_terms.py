@@ -0,0 +1,34 @@
+import math
+from typing import Any, Dict, List, Optional
+
+SEARCH_FIELDS = ['label', 'level', 'type', 'reason']
+CONFIDENCE_BUCKET = 10
+
+
+def confidence_bucket(confidence: float) -> int:
+    """Lower bound of the confidence bucket a value falls in"""
+    return int(confidence // CONFIDENCE_BUCKET) * CONFIDENCE_BUCKET
+
+
+def search_confidence(annotation: Dict[str, Any]) -> Optional[float]:
+    """Confidence as searched: numbers and numeric strings, None otherwise"""
+    try:
+        confidence = float(annotation.get('confidence'))
+    except (TypeError, ValueError):
+        return None
+    return confidence if math.isfinite(confidence) else None
+
+
+def search_terms(annotation: Dict[str, Any]) -> List[str]:
+    """``field:value`` terms an annotation is found by.
+
+    Only non-empty string values are searchable (stripped); a missing
+    label is not searchable as ``unlabeled``. Both search backends index
+    these terms, so a query means the same on either.
+    """
+    terms = []
+    for field in SEARCH_FIELDS:
+        value = annotation.get(field)
+        if isinstance(value, str) and value.strip():
+            terms.append(f"{field}:{value.strip()}")
+    return terms
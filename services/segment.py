@@ -4,6 +4,8 @@ from typing import Dict, Any, List, Tuple
 import cv2
 import numpy as np
 
+from services.image_cache import decoded_images
+
 
 class Segmenter:
     def __init__(self):
@@ -19,7 +21,7 @@ class Segmenter:
     def segment(self, img_path: str, level: str = 'lines', save_dir: str = None) -> Dict[str, Any]:
         if not os.path.exists(img_path):
             return {'boxes': [], 'saved': []}
-        img = cv2.imread(img_path)
+        img = decoded_images.read(img_path)
         if img is None:
             return {'boxes': [], 'saved': []}
 
@@ -0,0 +1,244 @@
+import math
+import threading
+from collections import OrderedDict
+from collections.abc import Mapping
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+Extent = Tuple[float, float, float, float]  # x0, y0, x1, y1
+
+# Cell size is this multiple of the median annotation size
+CELL_SIZE_FACTOR = 2.0
+MIN_CELL_SIZE = 16.0
+MAX_CACHED_INDEXES = 256
+
+
+def annotation_extent(annotation: Dict[str, Any]) -> Optional[Extent]:
+    """Get bounding extent of a bbox or polygon annotation"""
+    bbox = annotation.get('bbox')
+    if isinstance(bbox, Mapping) and 'x' in bbox and 'y' in bbox:
+        x, y = float(bbox['x']), float(bbox['y'])
+        w, h = float(bbox.get('width', 0)), float(bbox.get('height', 0))
+        return min(x, x + w), min(y, y + h), max(x, x + w), max(y, y + h)
+
+    points = annotation.get('points')
+    if points:
+        xs, ys = [], []
+        for point in points:
+            if isinstance(point, dict):
+                xs.append(float(point['x']))
+                ys.append(float(point['y']))
+            else:
+                xs.append(float(point[0]))
+                ys.append(float(point[1]))
+        return min(xs), min(ys), max(xs), max(ys)
+    return None
+
+
+def extent_iou(a: Extent, b: Extent) -> float:
+    """Intersection over union of two extents"""
+    ix = min(a[2], b[2]) - max(a[0], b[0])
+    iy = min(a[3], b[3]) - max(a[1], b[1])
+    if ix <= 0 or iy <= 0:
+        return 0.0
+    intersection = ix * iy
+    union = (a[2] - a[0]) * (a[3] - a[1]) + (b[2] - b[0]) * (b[3] - b[1]) - intersection
+    return intersection / union if union > 0 else 0.0
+
+
+class SpatialIndex:
+    """Uniform grid over annotation extents of one image.
+
+    Each annotation is registered in every grid cell its extent touches, so
+    viewport, hit-test and overlap queries only look at annotations in the
+    cells covered by the query instead of at every annotation.
+    """
+
+    def __init__(self, cell_size: float):
+        self.cell_size = cell_size
+        self.extents: Dict[str, Extent] = {}
+        self.order: Dict[str, int] = {}
+        self.cells: Dict[Tuple[int, int], Set[str]] = {}
+        self._next_order = 0
+
+    @classmethod
+    def build(cls, annotations: List[Dict[str, Any]]) -> 'SpatialIndex':
+        """Build index with a cell size suited to the annotation sizes"""
+        sizes = []
+        for annotation in annotations:
+            extent = annotation_extent(annotation)
+            if extent:
+                sizes.append(max(extent[2] - extent[0], extent[3] - extent[1]))
+        sizes.sort()
+        median = sizes[len(sizes) // 2] if sizes else 0
+        index = cls(max(MIN_CELL_SIZE, median * CELL_SIZE_FACTOR))
+        for annotation in annotations:
+            index.insert(annotation)
+        return index
+
+    def _cell_range(self, extent: Extent):
+        size = self.cell_size
+        for cx in range(math.floor(extent[0] / size), math.floor(extent[2] / size) + 1):
+            for cy in range(math.floor(extent[1] / size), math.floor(extent[3] / size) + 1):
+                yield cx, cy
+
+    def insert(self, annotation: Dict[str, Any]):
+        """Add (or move) an annotation"""
+        annotation_id = annotation.get('id')
+        if annotation_id is None:
+            return
+        self.remove(annotation_id, keep_order=True)
+        extent = annotation_extent(annotation)
+        if extent is None:
+            return
+        self.extents[annotation_id] = extent
+        if annotation_id not in self.order:
+            self.order[annotation_id] = self._next_order
+            self._next_order += 1
+        for cell in self._cell_range(extent):
+            self.cells.setdefault(cell, set()).add(annotation_id)
+
+    def remove(self, annotation_id: str, keep_order: bool = False):
+        """Remove an annotation"""
+        extent = self.extents.pop(annotation_id, None)
+        if not keep_order:
+            self.order.pop(annotation_id, None)
+        if extent is None:
+            return
+        for cell in self._cell_range(extent):
+            members = self.cells.get(cell)
+            if members is not None:
+                members.discard(annotation_id)
+                if not members:
+                    del self.cells[cell]
+
+    def _candidates(self, extent: Extent) -> Set[str]:
+        candidates: Set[str] = set()
+        size = self.cell_size
+        x0, y0, x1, y1 = (value / size for value in extent)
+        finite = all(math.isfinite(value) for value in (x0, y0, x1, y1))
+        if finite and (math.floor(x1) - math.floor(x0) + 1) * (math.floor(y1) - math.floor(y0) + 1) <= len(self.cells):
+            for cell in self._cell_range(extent):
+                candidates |= self.cells.get(cell, set())
+            return candidates
+        # نطاق أكبر من عدد الخلايا المشغولة: المرور على الخلايا المشغولة أرخص
+        # floor(x0) <= cx <= floor(x1)  <=>  x0 < cx + 1 and cx <= x1
+        for (cx, cy), members in self.cells.items():
+            if x0 < cx + 1 and cx <= x1 and y0 < cy + 1 and cy <= y1:
+                candidates |= members
+        return candidates
+
+    def _sorted(self, ids: Iterable[str]) -> List[str]:
+        return sorted(ids, key=lambda annotation_id: self.order.get(annotation_id, 0))
+
+    def query(self, extent: Extent) -> List[str]:
+        """IDs of annotations intersecting the rectangle"""
+        x0, y0, x1, y1 = extent
+        return self._sorted(
+            annotation_id for annotation_id in self._candidates(extent)
+            if self.extents[annotation_id][0] <= x1 and self.extents[annotation_id][2] >= x0
+            and self.extents[annotation_id][1] <= y1 and self.extents[annotation_id][3] >= y0
+        )
+
+    def hit_test(self, x: float, y: float) -> List[str]:
+        """IDs of annotations containing the point"""
+        return self.query((x, y, x, y))
+
+    def overlaps(self, annotation_id: str, min_iou: float = 0.0) -> List[Tuple[str, float]]:
+        """Annotations overlapping the given one, with their IoU"""
+        extent = self.extents.get(annotation_id)
+        if extent is None:
+            return []
+        result = []
+        for other_id in self.query(extent):
+            other = self.extents[other_id]
+            if other_id == annotation_id or not self._touches(extent, other):
+                continue
+            iou = extent_iou(extent, other)
+            if iou >= min_iou:
+                result.append((other_id, iou))
+        return result
+
+    @staticmethod
+    def _touches(a: Extent, b: Extent) -> bool:
+        return a[0] < b[2] and b[0] < a[2] and a[1] < b[3] and b[1] < a[3]
+
+    def __len__(self):
+        return len(self.extents)
+
+
+class _CachedIndex:
+    """Index of one image with the version it reflects and its own lock"""
+
+    __slots__ = ('version', 'index', 'lock')
+
+    def __init__(self, version: int, index: SpatialIndex):
+        self.version = version
+        self.index = index
+        self.lock = threading.Lock()
+
+
+class SpatialIndexCache:
+    """Bounded cache of per-image spatial indexes.
+
+    Entries are tagged with the image's ``annotations_version``. Annotation
+    operations staged by ``Image`` update a cached index in place when it is
+    at the preceding version; anything else rebuilds it on the next query.
+    """
+
+    def __init__(self, max_entries: int = MAX_CACHED_INDEXES):
+        self.max_entries = max_entries
+        self._entries: 'OrderedDict[tuple, _CachedIndex]' = OrderedDict()
+        self._lock = threading.Lock()
+
+    def run(self, image, query: Callable[[SpatialIndex], Any]) -> Any:
+        """Run query against the image's index, building it if missing or outdated.
+
+        The query runs under the entry's own lock, so concurrent in-place
+        updates cannot change the index underneath it while queries and
+        edits on other images proceed.
+        """
+        key = (image.project_id, image.id)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+        if entry is not None:
+            with entry.lock:
+                if entry.version == image.annotations_version:
+                    return query(entry.index)
+
+        entry = _CachedIndex(image.annotations_version, SpatialIndex.build(image.annotations))
+        with entry.lock:
+            with self._lock:
+                self._entries[key] = entry
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+            return query(entry.index)
+
+    def apply_op(self, project_id: str, image_id: str, op: Dict[str, Any], annotation: Optional[Dict[str, Any]] = None):
+        """Apply a staged annotation operation (carrying its new version)"""
+        key = (project_id, image_id)
+        with self._lock:
+            entry = self._entries.get(key)
+        if entry is None:
+            return
+        with entry.lock:
+            if entry.version == op['version'] - 1:
+                if op['op'] == 'delete':
+                    entry.index.remove(op['id'])
+                elif annotation is not None:
+                    entry.index.insert(annotation)
+                entry.version = op['version']
+                return
+        with self._lock:
+            if self._entries.get(key) is entry:
+                del self._entries[key]
+
+    def invalidate(self, project_id: str, image_id: str):
+        """Drop cached index of an image"""
+        with self._lock:
+            self._entries.pop((project_id, image_id), None)
+
+
+spatial_indexes = SpatialIndexCache()
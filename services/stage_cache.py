@@ -0,0 +1,105 @@
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional, Tuple
+
+DEFAULT_BUDGET_BYTES = 256 * 1024 * 1024
+# Key of the decoded and resized input, before any stage ran
+SOURCE_PREFIX = ''
+
+
+class StageBufferCache:
+    """Memory-bounded LRU cache of intermediate pipeline buffers.
+
+    Entries are keyed by ``(source, prefix)``: ``source`` identifies the
+    input image (id, file signature and preview size) and ``prefix`` is the
+    fingerprint of the plan stages that produced the buffer. When only a
+    late stage changes, a preview resumes from the deepest cached prefix
+    instead of re-running the expensive early stages (denoise, CLAHE, ...).
+
+    Buffers are stored read-only and shared with callers; stages always
+    return new arrays, so cached buffers are never written to.
+    """
+
+    def __init__(self, budget_bytes: int = DEFAULT_BUDGET_BYTES):
+        self.budget_bytes = budget_bytes
+        self._entries: 'OrderedDict[Tuple[Hashable, str], Any]' = OrderedDict()
+        self._lock = threading.Lock()
+        self.size_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def configure(self, budget_bytes: int):
+        """Apply memory budget (0 disables the cache)"""
+        with self._lock:
+            self.budget_bytes = max(int(budget_bytes), 0)
+            self._evict()
+
+    def get(self, source: Hashable, prefix: str):
+        with self._lock:
+            buffer = self._entries.get((source, prefix))
+            if buffer is not None:
+                self._entries.move_to_end((source, prefix))
+            return buffer
+
+    def put(self, source: Hashable, prefix: str, buffer):
+        if buffer.nbytes > self.budget_bytes:
+            return
+        buffer.flags.writeable = False
+        with self._lock:
+            previous = self._entries.pop((source, prefix), None)
+            if previous is not None:
+                self.size_bytes -= previous.nbytes
+            self._entries[(source, prefix)] = buffer
+            self.size_bytes += buffer.nbytes
+            self._evict()
+
+    def _evict(self):
+        while self._entries and self.size_bytes > self.budget_bytes:
+            _, buffer = self._entries.popitem(last=False)
+            self.size_bytes -= buffer.nbytes
+            self.evictions += 1
+
+    def resume_point(self, source: Hashable, plan) -> Tuple[int, Optional[Any]]:
+        """Find the deepest cached prefix of plan for source.
+
+        Returns ``(start, buffer)``: the index of the first stage still to
+        run and the buffer to feed it, or ``(0, None)`` when not even the
+        decoded input is cached.
+        """
+        prefixes = plan.prefixes
+        for i in range(len(prefixes) - 1, -1, -1):
+            buffer = self.get(source, prefixes[i])
+            if buffer is not None:
+                self.hits += 1
+                return i + 1, buffer
+        buffer = self.get(source, SOURCE_PREFIX)
+        if buffer is not None:
+            self.hits += 1
+            return 0, buffer
+        self.misses += 1
+        return 0, None
+
+    def discard(self, image_id: str = None):
+        """Drop buffers of one image (sources keyed by image id first) or all"""
+        with self._lock:
+            if image_id is None:
+                self._entries.clear()
+                self.size_bytes = 0
+                return
+            for key in [key for key in self._entries if key[0][0] == image_id]:
+                self.size_bytes -= self._entries.pop(key).nbytes
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'size_bytes': self.size_bytes,
+                'budget_bytes': self.budget_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions
+            }
+
+
+stage_cache = StageBufferCache()
@@ -0,0 +1,104 @@
+import os
+import json
+import argparse
+from typing import Dict
+
+from models.project_index import DATA_DIR
+from models.image import Image
+from models.manifest import ProjectManifest
+from models.persistence import json_store, write_json_atomic
+from models.sqlite_store import SQLiteStore
+
+
+def import_json_tree(store: SQLiteStore, data_dir: str = DATA_DIR) -> Dict[str, int]:
+    """Copy projects and images from the JSON file layout into the SQLite store"""
+    counts = {'projects': 0, 'images': 0}
+    if not os.path.exists(data_dir):
+        return counts
+    json_store.flush()
+
+    for folder_name in sorted(os.listdir(data_dir)):
+        project_folder = os.path.join(data_dir, folder_name)
+        metadata_file = os.path.join(project_folder, 'metadata.json')
+        if not folder_name.startswith('project_') or not os.path.exists(metadata_file):
+            continue
+
+        try:
+            counts['images'] += import_project_folder(store, project_folder)
+            counts['projects'] += 1
+        except Exception as e:
+            print(f"Error importing project {folder_name}: {e}")
+
+    return counts
+
+
+def import_project_folder(store: SQLiteStore, project_folder: str) -> int:
+    """Copy one project folder (metadata.json + annotations/) into the SQLite store"""
+    with open(os.path.join(project_folder, 'metadata.json'), 'r', encoding='utf-8') as f:
+        metadata = json.load(f)
+    store.save_project(metadata, os.path.basename(project_folder))
+
+    imported = 0
+    annotations_folder = os.path.join(project_folder, 'annotations')
+    if os.path.exists(annotations_folder):
+        for filename in os.listdir(annotations_folder):
+            if not filename.endswith('.json'):
+                continue
+            image = Image.load_from_file(os.path.join(annotations_folder, filename), project_folder)
+            if image:
+                store.save_image(image.to_record(), image.to_summary())
+                imported += 1
+    return imported
+
+
+def export_json_tree(store: SQLiteStore, data_dir: str = DATA_DIR) -> Dict[str, int]:
+    """Write projects and images from the SQLite store back to the JSON file layout"""
+    counts = {'projects': 0, 'images': 0}
+    folders = store.project_folders()
+
+    for metadata in store.load_projects():
+        project_id = metadata['id']
+        project_folder = os.path.join(data_dir, folders[project_id])
+        annotations_folder = os.path.join(project_folder, 'annotations')
+        os.makedirs(annotations_folder, exist_ok=True)
+
+        write_json_atomic(os.path.join(project_folder, 'metadata.json'), metadata)
+        counts['projects'] += 1
+
+        for summary in store.image_summaries(project_id):
+            record = store.load_image(project_id, summary['id'])
+            if record is None:
+                continue
+            write_json_atomic(os.path.join(annotations_folder, f"{record['id']}.json"), record)
+            counts['images'] += 1
+
+        ProjectManifest(project_folder).rebuild()
+    json_store.flush()
+
+    # Folder index is rebuilt from the exported metadata on next startup
+    index_file = os.path.join(data_dir, 'projects_index.json')
+    if os.path.exists(index_file):
+        os.remove(index_file)
+
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Migrate project data between JSON files and SQLite')
+    parser.add_argument('direction', choices=['import', 'export'],
+                        help='import: JSON files -> SQLite, export: SQLite -> JSON files')
+    parser.add_argument('--db', default=os.environ.get('SQLITE_PATH', os.path.join(DATA_DIR, 'musnad.db')),
+                        help='SQLite database path')
+    parser.add_argument('--data-dir', default=DATA_DIR, help='Projects data directory')
+    args = parser.parse_args()
+
+    store = SQLiteStore(args.db)
+    if args.direction == 'import':
+        counts = import_json_tree(store, args.data_dir)
+    else:
+        counts = export_json_tree(store, args.data_dir)
+    print(f"{args.direction}: {counts['projects']} projects, {counts['images']} images")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,15 +1,183 @@
 import os
 import json
-from typing import Dict, Any, List
+import atexit
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Any, List, Optional, Tuple
 
+import numpy as np
 from PIL import Image as PILImage
 
+from services.annotation_columns import AnnotationColumns, LabelDictionary, TYPES, extents_iou
+
+DUPLICATE_IOU = 0.95
+NEAR_DUPLICATE_IOU = 0.7
+LABEL_CONFLICT_IOU = 0.7
+# Below this many annotations the project is checked in-process
+POOL_MIN_ANNOTATIONS = 5000
+# Rows of the IoU matrix computed at once (bounds memory to BLOCK_ROWS x N)
+BLOCK_ROWS = 256
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_workers: Optional[int] = None
+_pool_lock = threading.Lock()
+
+
+def _geometry_only(annotation: Dict[str, Any]) -> Dict[str, Any]:
+    keys = ('id', 'type', 'label', 'level', 'bbox', 'points', 'confidence')
+    return {key: annotation[key] for key in keys if key in annotation}
+
+
+def check_thresholds(thresholds: Dict[str, float]) -> Dict[str, float]:
+    """Reject thresholds whose order would silently hide findings"""
+    if any(not 0 < thresholds[key] <= 1 for key in ('duplicate_iou', 'near_duplicate_iou', 'label_conflict_iou')):
+        raise ValueError('IoU thresholds must be in (0, 1]')
+    if thresholds['duplicate_iou'] < thresholds['near_duplicate_iou']:
+        raise ValueError('duplicate_iou must not be lower than near_duplicate_iou')
+    return thresholds
+
+
+def parse_max_workers(value: Any) -> Optional[int]:
+    """Read the ``max_workers`` option: None, or a positive integer"""
+    if value is None:
+        return None
+    try:
+        if isinstance(value, bool) or (isinstance(value, float) and not value.is_integer()):
+            raise ValueError
+        workers = int(value)
+    except (TypeError, ValueError):
+        raise ValueError('max_workers must be an integer')
+    if workers < 1:
+        raise ValueError('max_workers must be positive')
+    return workers
+
+
+def find_overlaps(image_id: str, annotations: List[Dict[str, Any]],
+                  thresholds: Dict[str, float]) -> List[Dict[str, Any]]:
+    """Flag duplicate, near-duplicate and label-conflicting box pairs of one image.
+
+    IoU is computed with NumPy in blocks of BLOCK_ROWS rows against the
+    boxes after them, so memory stays linear in the number of boxes.
+    """
+    columns = AnnotationColumns(annotations, LabelDictionary())
+    mask = columns.mask() & (columns.types != TYPES.index('missing_region'))
+    positions = np.flatnonzero(mask)
+    if len(positions) < 2:
+        return []
+
+    extents = columns.extents(mask)
+    labels = columns.label_ids[positions]
+    floor = min(thresholds.values())
+
+    findings = []
+    for start in range(0, len(positions) - 1, BLOCK_ROWS):
+        stop = min(start + BLOCK_ROWS, len(positions))
+        iou = extents_iou(extents[start:stop], extents[start:])
+        # الإبقاء على الأزواج فوق القطر فقط (j > i)
+        rows, cols = np.nonzero(np.triu(iou >= floor, k=1))
+        for row, col in zip(rows.tolist(), cols.tolist()):
+            i, j = start + row, start + col
+            value = float(iou[row, col])
+            same_label = labels[i] == labels[j]
+            if same_label and value >= thresholds['duplicate_iou']:
+                kind = 'duplicate'
+            elif same_label and value >= thresholds['near_duplicate_iou']:
+                kind = 'near_duplicate'
+            elif not same_label and value >= thresholds['label_conflict_iou']:
+                kind = 'label_conflict'
+            else:
+                continue
+            a = annotations[positions[i]]
+            b = annotations[positions[j]]
+            findings.append({
+                'image_id': image_id,
+                'kind': kind,
+                'iou': round(value, 4),
+                'annotation_ids': [a.get('id'), b.get('id')],
+                'labels': [a.get('label'), b.get('label')]
+            })
+    return findings
+
+
+def _find_overlaps_task(task: Tuple[str, List[Dict[str, Any]], Dict[str, float]]) -> List[Dict[str, Any]]:
+    return find_overlaps(*task)
+
+
+def _get_pool(max_workers: Optional[int]) -> ProcessPoolExecutor:
+    """Long-lived worker pool shared by all overlap checks"""
+    global _pool, _pool_workers
+    with _pool_lock:
+        if _pool is None or _pool_workers != max_workers:
+            if _pool is not None:
+                _pool.shutdown(wait=False)
+            _pool = ProcessPoolExecutor(max_workers=max_workers)
+            _pool_workers = max_workers
+        return _pool
+
+
+def _reset_pool():
+    global _pool, _pool_workers
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False)
+        _pool = None
+        _pool_workers = None
+
+
+atexit.register(_reset_pool)
+
+
+def duplicates_to_remove(annotations: List[Dict[str, Any]], findings: List[Dict[str, Any]]) -> List[str]:
+    """IDs to delete so each group of duplicates keeps one annotation.
+
+    Duplicates are grouped transitively; the most confident annotation of
+    a group (the earliest one on ties) is kept.
+    """
+    parent: Dict[str, str] = {}
+
+    def root(annotation_id):
+        while parent.get(annotation_id, annotation_id) != annotation_id:
+            annotation_id = parent[annotation_id]
+        return annotation_id
+
+    members = set()
+    for finding in findings:
+        if finding['kind'] == 'duplicate':
+            members.update(finding['annotation_ids'])
+            a, b = (root(annotation_id) for annotation_id in finding['annotation_ids'])
+            if a != b:
+                parent[b] = a
+
+    groups: Dict[str, List[Tuple[int, Dict[str, Any]]]] = {}
+    for position, annotation in enumerate(annotations):
+        if annotation.get('id') in members:
+            groups.setdefault(root(annotation['id']), []).append((position, annotation))
+
+    remove = []
+    for members in groups.values():
+        keep = max(members, key=lambda item: (item[1].get('confidence') or 0, -item[0]))
+        remove.extend(annotation.get('id') for _, annotation in members if annotation is not keep[1])
+    return remove
+
 
 class DatasetValidator:
     def __init__(self):
         pass
 
-    def validate_project(self, project_folder: str) -> Dict[str, Any]:
+    @staticmethod
+    def _check_record(data: Dict[str, Any]):
+        # required keys
+        for k in ['id', 'project_id', 'filename', 'status']:
+            if k not in data:
+                raise ValueError(f'missing key {k}')
+
+    def validate_project(self, project_folder: str,
+                         records: Optional[List[Dict[str, Any]]] = None) -> Dict[str, Any]:
+        """Check image files and annotation records of a project.
+
+        ``records`` are image records loaded from the store (SQLite
+        backend); without them the annotation files are read.
+        """
         report: Dict[str, Any] = {
             'original_images_exist': True,
             'processed_images_exist': True,
@@ -30,7 +198,6 @@ class DatasetValidator:
 
         originals = {f for f in os.listdir(orig) if f.lower().endswith(('.jpg', '.jpeg', '.png', '.tif', '.tiff', '.bmp', '.webp')) and not f.endswith('_thumb.jpg')}
         processed = {f for f in os.listdir(proc) if f.lower().endswith(('.jpg', '.jpeg', '.png'))}
-        annotations = {f for f in os.listdir(ann) if f.lower().endswith('.json')}
 
         # Existence
         report['original_images_exist'] = len(originals) > 0
@@ -46,21 +213,74 @@ class DatasetValidator:
                 report['missing_original'].append(f)
 
         # Annotations structure
-        for a in annotations:
-            path = os.path.join(ann, a)
-            try:
-                with open(path, 'r', encoding='utf-8') as fp:
-                    data = json.load(fp)
-                # required keys
-                for k in ['id', 'project_id', 'filename', 'status']:
-                    if k not in data:
-                        raise ValueError(f'missing key {k}')
-            except Exception as e:
-                report['bad_annotations'].append({'file': a, 'error': str(e)})
+        if records is None:
+            annotations = [f for f in os.listdir(ann) if f.lower().endswith('.json')]
+            for a in annotations:
+                path = os.path.join(ann, a)
+                try:
+                    with open(path, 'r', encoding='utf-8') as fp:
+                        data = json.load(fp)
+                    self._check_record(data)
+                except Exception as e:
+                    report['bad_annotations'].append({'file': a, 'error': str(e)})
+            annotations_count = len(annotations)
+        else:
+            for data in records:
+                try:
+                    self._check_record(data)
+                except Exception as e:
+                    report['bad_annotations'].append({'file': f"{data.get('id')}.json", 'error': str(e)})
+            annotations_count = len(records)
 
         report['summary'] = {
             'original_count': len(originals),
             'processed_count': len(processed),
-            'annotations_count': len(annotations)
+            'annotations_count': annotations_count
         }
         return report
+
+    def find_overlapping_boxes(self, images, thresholds: Optional[Dict[str, float]] = None,
+                               max_workers: Optional[int] = None) -> Dict[str, Any]:
+        """Pairwise-IoU QA pass over every image of a project.
+
+        Large projects are split across a shared process pool, one image
+        per task; smaller ones are checked in-process.
+        """
+        thresholds = check_thresholds({
+            'duplicate_iou': DUPLICATE_IOU,
+            'near_duplicate_iou': NEAR_DUPLICATE_IOU,
+            'label_conflict_iou': LABEL_CONFLICT_IOU,
+            **(thresholds or {})
+        })
+        tasks = [
+            (image.id, [_geometry_only(annotation) for annotation in image.annotations], thresholds)
+            for image in images if len(image.annotations) > 1
+        ]
+
+        findings: List[Dict[str, Any]] = []
+        total = sum(len(task[1]) for task in tasks)
+        pooled = False
+        if total >= POOL_MIN_ANNOTATIONS and len(tasks) > 1 and max_workers != 1:
+            try:
+                pool = _get_pool(max_workers)
+                for result in pool.map(_find_overlaps_task, tasks, chunksize=max(1, len(tasks) // 64)):
+                    findings.extend(result)
+                pooled = True
+            except Exception as e:
+                print(f"Process pool unavailable, checking overlaps in-process: {e}")
+                _reset_pool()
+                findings = []
+        if not pooled:
+            for task in tasks:
+                findings.extend(_find_overlaps_task(task))
+
+        summary = {'duplicate': 0, 'near_duplicate': 0, 'label_conflict': 0}
+        for finding in findings:
+            summary[finding['kind']] += 1
+        return {
+            'thresholds': thresholds,
+            'images_checked': len(images),
+            'annotations_checked': total,
+            'findings': findings,
+            'summary': summary
+        }
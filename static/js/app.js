@@ -1379,16 +1379,26 @@ class MusnadOCRApp {
             const response = await fetch(`${this.apiBase}/annotations/${this.currentProject.id}/${this.currentImage.id}/save`, {
                 method: 'POST',
                 headers: { 'Content-Type': 'application/json' },
-                body: JSON.stringify({ annotations })
+                body: JSON.stringify({
+                    annotations,
+                    base_version: this.currentImage.annotations_version
+                })
             });
             
             const data = await response.json();
             
             if (response.ok) {
-                this.showNotification('تم حفظ التوسيمات', 'success');
                 // Update local data
                 this.currentImage = data.image;
-                await this.updateProjectStatistics();
+                if (data.changed) {
+                    this.showNotification('تم حفظ التوسيمات', 'success');
+                    await this.updateProjectStatistics();
+                }
+            } else if (response.status === 409) {
+                // Someone else saved this image meanwhile; reload their version
+                this.showNotification('تم تعديل التوسيمات من مستخدم آخر، تم تحميل النسخة الأحدث', 'warning');
+                this.currentImage.annotations_version = data.current_version;
+                await this.canvasHandler.loadImageAnnotations();
             } else {
                 throw new Error(data.error || 'Failed to save annotations');
             }
@@ -0,0 +1,28 @@
+import pytest
+
+from models.persistence import json_store
+from models.project_index import project_index, DATA_DIR
+from models.sqlite_store import configure_store
+
+
+@pytest.fixture
+def data_dir(tmp_path, monkeypatch):
+    """Run against an empty data/ folder in a temporary working directory"""
+    monkeypatch.chdir(tmp_path)
+    project_index._folders = None
+    project_index._file_mtime = None
+    yield tmp_path
+    try:
+        json_store.flush()
+    finally:
+        json_store.discard(DATA_DIR)
+    project_index._folders = None
+    project_index._file_mtime = None
+
+
+@pytest.fixture
+def sqlite_store(data_dir):
+    """Switch to the SQLite backend for one test"""
+    store = configure_store('sqlite', str(data_dir / 'store.db'))
+    yield store
+    configure_store('json', None)
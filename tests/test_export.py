@@ -0,0 +1,50 @@
+import zipfile
+
+from models.image import Image
+from models.project import Project
+from services.export_service import ExportService
+
+ANNOTATIONS = [
+    {'id': 'a', 'type': 'bbox', 'label': ' alif ', 'bbox': {'x': 123.457, 'y': 98.7651, 'width': 41.3337, 'height': 77.0003}},
+    {'id': 'b', 'type': 'bbox', 'label': 'ba', 'bbox': {'x': 1000.1, 'y': 700.3, 'width': 0.7, 'height': 19.9}},
+    # bbox بدون مفتاح bbox لا يُصدّر
+    {'id': 'c', 'type': 'bbox', 'label': 'ba', 'points': [[1, 1], [20, 1], [20, 20]]},
+    {'id': 'd', 'type': 'polygon', 'label': 'ba', 'points': [[1, 1], [20, 1], [20, 20]]},
+    {'id': 'e', 'type': 'bbox', 'label': '  ', 'bbox': {'x': 5, 'y': 5, 'width': 5, 'height': 5}},
+]
+
+
+def expected_line(class_id, b, scale, pad_x, pad_y, size):
+    """One label line as the per-box exporter wrote it"""
+    x = b['x'] * scale + pad_x
+    y = b['y'] * scale + pad_y
+    w = b['width'] * scale
+    h = b['height'] * scale
+    values = [(x + w / 2) / size, (y + h / 2) / size, w / size, h / size]
+    values = [max(0, min(1, value)) for value in values]
+    return f"{class_id} " + ' '.join(f"{value:.6f}" for value in values)
+
+
+def test_yolo_labels_match_per_box_export(data_dir):
+    project = Project('export')
+    project.save()
+    image = Image(project.id, 'page.jpg')
+    image.width = 1237
+    image.height = 911
+    image.status = 'annotated'
+    image.save()
+    image.replace_annotations(ANNOTATIONS)
+
+    zip_path = ExportService().export_yolo(project, {
+        'include_images': False, 'split_ratio': {'train': 1, 'val': 0, 'test': 0}, 'resize_to': 640
+    })
+
+    scale = min(640 / 1237, 640 / 911)
+    pad_x = (640 - int(round(1237 * scale))) // 2
+    pad_y = (640 - int(round(911 * scale))) // 2
+    with zipfile.ZipFile(zip_path) as archive:
+        lines = archive.read('labels/train/page.txt').decode('utf-8').splitlines()
+    assert lines == [
+        expected_line(0, ANNOTATIONS[0]['bbox'], scale, pad_x, pad_y, 640),
+        expected_line(1, ANNOTATIONS[1]['bbox'], scale, pad_x, pad_y, 640),
+    ]
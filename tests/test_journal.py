@@ -0,0 +1,41 @@
+import os
+
+import pytest
+
+from models import persistence
+from models.image import Image
+from models.journal import annotation_journal, journal_path
+from models.persistence import json_store
+from models.project import Project
+
+
+def test_failed_compaction_keeps_journal(data_dir, monkeypatch):
+    project = Project('journal')
+    project.save()
+    image = Image(project.id, 'page.jpg')
+    image.save()
+    json_store.flush()
+    for x in range(3):
+        image.add_annotation({'type': 'bbox', 'label': 'a', 'bbox': {'x': x * 10, 'y': 0, 'width': 5, 'height': 5}})
+    json_store.flush()
+    log_file = journal_path(image.annotations_file)
+    assert os.path.exists(log_file)
+
+    def fail(path, payload, fsync=True):
+        raise OSError('disk full')
+
+    write_file_atomic = persistence.write_file_atomic
+    monkeypatch.setattr(persistence, 'write_file_atomic', fail)
+    with pytest.raises(OSError):
+        annotation_journal.compact(image.annotations_file)
+    assert os.path.exists(log_file)
+
+    # الكتابة المعلقة تضيع كما في توقف مفاجئ؛ السجل وحده يحفظ العمليات
+    monkeypatch.setattr(persistence, 'write_file_atomic', write_file_atomic)
+    json_store.discard(image.annotations_file)
+    annotation_journal.forget(image.annotations_file)
+    assert len(Image.load(project.id, image.id).annotations) == 3
+
+    annotation_journal.compact(image.annotations_file)
+    assert not os.path.exists(log_file)
+    assert len(Image.load(project.id, image.id).annotations) == 3
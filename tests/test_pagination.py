@@ -0,0 +1,69 @@
+import random
+
+import pytest
+
+from models.image import Image
+from models.project import Project
+from services.pagination import SORT_FIELDS, paginate_images
+
+
+def make_project(count=23):
+    project = Project('pages')
+    project.save()
+    random.seed(3)
+    for i in range(count):
+        image = Image(project.id, f'page_{random.randint(0, 5)}.jpg')
+        image.created_at = f'2024-01-{random.randint(1, 9):02d}'
+        image.file_size = random.choice([0, 10, 20])
+        image.status = random.choice(['unprocessed', 'processed', 'annotated'])
+        image.save()
+    return project
+
+
+def all_pages(manifest, args, statuses=None):
+    ids, cursor = [], None
+    while True:
+        page = paginate_images(manifest, {**args, 'limit': '4', **({'cursor': cursor} if cursor else {})}, statuses)
+        ids += [image['id'] for image in page['images']]
+        cursor = page['next_cursor']
+        if not cursor:
+            return ids, page['filtered_count']
+
+
+def expected(rows, sort, descending, statuses=None):
+    default = 0 if sort in ('file_size', 'annotations_count') else ''
+    rows = [row for row in rows if statuses is None or row['status'] in statuses]
+    rows.sort(key=lambda row: (row.get(sort) or default, row['id']), reverse=descending)
+    return [row['id'] for row in rows]
+
+
+@pytest.mark.parametrize('sort', SORT_FIELDS)
+@pytest.mark.parametrize('order', ['asc', 'desc'])
+def test_pages_match_full_sort(data_dir, sort, order):
+    project = make_project()
+    manifest = Image.get_manifest(project.id)
+    rows = manifest.ordered_rows()
+    for statuses in (None, ['processed'], ['processed', 'annotated']):
+        ids, count = all_pages(manifest, {'sort': sort, 'order': order}, statuses)
+        assert ids == expected(rows, sort, order == 'desc', statuses)
+        assert count == len(ids)
+
+
+def test_sort_order_is_cached_until_change(data_dir):
+    project = make_project(5)
+    manifest = Image.get_manifest(project.id)
+    keys = manifest.sort_keys('filename')
+    assert manifest.sort_keys('filename') is keys
+
+    image = Image(project.id, 'new.jpg')
+    image.save()
+    assert (image.filename, image.id) in manifest.sort_keys('filename')
+
+
+def test_sqlite_pages_match(sqlite_store):
+    project = make_project()
+    manifest = Image.get_manifest(project.id)
+    rows = manifest.ordered_rows()
+    for sort in ('created_at', 'file_size'):
+        ids, _ = all_pages(manifest, {'sort': sort, 'order': 'desc'}, ['processed', 'annotated'])
+        assert ids == expected(rows, sort, True, ['processed', 'annotated'])
@@ -0,0 +1,51 @@
+import json
+
+import pytest
+
+from models import persistence
+from models.persistence import JsonStore
+
+
+def failing_writes(monkeypatch, error=OSError('disk full')):
+    """Make write_file_atomic fail until the returned callable is invoked"""
+    original = persistence.write_file_atomic
+
+    def fail(path, payload, fsync=True):
+        raise error
+
+    monkeypatch.setattr(persistence, 'write_file_atomic', fail)
+    return lambda: monkeypatch.setattr(persistence, 'write_file_atomic', original)
+
+
+def test_flush_raises_and_keeps_failed_write(tmp_path, monkeypatch):
+    store = JsonStore(delay=60)
+    path = str(tmp_path / 'doc.json')
+    store.write(path, {'value': 1})
+
+    restore = failing_writes(monkeypatch)
+    with pytest.raises(OSError):
+        store.flush(path)
+    assert store.is_pending(path)
+    assert store.read(path) == {'value': 1}
+    assert store.stats()['failed'] == 1
+
+    restore()
+    store.flush(path)
+    with open(path, encoding='utf-8') as f:
+        assert json.load(f) == {'value': 1}
+    assert store.stats()['failed'] == 0
+
+
+def test_failed_write_does_not_replace_newer_payload(tmp_path, monkeypatch):
+    store = JsonStore(delay=60)
+    path = str(tmp_path / 'doc.json')
+    store.write(path, {'value': 1})
+    restore = failing_writes(monkeypatch)
+    with pytest.raises(OSError):
+        store.flush(path)
+
+    store.write(path, {'value': 2})
+    restore()
+    store.flush(path)
+    with open(path, encoding='utf-8') as f:
+        assert json.load(f) == {'value': 2}
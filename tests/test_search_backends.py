@@ -0,0 +1,71 @@
+import pytest
+
+from models.image import Image
+from models.project import Project
+from models.sqlite_store import configure_store
+from services.search_index import AnnotationSearchIndex, search_store
+
+ANNOTATIONS = [
+    {'id': 'a0', 'type': 'bbox', 'label': 'alif', 'level': 'char', 'confidence': 95,
+     'bbox': {'x': 1, 'y': 1, 'width': 5, 'height': 5}},
+    # بدون تسمية: لا تطابق البحث عن 'unlabeled'
+    {'id': 'a1', 'type': 'bbox', 'level': 'char', 'confidence': '72.5',
+     'bbox': {'x': 10, 'y': 1, 'width': 5, 'height': 5}},
+    {'id': 'a2', 'type': 'bbox', 'label': ' ba ', 'level': 'word', 'confidence': 'high',
+     'bbox': {'x': 20, 'y': 1, 'width': 5, 'height': 5}},
+    {'id': 'a3', 'type': 'polygon', 'label': 'alif', 'reason': 'damaged', 'confidence': 40.0,
+     'points': [[1, 20], [6, 20], [6, 25]]},
+]
+
+QUERIES = [
+    ({'label': ['alif']}, None, None),
+    ({'label': ['unlabeled']}, None, None),
+    ({'label': ['ba']}, None, None),
+    ({'level': ['char'], 'label': ['alif']}, None, None),
+    ({'reason': ['damaged']}, None, None),
+    ({}, 70, None),
+    ({}, None, 80),
+    ({'level': ['char']}, 50, 100),
+]
+
+
+def search_json(project, filters, min_confidence, max_confidence):
+    rows = Image.list_summaries(project.id)
+    index = AnnotationSearchIndex.for_folder(project.project_folder)
+    index.refresh(project.id, rows)
+    return index.search(rows, filters, min_confidence, max_confidence)
+
+
+def annotated_project(name):
+    project = Project(name)
+    project.save()
+    image = Image(project.id, 'page.jpg')
+    image.width = 100
+    image.height = 100
+    image.save()
+    image.replace_annotations(ANNOTATIONS)
+    return project
+
+
+@pytest.mark.parametrize('filters, min_confidence, max_confidence', QUERIES)
+def test_same_query_matches_same_annotations(data_dir, filters, min_confidence, max_confidence):
+    project = annotated_project('json')
+    found = search_json(project, filters, min_confidence, max_confidence)
+
+    store = configure_store('sqlite', str(data_dir / 'store.db'))
+    try:
+        project = annotated_project('sqlite')
+        result = search_store(store, project.id, filters, min_confidence, max_confidence)
+    finally:
+        configure_store('json', None)
+
+    assert [hit['annotation_id'] for hit in result['hits']] == [hit['annotation_id'] for hit in found['hits']]
+    assert result['total_count'] == found['total_count']
+
+
+def test_search_semantics(data_dir):
+    project = annotated_project('json')
+    # أرقام نصية تُقبل، ونصوص غير رقمية تُستبعد من فلتر الثقة
+    assert search_json(project, {}, 70, None)['total_count'] == 2
+    assert search_json(project, {'label': ['unlabeled']}, None, None)['total_count'] == 0
+    assert search_json(project, {'label': ['ba']}, None, None)['total_count'] == 1
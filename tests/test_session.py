@@ -0,0 +1,63 @@
+import os
+
+import pytest
+
+from models import persistence
+from models.image import Image
+from models.persistence import json_store
+from models.project import Project
+from models.session import begin_unit_of_work, end_unit_of_work
+
+
+def recording_writes(monkeypatch, fail_on=None):
+    """Record write order; raise for paths ending with fail_on"""
+    write_file_atomic = persistence.write_file_atomic
+    written = []
+
+    def write(path, payload, fsync=True):
+        if fail_on is not None and path.endswith(fail_on):
+            raise OSError('disk full')
+        written.append(os.path.basename(path))
+        return write_file_atomic(path, payload, fsync)
+
+    monkeypatch.setattr(persistence, 'write_file_atomic', write)
+    return written
+
+
+def new_project():
+    project = Project('uow')
+    project.save()
+    Image.get_manifest(project.id)
+    json_store.flush()
+    return project
+
+
+def test_commit_writes_records_before_summaries(data_dir, monkeypatch):
+    project = new_project()
+    written = recording_writes(monkeypatch)
+
+    begin_unit_of_work()
+    image = Image(project.id, 'page.jpg')
+    image.save()
+    Project.load(project.id).save()
+    end_unit_of_work(commit=True)
+
+    assert not json_store.is_pending(image.annotations_file)
+    assert written.index(f'{image.id}.json') < written.index('manifest.json') < written.index('metadata.json')
+
+
+def test_failed_commit_raises_and_drops_queued_writes(data_dir, monkeypatch):
+    project = new_project()
+    recording_writes(monkeypatch, fail_on='manifest.json')
+
+    begin_unit_of_work()
+    image = Image(project.id, 'page.jpg')
+    image.save()
+    with pytest.raises(OSError):
+        end_unit_of_work(commit=True)
+
+    # السجل كُتب أولاً؛ صف الملخص لم يُكتب ولم يبق معلقاً
+    assert os.path.exists(image.annotations_file)
+    manifest = Image.get_manifest(project.id)
+    assert not json_store.is_pending(manifest.manifest_file)
+    assert manifest.get(image.id) is None
@@ -0,0 +1,32 @@
+from models.image import Image
+from models.project import Project
+from models.session import begin_unit_of_work, end_unit_of_work
+from services.spatial_index import spatial_indexes
+
+
+def box(annotation_id, x):
+    return {'id': annotation_id, 'type': 'bbox', 'label': 'a',
+            'bbox': {'x': x, 'y': 0, 'width': 5, 'height': 5}}
+
+
+def query_ids(image):
+    return spatial_indexes.run(image, lambda index: index.query((0, 0, 100, 100)))
+
+
+def test_replaced_and_rolled_back_annotations_are_not_served_from_cache(data_dir):
+    project = Project('spatial')
+    project.save()
+    image = Image(project.id, 'page.jpg')
+    image.save()
+    image.replace_annotations([box('a', 0)])
+    assert query_ids(Image.load(project.id, image.id)) == ['a']
+
+    # التعديل يُطبق على الفهرس المخزن ثم يُلغى
+    begin_unit_of_work()
+    Image.load(project.id, image.id).add_annotation(box('discarded', 20))
+    end_unit_of_work(commit=False)
+
+    # الاستبدال يعيد الإصدار نفسه الذي وصل إليه الفهرس المخزن
+    image = Image.load(project.id, image.id)
+    image.replace_annotations([box('b', 40)])
+    assert query_ids(image) == ['b']
@@ -0,0 +1,47 @@
+from models.image import Image
+from models.project import Project
+
+
+def make_image(project_id):
+    image = Image(project_id, 'page.jpg')
+    image.width = 100
+    image.height = 100
+    image.save()
+    return image
+
+
+def test_annotation_edits_update_summary(sqlite_store):
+    project = Project('sqlite')
+    project.save()
+    image = make_image(project.id)
+
+    image.add_annotation({'type': 'bbox', 'label': 'a', 'level': 'word',
+                          'bbox': {'x': 1, 'y': 1, 'width': 5, 'height': 5}})
+    image.add_annotation({'type': 'bbox', 'label': 'b', 'level': 'word',
+                          'bbox': {'x': 10, 'y': 1, 'width': 5, 'height': 5}})
+    first, second = image.annotations
+    image.update_annotation(first['id'], {'label': 'c'})
+    image.delete_annotation(second['id'])
+
+    loaded = Image.load(project.id, image.id)
+    assert [annotation['label'] for annotation in loaded.annotations] == ['c']
+    row = Image.get_manifest(project.id).get(image.id)
+    assert row['annotations_count'] == 1
+    assert row['annotation_labels'] == {'c': 1}
+    assert row['annotations_version'] == loaded.annotations_version
+
+
+def test_project_folder_comes_from_the_store(sqlite_store, data_dir):
+    project = Project('sqlite')
+    project.save()
+    folder = project.project_folder
+    image = make_image(project.id)
+
+    # فهرس JSON ليس مرجع المجلد على SQLite
+    assert not (data_dir / 'data' / 'projects_index.json').exists()
+    project.name = 'renamed'
+    project.save()
+
+    loaded = Project.load(project.id)
+    assert loaded.project_folder == folder
+    assert Image.load(project.id, image.id).original_image_path.startswith(folder)
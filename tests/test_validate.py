@@ -0,0 +1,30 @@
+import pytest
+
+from models.image import Image
+from models.project import Project
+from services.validate import DatasetValidator, parse_max_workers
+
+
+@pytest.mark.parametrize('value, expected', [(None, None), (4, 4), ('2', 2), (3.0, 3)])
+def test_parse_max_workers(value, expected):
+    assert parse_max_workers(value) == expected
+
+
+@pytest.mark.parametrize('value', ['abc', 2.5, 0, -1, True, [2]])
+def test_parse_max_workers_rejects_invalid_values(value):
+    with pytest.raises(ValueError):
+        parse_max_workers(value)
+
+
+def test_validate_store_records(sqlite_store):
+    project = Project('validate')
+    project.save()
+    image = Image(project.id, 'page.jpg')
+    image.save()
+
+    records = [image.to_record() for image in Image.load_all_for_project(project.id)]
+    records.append({'id': 'broken', 'project_id': project.id, 'status': 'uploaded'})
+    report = DatasetValidator().validate_project(project.project_folder, records)
+
+    assert report['summary']['annotations_count'] == 2
+    assert report['bad_annotations'] == [{'file': 'broken.json', 'error': 'missing key filename'}]